@@ -0,0 +1,174 @@
+"""!
+    @file                       control_loop.py
+    @brief                      Runs a motor's controller from a timer interrupt
+    @details                    In the cooperative scheduler a motor task only runs when the scheduler gets to it, so
+                                the camera task's bus transfers and the printing in every task delay the motor loops
+                                by varying amounts. A @c ControlLoop instead runs encoder read, controller and motor
+                                output from a timer interrupt at a fixed rate, 1 kHz by default, and the tasks only
+                                pass it setpoints through shares. Code run from an interrupt must not allocate memory,
+                                and floating point numbers are allocated on the heap, so the loop works in integers:
+                                positions in encoder counts, outputs in PWM timer counts and the gains of the motor's
+                                @c MotorController converted to fixed point when the loop is made.
+
+    @date                       October 18, 2026
+"""
+
+import micropython
+import utime
+from array import array
+import task_share
+
+# Fractional bits of the fixed-point gains. The proportional and derivative gains are kept with 8 bits, the
+# feedforward gain with 12 and the integral gain, which is tiny per run, with 16; the speed is kept with 4.
+_P_BITS = micropython.const(8)
+_I_BITS = micropython.const(16)
+_D_BITS = micropython.const(12)
+_FF_BITS = micropython.const(12)
+_VEL_BITS = micropython.const(4)
+
+## The largest value kept in the timing statistics, below MicroPython's small integer limit
+_BIG = micropython.const(0x3FFFFFFF)
+
+
+class ControlLoop:
+    """!
+        @brief                  A motor's controller, run from the interrupt of its encoder sampler's timer
+        @details                The loop takes over the timer of the motor's @c EncoderSampler, so each run first
+                                takes the encoder sample, then works out the output as the motor's
+                                @c MotorController would: proportional on the error, integral held while the output
+                                is clamped and limited to the controller's @c i_limit, derivative on the filtered
+                                speed and feedforward on the setpoint's rate, with the motor braked within the
+                                deadband. Each product is kept below MicroPython's small integer limit, so no
+                                integer grows onto the heap either: the error is clamped to a quarter of that limit
+                                over the proportional gain, and the integral to what reaches its limit.
+    """
+
+    def __init__(self, motor, freq=1000):
+        """!
+            @brief              Starts running a motor's controller from its sampler's timer
+            @param  motor       The @c motor_run.Motor to control, which must have been made with a @c sample_timer
+            @param  freq        How many times a second the loop runs
+        """
+        sampler = motor.sampler
+        if sampler is None:
+            raise ValueError("the motor has no encoder sampler to run the loop from")
+        controller = motor.controller
+        driver = motor.motor
+        self.sampler = sampler
+        self.driver = driver
+        self.freq = freq
+        full = driver.full_width
+        self._full = full
+        # duty cycle percent to timer counts
+        scale = full / 100
+        self._kp = round(controller.Kp * scale * (1 << _P_BITS))
+        self._ki = round(controller.Ki / freq * scale * (1 << _I_BITS))
+        self._kd = round(controller.Kd * freq * scale * (1 << (_D_BITS - _VEL_BITS)))
+        self._kff = round(controller.Kff * scale * (1 << _FF_BITS))
+        self._deadband = int(controller.deadband)
+        # the error is clamped so that the proportional term stays well inside the small integer range, which is
+        # still far beyond what saturates the output
+        self._e_limit = (_BIG >> 2) // self._kp if self._kp else _BIG >> 2
+        i_limit = full if controller.i_limit is None else int(controller.i_limit * scale)
+        self._i_limit = (i_limit << _I_BITS) // self._ki if self._ki else 0
+        self._integral = 0
+        self._vel = 0
+        self._last_pos = sampler.position()
+
+        ## Where the motor should be, in encoder counts, and how fast that is moving, in counts per second, put
+        ## together by the motor's task; the interrupt never sees one changed without the other
+        self.target = task_share.SeqShare('l', 2, name='loop_target')
+        self.target.put((int(controller.set_point), 0))
+        # the target as last read whole, and room to read it into
+        self._setpoint = int(controller.set_point)
+        self._rate = 0
+        self._read = array('l', [0, 0])
+        ## True when the last run found the motor within the deadband and braked it
+        self.braking = False
+
+        ## How many times the loop has run since the statistics were reset
+        self.runs = 0
+        ## The shortest time between runs, in microseconds
+        self.period_min = _BIG
+        ## The longest time between runs, in microseconds
+        self.period_max = 0
+        self._last_us = None
+
+        # bind the callback once, since making a bound method in the interrupt would allocate
+        self._isr = self._run
+        sampler.stop()
+        sampler.timer.init(freq=freq)
+        sampler.timer.callback(self._isr)
+
+    @micropython.native
+    def _run(self, timer):
+        # the interrupt: sample, then integer PID
+        sampler = self.sampler
+        sampler._sample(timer)
+        position = sampler.positions[sampler.head]
+        now_us = sampler.times[sampler.head]
+        if self._last_us is not None:
+            period = utime.ticks_diff(now_us, self._last_us)
+            if period < self.period_min:
+                self.period_min = period
+            if period > self.period_max:
+                self.period_max = period
+            if self.runs < _BIG:
+                self.runs += 1
+        self._last_us = now_us
+
+        # speed in counts per run, low pass filtered over about four runs
+        self._vel += (((position - self._last_pos) << _VEL_BITS) - self._vel) >> 2
+        self._last_pos = position
+
+        # if the task was interrupted while changing the target, keep to the last one
+        if self.target.try_get(self._read) is not None:
+            self._setpoint = self._read[0]
+            self._rate = self._read[1]
+
+        driver = self.driver
+        error = self._setpoint - position
+        if -self._deadband < error < self._deadband:
+            self.braking = True
+            driver.CW.pulse_width(self._full)
+            driver.CCW.pulse_width(self._full)
+            return
+        self.braking = False
+        e_limit = self._e_limit
+        if error > e_limit:
+            error = e_limit
+        elif error < -e_limit:
+            error = -e_limit
+
+        full = self._full
+        output = ((self._kp * error) >> _P_BITS) + ((self._ki * self._integral) >> _I_BITS) \
+            - ((self._kd * self._vel) >> _D_BITS) + ((self._kff * self._rate) >> _FF_BITS)
+        # integrate unless that would push a clamped output further out
+        if self._ki and not ((output >= full and error > 0) or (output <= -full and error < 0)):
+            integral = self._integral + error
+            if integral > self._i_limit:
+                integral = self._i_limit
+            elif integral < -self._i_limit:
+                integral = -self._i_limit
+            self._integral = integral
+        if output > full:
+            output = full
+        elif output < -full:
+            output = -full
+        driver.set_pulse_width(output)
+
+    def reset_stats(self):
+        """!
+            @brief              Starts the timing statistics afresh
+        """
+        self.runs = 0
+        self.period_min = _BIG
+        self.period_max = 0
+        self._last_us = None
+
+    def stop(self):
+        """!
+            @brief              Stops the loop and the motor
+        """
+        self.sampler.timer.callback(None)
+        self.driver.set_pulse_width(0)
@@ -7,7 +7,8 @@ Tasks are created as generators, functions which have infinite loops and call
 @c yield at least once in the loop. References to all the tasks to be run
 in the system are kept in a list maintained by class @c CoTaskList; the 
 system scheduler then runs the tasks' @c run() methods according to a 
-chosen scheduling algorithm such as round-robin or highest-priority-first. 
+chosen scheduling algorithm such as round-robin, highest-priority-first or
+earliest-deadline-first.
 
 @author JR Ridgely
 @date   2017-Jan-01 JRR Approximate date of creation of file
@@ -31,6 +32,43 @@ SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 import gc                              # Memory allocation garbage collector
 import utime                           # Micropython version of time library
 import micropython                     # This shuts up incorrect warnings
+import pyb                             # For sleeping while there's nothing to do
+from array import array                # Preallocated histograms
+
+
+## Scheduling modes for @c TaskList.sched(): highest priority first,
+#  round-robin, or earliest deadline first
+PRIORITY = micropython.const(0)
+ROUND_ROBIN = micropython.const(1)
+EDF = micropython.const(2)
+
+## Overrun policies, for when a task is released a whole period or more late:
+#  run it back to back until it has caught up with the releases it missed,
+#  skip the missed releases and stay in phase, or start its period afresh
+#  from the late release
+CATCH_UP = micropython.const(0)
+SKIP = micropython.const(1)
+SHIFT = micropython.const(2)
+
+## The number of buckets in each task's run time and lateness histograms.
+#  Bucket @c n counts times from 2 to the @c n microseconds up to twice that;
+#  the last bucket counts everything from about half a second up
+HIST_BUCKETS = micropython.const(20)
+
+
+@micropython.native
+def _bucket(us):
+    """!
+    Find the histogram bucket for a time, which is the number of bits it
+    takes to write the time in binary, less one.
+    @param us A time in microseconds
+    @return The index of the bucket in which to count the time
+    """
+    bucket = 0
+    while us > 1 and bucket < HIST_BUCKETS - 1:
+        us >>= 1
+        bucket += 1
+    return bucket
 
 
 class Task:
@@ -70,7 +108,8 @@ class Task:
 
 
     def __init__(self, run_fun, name="NoName", priority=0, period=None,
-                 profile=False, trace=False, shares=()):
+                 profile=False, trace=False, shares=(), deadline=None,
+                 overrun=CATCH_UP):
         """!
         Initialize a task object so it may be run by the scheduler.
 
@@ -92,6 +131,11 @@ class Task:
                states. @b Note: This slows things down and allocates memory.
         @param shares A list or tuple of shares and queues used by this task.
                If no list is given, no shares are passed to the task
+        @param deadline The time in milliseconds after each release by which
+               a run of the task should have finished, or @c None (the
+               default) for it to be the task's period
+        @param overrun What to do when the task is released a whole period
+               or more late: @c CATCH_UP (the default), @c SKIP or @c SHIFT
         """
         # The function which is run to implement this task's code. Since it 
         # is a generator, we "run" it here, which doesn't actually run it but
@@ -115,11 +159,21 @@ class Task:
         #  @c go() method. 
         if period != None:
             self.period = int(period * 1000)
-            self._next_run = utime.ticks_us() + self.period
+            self._next_run = utime.ticks_add(utime.ticks_us(), self.period)
         else:
             self.period = period
             self._next_run = None
 
+        ## The time in microseconds after each release by which a run should
+        #  have finished, or @c None if that is the period
+        self.deadline = None if deadline is None else int(deadline * 1000)
+
+        ## What is done when the task is released a period or more late
+        self.overrun = overrun
+
+        # The absolute deadline of the run the task has been released for
+        self._deadline_at = 0
+
         # Flag which causes the task to be profiled, in which the execution
         #  time of the @c run() method is measured and basic statistics kept. 
         self._prof = profile
@@ -139,102 +193,206 @@ class Task:
         #  scheduler
         self.go_flag = False
 
+        ## The task's number in its task list, which identifies it in the
+        #  list's trace
+        self.id = 0
+
+        # The task list this task is in, the bit which marks its priority
+        # in that list's ready bitmap, and whether it is in the list's heap
+        # of tasks waiting for their next run times
+        self._list = None
+        self._bit = 0
+        self._waiting = False
+
 
     def schedule(self) -> bool:
         """!
         This method is called by the scheduler; it attempts to run this task.
         If the task is not yet ready to run, this method returns @c False
         immediately; if this task is ready to run, it runs the task's generator
-        up to the next @c yield() and then returns @c True.
+        up to the next @c yield() and then returns @c True. A task in a task
+        list is put back into the list's heap and ready bitmap after it runs,
+        as the list's schedulers do.
 
         @return @c True if the task ran or @c False if it did not
         """
         if self.ready():
-
-            # Reset the go flag for the next run
-            self.go_flag = False
-
-            # If profiling, save the start time
-            if self._prof:
-                stime = utime.ticks_us()
-
-            # Run the method belonging to the state which should be run next
-            curr_state = next(self._run_gen)
-
-            # If profiling or tracing, save timing data
-            if self._prof or self._trace:
-                etime = utime.ticks_us()
-
-            # If profiling, save timing data
-            if self._prof:
-                self._runs += 1
-                runt = utime.ticks_diff(etime, stime)
-                if self._runs > 2:
-                    self._run_sum += runt
-                    if runt > self._slowest:
-                        self._slowest = runt
-
-            # If transition logic tracing is on, record a transition; if not,
-            # ignore the state. If out of memory, switch tracing off and 
-            # run the memory allocation garbage collector
-            if self._trace:
-                try:
-                    if curr_state != self._prev_state:
-                        self._tr_data.append(
-                            (utime.ticks_diff(etime, self._prev_time),
-                             curr_state))
-                except MemoryError:
-                    self._trace = False
-                    gc.collect()
-
-                self._prev_state = curr_state
-                self._prev_time = etime
-
+            self._run_once(utime.ticks_us())
+            task_list = self._list
+            if task_list is not None:
+                if self.period != None:
+                    task_list._push(self)
+                task_list._settle(task_list._level[self._bit], self._bit)
             return True
 
         else:
             return False
 
 
+    @micropython.native
+    def _run_once(self, stime):
+        """!
+        Run the task's generator up to its next @c yield(), keeping the
+        timing data. This is used by @c schedule() and by the schedulers in
+        @c TaskList, which have already found the task ready to run.
+        @param stime The time from @c utime.ticks_us() at which the run starts
+        """
+        # Reset the go flag for the next run
+        self.go_flag = False
+
+        # Run the method belonging to the state which should be run next
+        curr_state = next(self._run_gen)
+
+        # Save the end time, and check it against the deadline
+        etime = utime.ticks_us()
+        runt = utime.ticks_diff(etime, stime)
+        self._busy += runt
+        self.run_hist[_bucket(runt)] += 1
+        if self._list is not None and self._list.trace is not None:
+            self._list.trace.record(stime, self.id, curr_state, runt)
+        if self.period != None \
+                and utime.ticks_diff(etime, self._deadline_at) > 0:
+            self.misses += 1
+
+        # If profiling, save timing data
+        if self._prof:
+            self._runs += 1
+            if self._runs > 2:
+                self._run_sum += runt
+                if runt > self._slowest:
+                    self._slowest = runt
+
+        # If transition logic tracing is on, record a transition; if not,
+        # ignore the state. If out of memory, switch tracing off and 
+        # run the memory allocation garbage collector
+        if self._trace:
+            try:
+                if curr_state != self._prev_state:
+                    self._tr_data.append(
+                        (utime.ticks_diff(etime, self._prev_time),
+                         curr_state))
+            except MemoryError:
+                self._trace = False
+                gc.collect()
+
+            self._prev_state = curr_state
+            self._prev_time = etime
+
+
     @micropython.native
     def ready(self) -> bool:
         """!
         This method checks if the task is ready to run.
         If the task runs on a timer, this method checks what time it is; if not,
         this method checks the flag which indicates that the task is ready to
-        go. This method may be overridden in descendent classes to implement
-        some other behavior.
+        go. A task in a task list is released by the list, so that the list's
+        heap of timed tasks and its ready bitmap stay in step with the task;
+        that may release other tasks in the list which are due too. This
+        method may be overridden in descendent classes to implement some other
+        behavior.
         """
+        if self._list is not None:
+            self._list._release_due(utime.ticks_us())
+
         # If this task uses a timer, check if it's time to run run() again. If
         # so, set go flag and set the timer to go off at the next run time
-        if self.period != None:
+        elif self.period != None:
             late = utime.ticks_diff(utime.ticks_us(), self._next_run)
             if late > 0:
-                self.go_flag = True
-                self._next_run = utime.ticks_diff(self.period, 
-                                                  -self._next_run)
-
-                # If keeping a latency profile, record the data
-                if self._prof:
-                    self._late_sum += late
-                    if late > self._latest:
-                        self._latest = late
+                self._release(late)
 
         # If the task doesn't use a timer, we rely on go_flag to signal ready
         return self.go_flag
 
 
+    @micropython.native
+    def _release(self, late):
+        """!
+        Release a timer-driven task which has become due @c late
+        microseconds ago: set the go flag and its deadline and work out when
+        it is next due, following the task's overrun policy if it is a whole
+        period or more late.
+        @param late How long ago, in microseconds, the task became due
+        """
+        # A release which finds the last one still waiting means that one
+        # missed its deadline without running
+        if self.go_flag:
+            self.misses += 1
+        self.go_flag = True
+        period = self.period
+        self._deadline_at = utime.ticks_add(self._next_run,
+                                            self.deadline or period)
+        if late >= period:
+            self.overruns += 1
+            if self.overrun == SKIP:
+                # stay in phase, dropping the releases which were missed
+                skipped = late // period
+                self.skipped += skipped
+                self._next_run = utime.ticks_add(self._next_run,
+                                                 (skipped + 1) * period)
+                self._deadline_at = utime.ticks_add(self._deadline_at,
+                                                    skipped * period)
+            elif self.overrun == SHIFT:
+                # start the period afresh from now
+                self._next_run = utime.ticks_add(self._next_run,
+                                                 late + period)
+                self._deadline_at = utime.ticks_add(self._deadline_at, late)
+            else:
+                self._next_run = utime.ticks_add(self._next_run, period)
+        else:
+            self._next_run = utime.ticks_add(self._next_run, period)
+
+        # Histogram the lateness, and if keeping a latency profile, record
+        # the data
+        self.late_hist[_bucket(late)] += 1
+        if self._prof:
+            self._late_sum += late
+            if late > self._latest:
+                self._latest = late
+
+
+    def due_in(self, now):
+        """!
+        Find how long it will be until this task is next due to run.
+        @param now The time from @c utime.ticks_us()
+        @return The time in microseconds until the task is due, negative if
+                it's overdue, or @c None if it isn't run by a timer
+        """
+        if self.period is None:
+            return None
+        return utime.ticks_diff(self._next_run, now)
+
+
+    def utilization(self, elapsed):
+        """!
+        Find the fraction of the CPU's time this task has used.
+        @param elapsed The time in microseconds over which to measure, usually
+               since @c reset_profile() was called
+        @return The fraction of @c elapsed spent running the task
+        """
+        return self._busy / elapsed if elapsed > 0 else 0.0
+
+
     def set_period(self, new_period):
         """!
         This method sets the period between runs of the task to the given
         number of milliseconds, or @c None if the task is triggered by calls
-        to @c go() rather than time.
-        @param new_period The new period in milliseconds between task runs
+        to @c go() rather than time. The new period times the run after
+        next; the next run was timed by the old period when the one before
+        it was released.
+        @param new_period The new period in milliseconds between task runs,
+               an @c int or a @c float as for the constructor
         """
         if new_period is None:
             self.period = None
         else:
-            self.period = int(new_period) * 1000
+            # A task which had no period starts one from now
+            if self.period is None:
+                self._next_run = utime.ticks_add(utime.ticks_us(),
+                                                 int(new_period * 1000))
+                if self._list is not None:
+                    self._list._push(self)
+            self.period = int(new_period * 1000)
 
 
     def reset_profile(self):
@@ -248,6 +406,22 @@ class Task:
         self._late_sum = 0
         self._latest = 0
 
+        ## The number of runs which finished after their deadlines or never
+        #  ran before the next release, counted whether profiling or not
+        self.misses = 0
+        ## The number of releases which came a whole period or more late
+        self.overruns = 0
+        ## The number of releases dropped by the @c SKIP overrun policy
+        self.skipped = 0
+        # The total time in microseconds spent running the task
+        self._busy = 0
+
+        ## How many runs have taken each range of times, always kept; see
+        #  @c HIST_BUCKETS
+        self.run_hist = array('l', [0] * HIST_BUCKETS)
+        ## How many timed releases have come each range of times late
+        self.late_hist = array('l', [0] * HIST_BUCKETS)
+
 
     def get_trace(self):
         """!
@@ -278,6 +452,10 @@ class Task:
         another task which has data that this task needs to process soon.
         """
         self.go_flag = True
+        if self._list is not None:
+            irq_state = pyb.disable_irq()
+            self._list._woken |= self._bit
+            pyb.enable_irq(irq_state)
 
 
     def __repr__(self):
@@ -299,6 +477,11 @@ class Task:
             rst += f"{avg_dur: 10.3f}{(self._slowest / 1000.0): 10.3f}"
             if self.period != None:
                 rst += f"{avg_late: 10.3f}{(self._latest / 1000.0): 10.3f}"
+            else:
+                rst += ' ' * 20
+        else:
+            rst += ' ' * 40
+        rst += f"{self.misses: 8d}"
         return rst
 
 
@@ -316,13 +499,38 @@ class TaskList:
     The task list is sorted by priority so that the scheduler can efficiently
     look through the list to find the highest priority task which is ready to
     run at any given time. Tasks can also be scheduled in a simpler
-    "round-robin" fashion.
+    "round-robin" fashion, or earliest deadline first, in which the ready task
+    whose deadline comes soonest is run whatever its priority. The scheduling
+    mode of a list is chosen when it is made, or later by setting its @c mode,
+    and @c sched() then runs the chosen scheduler.
+
+    Rather than asking every task whether it is ready, which reads the clock
+    once per task, the schedulers read the clock once per pass. Tasks which
+    run on a timer wait in a binary heap ordered by when they are next due,
+    so a pass only looks at the tasks which have become due, at a cost which
+    grows with the logarithm of the number of tasks. A task leaves the heap
+    when it is released and goes back in once it has run, so a task which is
+    released late is released again straight after running only if its
+    overrun policy has left it due. Each priority has a
+    bit in a ready bitmap which is set while any task at that priority is
+    ready, by a release or by @c Task.go(), so the highest priority with work
+    to do is found without looking through the priorities which have none.
+
+    When a scheduler finds nothing ready to run it calls @c idle(). If
+    @c idle_sleep is set, that sleeps the CPU with @c pyb.wfi() until the next
+    interrupt, which comes at least every millisecond from the SysTick timer,
+    for as long as no task is due; otherwise it returns at once, so the loop
+    calling the scheduler spins as it always did.
     """
 
-    def __init__(self):
+    def __init__(self, mode=PRIORITY, idle_sleep=False):
         """!
         Initialize the task list. This creates the list of priorities in
         which tasks will be organized by priority.
+        @param mode The scheduler run by @c sched(): @c PRIORITY (the
+               default), @c ROUND_ROBIN or @c EDF
+        @param idle_sleep If @c True, sleep when there's nothing to run
+               rather than returning at once
         """
         ## The list of priority lists. Each priority for which at least one 
         #  task has been created has a list whose first element is a task 
@@ -330,6 +538,44 @@ class TaskList:
         #  that priority. 
         self.pri_list = []
 
+        ## The scheduler run by @c sched()
+        self.mode = mode
+
+        ## Whether @c idle() sleeps until a task is due
+        self.idle_sleep = idle_sleep
+
+        ## A function called by @c idle() in place of sleeping, with the time
+        #  in microseconds until the next timed task is due (or @c None if no
+        #  task runs on a timer), or @c None to use @c pyb.wfi()
+        self.idle_hook = None
+
+        ## Something with a @c record(start, task_id, state, duration)
+        #  method, such as a @c task_trace.TraceRing, to which each run of a
+        #  task is reported, or @c None
+        self.trace = None
+
+        # The number of tasks appended, used to give each task its id
+        self._count = 0
+
+        # The tasks which run on a timer, as a binary heap ordered by the
+        # times at which they are next due
+        self._heap = []
+
+        # The ready bitmap, with bit n set while a task in pri_list[n] is
+        # ready; it is only changed by the scheduler. Bits set by go(), which
+        # may be called from an interrupt, are gathered separately and moved
+        # over by the scheduler with interrupts off
+        self._ready = 0
+        self._woken = 0
+
+        # The priority list belonging to each bit of the ready bitmap
+        self._level = {}
+
+        # The time over which the CPU use is measured, and the part of it
+        # spent idle
+        self._since = utime.ticks_us()
+        self._idle_us = 0
+
 
     def append(self, task):
         """!
@@ -338,24 +584,154 @@ class TaskList:
         task which is ready to run at any given time. 
         @param task The task to be appended to the list
         """
-        # See if there's a tasklist with the given priority in the main list
+        # See if there's a tasklist with the given priority in the main list.
+        # If a tasklist with this priority exists, add this task to it; if
+        # not, start a new priority list with this task as first one, in its
+        # place in the main list (highest priority first). A priority list has
+        # the priority as element 0, an index into the list of tasks (used for
+        # round-robin scheduling those tasks) as the second item, and tasks
+        # after those
         new_pri = task.priority
-        for pri in self.pri_list:
-            # If a tasklist with this priority exists, add this task to it.
+        for pos in range(len(self.pri_list)):
+            pri = self.pri_list[pos]
             if pri[0] == new_pri:
                 pri.append(task)
                 break
-
-        # If the priority isn't in the list, this else clause starts a new 
-        # priority list with this task as first one. A priority list has the
-        # priority as element 0, an index into the list of tasks (used for
-        # round-robin scheduling those tasks) as the second item, and tasks
-        # after those
+            if pri[0] < new_pri:
+                self.pri_list.insert(pos, [new_pri, 2, task])
+                break
         else:
             self.pri_list.append([new_pri, 2, task])
 
-        # Make sure the main list (of lists at each priority) is sorted
-        self.pri_list.sort(key=lambda pri: pri[0], reverse=True)
+        # Adding a priority moves the bits of the ones below it
+        task._list = self
+        task.id = self._count
+        self._count += 1
+        self._number_levels()
+        if task.period != None:
+            self._push(task)
+
+
+    def _number_levels(self):
+        """!
+        Give each priority its bit in the ready bitmap, highest priority
+        first, and set the bits of the priorities with tasks ready to run.
+        """
+        ready = 0
+        self._level = {}
+        for pos in range(len(self.pri_list)):
+            pri = self.pri_list[pos]
+            bit = 1 << pos
+            self._level[bit] = pri
+            for idx in range(2, len(pri)):
+                pri[idx]._bit = bit
+                if pri[idx].go_flag:
+                    ready |= bit
+        self._ready = ready
+
+
+    def _push(self, task):
+        """!
+        Put a task into the heap of timed tasks, unless it's there already.
+        @param task The task, whose @c _next_run has been set
+        """
+        if task._waiting:
+            return
+        task._waiting = True
+        heap = self._heap
+        pos = len(heap)
+        heap.append(task)
+        while pos > 0:
+            parent = (pos - 1) >> 1
+            if utime.ticks_diff(task._next_run, heap[parent]._next_run) >= 0:
+                break
+            heap[pos] = heap[parent]
+            pos = parent
+        heap[pos] = task
+
+
+    @micropython.native
+    def _sift_down(self, pos):
+        """!
+        Move the task at a place in the heap down past any later tasks below
+        it, after its next run time has been put back.
+        @param pos The place in the heap of the task to be moved
+        """
+        heap = self._heap
+        length = len(heap)
+        task = heap[pos]
+        while True:
+            child = 2 * pos + 1
+            if child >= length:
+                break
+            if child + 1 < length and utime.ticks_diff(
+                    heap[child + 1]._next_run, heap[child]._next_run) < 0:
+                child += 1
+            if utime.ticks_diff(heap[child]._next_run, task._next_run) >= 0:
+                break
+            heap[pos] = heap[child]
+            pos = child
+        heap[pos] = task
+
+
+    @micropython.native
+    def _release_due(self, now):
+        """!
+        Release the timed tasks which have become due and mark their
+        priorities ready, along with those of tasks woken by @c Task.go().
+        Only the tasks at the top of the heap are looked at.
+        @param now The time from @c utime.ticks_us()
+        """
+        if self._woken:
+            irq_state = pyb.disable_irq()
+            woken = self._woken
+            self._woken = 0
+            pyb.enable_irq(irq_state)
+            self._ready |= woken
+
+        heap = self._heap
+        while heap:
+            task = heap[0]
+            if task.period != None:
+                late = utime.ticks_diff(now, task._next_run)
+                if late <= 0:
+                    break
+
+            # Take the task off the top of the heap. If its period was taken
+            # away it now waits for go(); if not, release it
+            last = heap.pop()
+            if heap:
+                heap[0] = last
+                self._sift_down(0)
+            task._waiting = False
+            if task.period != None:
+                task._release(late)
+                self._ready |= task._bit
+
+
+    def _settle(self, pri, bit):
+        """!
+        Clear the ready bit of a priority if none of its tasks is still ready
+        to run.
+        @param pri The priority list, [priority, index, task, task, ...]
+        @param bit The priority's bit in the ready bitmap
+        """
+        for idx in range(2, len(pri)):
+            if pri[idx].go_flag:
+                return
+        self._ready &= ~bit
+
+
+    def sched(self):
+        """!
+        Run the scheduler chosen by @c mode once.
+        """
+        if self.mode == EDF:
+            self.edf_sched()
+        elif self.mode == ROUND_ROBIN:
+            self.rr_sched()
+        else:
+            self.pri_sched()
 
 
     @micropython.native
@@ -371,10 +747,21 @@ class TaskList:
         about the same amount of time before each is given a chance to run 
         again.
         """
-        # For each priority level, run all tasks at that level
+        now = utime.ticks_us()
+        self._release_due(now)
+        if not self._ready:
+            self.idle(now)
+            return
+
+        # For each priority level, run all tasks at that level which are ready
         for pri in self.pri_list:
-            for task in pri[2:]:
-                task.schedule()
+            for idx in range(2, len(pri)):
+                task = pri[idx]
+                if task.go_flag:
+                    task._run_once(utime.ticks_us())
+                    if task.period != None:
+                        self._push(task)
+        self._ready = 0
 
 
     @micropython.native
@@ -386,32 +773,124 @@ class TaskList:
         called, it finds the highest priority task which is ready to run and
         calls that task's @c run() method.
         """
-        # Go down the list of priorities, beginning with the highest
+        now = utime.ticks_us()
+        self._release_due(now)
+        ready = self._ready
+        if not ready:
+            self.idle(now)
+            return
+
+        # The lowest bit set belongs to the highest priority with a task ready.
+        # Within each priority list, run tasks in round-robin order
+        # Each priority list is [priority, index, task, task, ...] where
+        # index is the index of the next task in the list to be run
+        bit = ready & -ready
+        pri = self._level[bit]
+        length = len(pri)
+        idx = pri[1]
+        for tries in range(2, length):
+            task = pri[idx]
+            idx += 1
+            if idx >= length:
+                idx = 2
+            if task.go_flag:
+                pri[1] = idx
+                task._run_once(now)
+                if task.period != None:
+                    self._push(task)
+                break
+        self._settle(pri, bit)
+
+
+    @micropython.native
+    def edf_sched(self):
+        """!
+        Run tasks according to their deadlines.
+
+        This scheduler finds, each time it is called, the ready task whose
+        deadline comes soonest and runs it, so a task's priority only matters
+        among tasks with the same deadline. Tasks which aren't run by a timer
+        have no deadline; they are run when no timed task is ready, highest
+        priority first.
+        """
+        now = utime.ticks_us()
+        self._release_due(now)
+        ready = self._ready
+        if not ready:
+            self.idle(now)
+            return
+
+        # Look through the priorities which have tasks ready
+        best = None
+        while ready:
+            bit = ready & -ready
+            ready ^= bit
+            pri = self._level[bit]
+            for idx in range(2, len(pri)):
+                task = pri[idx]
+                if task.go_flag:
+                    if best is None:
+                        best = task
+                    elif task.period != None and (best.period is None
+                            or utime.ticks_diff(task._deadline_at,
+                                                best._deadline_at) < 0):
+                        best = task
+
+        if best is not None:
+            best._run_once(now)
+            if best.period != None:
+                self._push(best)
+            self._settle(self._level[best._bit], best._bit)
+
+
+    def idle(self, now):
+        """!
+        Called by the schedulers when no task is ready to run. If
+        @c idle_sleep is set, this sleeps until the next timed task is due,
+        calling @c idle_hook if one has been given or waking with each
+        interrupt otherwise, so tasks run by @c go() from an interrupt service
+        routine are let run as soon as the interrupt has happened.
+        @param now The time from @c utime.ticks_us() at which the scheduler
+               found nothing to run
+        """
+        if not self.idle_sleep:
+            return
+        wait = None
+        if self._heap:
+            wait = utime.ticks_diff(self._heap[0]._next_run, now)
+        if wait is None or wait > 0:
+            if self.idle_hook is not None:
+                self.idle_hook(wait)
+            else:
+                pyb.wfi()
+        self._idle_us += utime.ticks_diff(utime.ticks_us(), now)
+
+
+    def reset_profile(self):
+        """!
+        Reset the profiling data and deadline counts of all the tasks, and
+        start measuring the CPU use afresh.
+        """
         for pri in self.pri_list:
-            # Within each priority list, run tasks in round-robin order
-            # Each priority list is [priority, index, task, task, ...] where
-            # index is the index of the next task in the list to be run
-            tries = 2
-            length = len(pri)
-            while tries < length:
-                ran = pri[pri[1]].schedule()
-                tries += 1
-                pri[1] += 1
-                if pri[1] >= length:
-                    pri[1] = 2
-                if ran:
-                    return
+            for task in pri[2:]:
+                task.reset_profile()
+        self._since = utime.ticks_us()
+        self._idle_us = 0
 
 
     def __repr__(self):
         """!
         Create some diagnostic text showing the tasks in the task list.
         """
+        elapsed = utime.ticks_diff(utime.ticks_us(), self._since)
         ret_str = 'TASK             PRI    PERIOD    RUNS   AVG DUR   MAX ' \
-            'DUR  AVG LATE  MAX LATE\n'
+            'DUR  AVG LATE  MAX LATE  MISSES   CPU %\n'
         for pri in self.pri_list:
             for task in pri[2:]:
-                ret_str += str(task) + '\n'
+                ret_str += str(task) \
+                    + f"{(100 * task.utilization(elapsed)): 8.1f}\n"
+        if self.idle_sleep and elapsed > 0:
+            ret_str += f"{'(idle)':<86s}{(100 * self._idle_us / elapsed): 8.1f}\n"
 
         return ret_str
 
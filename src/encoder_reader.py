@@ -1,4 +1,7 @@
 import pyb
+import utime
+import micropython
+from array import array
 
 """!
     @file                       encoder_reader.py
@@ -6,6 +9,9 @@ import pyb
     @details                    This is a driver for interfacing with Quadrature Encoders. This driver
                                 needs input parameters of the timer which is the proper timer that
                                 corresponds to the pins and the 2 channel pins which the encoder outputs.
+                                An @c EncoderSampler can also sample an encoder from a timer interrupt at a fixed
+                                rate, so that its position and speed can be read without touching the hardware
+                                and without depending on when the reading task happens to run.
 
     @author                     Peyton Archibald
     @author                     Harrison Hirsch
@@ -95,5 +101,145 @@ class EncoderReader:
         self.delta = 0
 
 
+# Lets errors in the sampling interrupt be reported
+micropython.alloc_emergency_exception_buf(100)
+
+
+class EncoderSampler:
+    """!
+        @brief                  Samples an encoder from a timer interrupt into a ring buffer
+        @details                A timer interrupt reads the encoder's counter at a fixed rate and stores the position,
+                                unwrapped from the counter's 16 bits, and the time of each sample in preallocated
+                                arrays. The interrupt only does integer arithmetic on those arrays, so it allocates no
+                                memory. Tasks then work out the position and speed from the last few samples: the
+                                speed from the change in position over a window of samples, or, when that is only a
+                                few counts, from the time between the first and last samples in the ring at which the
+                                count changed, which resolves slow speeds that the window would round to nothing.
+    """
+
+    def __init__(self, encoder, timer, freq=1000, size=32, window=8, min_counts=4):
+        """!
+            @brief              Starts sampling an encoder
+            @param  encoder     The @c EncoderReader whose counter is sampled
+            @param  timer       The number of a free timer to sample with
+            @param  freq        How many samples are taken per second
+            @param  size        How many samples are kept
+            @param  window      How many sample periods the speed is measured over
+            @param  min_counts  The fewest counts over the window for which the speed is worked out from it; below
+                                this the time between count changes is used instead
+        """
+        self.encodertimer = encoder.encodertimer
+        self.size = size
+        self.window = window
+        self.min_counts = min_counts
+        ## The unwrapped position at each sample, in counts
+        self.positions = array('l', [0] * size)
+        ## The time of each sample, from utime.ticks_us()
+        self.times = array('l', [0] * size)
+        ## The index of the newest sample
+        self.head = 0
+        ## How many samples have been taken, up to @c size
+        self.count = 0
+        self._last_count = self.encodertimer.counter()
+        self._position = 0
+        # bind the callback once, since making a bound method in the interrupt would allocate
+        self._isr = self._sample
+        self.timer = pyb.Timer(timer, freq=freq)
+        self.timer.callback(self._isr)
+
+    def _sample(self, timer):
+        # the interrupt: latch the counter, unwrap it and store it with the time
+        count = self.encodertimer.counter()
+        delta = count - self._last_count
+        self._last_count = count
+        if delta >= 32768:
+            delta -= 65536
+        elif delta < -32768:
+            delta += 65536
+        self._position += delta
+        head = self.head + 1
+        if head >= self.size:
+            head = 0
+        self.positions[head] = self._position
+        self.times[head] = utime.ticks_us()
+        self.head = head
+        if self.count < self.size:
+            self.count += 1
+
+    def stop(self):
+        """!
+            @brief              Stops sampling
+        """
+        self.timer.callback(None)
+
+    def position(self):
+        """!
+            @brief              Returns the position at the newest sample
+            @return             The position of the encoder shaft in counts
+        """
+        return self.positions[self.head]
+
+    def age(self):
+        """!
+            @brief              Returns how long ago the newest sample was taken
+            @return             The age of the newest sample in microseconds
+        """
+        return utime.ticks_diff(utime.ticks_us(), self.times[self.head])
+
+    def velocity(self):
+        """!
+            @brief              Estimates the speed of the encoder shaft
+            @details            Uses the samples up to the newest one when this is called. Older samples are only
+                                overwritten once the interrupt has gone all the way around the ring, so they can be
+                                read without stopping it.
+            @return             The speed of the encoder shaft in counts per second
+        """
+        irq_state = pyb.disable_irq()
+        head = self.head
+        count = self.count
+        pyb.enable_irq(irq_state)
+        size = self.size
+        positions = self.positions
+        times = self.times
+        if count < 2:
+            return 0.0
+
+        # finite difference over the window
+        span = self.window if self.window < count else count - 1
+        old = head - span
+        if old < 0:
+            old += size
+        moved = positions[head] - positions[old]
+        if moved >= self.min_counts or moved <= -self.min_counts:
+            return moved * 1000000 / utime.ticks_diff(times[head], times[old])
+
+        # too slow for that: the counts between the first and last samples in the ring at which the count changed,
+        # over the time between them
+        last_change = first_change = -1
+        idx = head
+        for _ in range(count - 1):
+            before = idx - 1 if idx else size - 1
+            if positions[idx] != positions[before]:
+                if last_change < 0:
+                    last_change = idx
+                first_change = idx
+            idx = before
+        if first_change == last_change:
+            return 0.0
+        period = utime.ticks_diff(times[last_change], times[first_change])
+        # if the next change is already overdue, the shaft has slowed down since
+        waited = utime.ticks_diff(times[head], times[last_change])
+        if waited > period:
+            period = waited
+        return (positions[last_change] - positions[first_change]) * 1000000 / period
+
+    def read(self):
+        """!
+            @brief              Returns the encoder position and speed
+            @return             The position of the encoder shaft in counts and its speed in counts per second
+        """
+        return self.position(), self.velocity()
+
+
 if __name__ == '__main__':
     pass
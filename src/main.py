@@ -17,6 +17,79 @@ import motor_run
 import servo
 import cotask
 import task_share
+import target_estimator
+import task_trace
+from array import array
+
+
+## The fields of the turret's state, shared between the tasks as one record so that each task reads them all from the
+## same moment
+STATE_FIELDS = ('button_pushed', 'yaw_pos', 'yaw_vel', 'pitch_pos', 'pitch_vel', 'desired_pos_x', 'desired_pos_y',
+                'desired_vel_x', 'desired_vel_y', 'on_target', 'fired')
+BUTTON_PUSHED, YAW_POS, YAW_VEL, PITCH_POS, PITCH_VEL, DESIRED_POS_X, DESIRED_POS_Y, DESIRED_VEL_X, DESIRED_VEL_Y, \
+    ON_TARGET, FIRED = range(len(STATE_FIELDS))
+
+## How far ahead, in milliseconds, the target's bearing is predicted, to allow for the motors' response
+LEAD_MS = 50
+
+## Controller settings for the yaw motor, as keyword arguments to motor_run.Motor; the deadband is 0.1 degree in
+## encoder ticks and the feedforward gain is full duty over the motor's top speed in ticks per second
+YAW_GAINS = {'initial_Kp': 0.2, 'Ki': 1.0, 'Kd': 0.01, 'Kff': 0.0022, 'deadband': 26, 'i_limit': 10}
+
+## Controller settings for the pitch motor, as for the yaw motor
+PITCH_GAINS = {'initial_Kp': 0.2, 'Ki': 1.0, 'Kd': 0.01, 'Kff': 0.0033, 'deadband': 19, 'i_limit': 10}
+
+## Limits on the motion of the gun, in degrees, seconds and their powers, as keyword arguments to motor_run.Motor; the
+## setpoints move towards each new aim point within them rather than jumping there
+PROFILE_LIMITS = {'max_vel': 150, 'max_accel': 4000, 'max_jerk': 50000}
+
+## How many times a second the motor controllers run from their encoder samplers' timer interrupts, or None to run
+## them from the motor tasks
+LOOP_FREQ = None
+
+## How the tasks are scheduled: cotask.PRIORITY runs the highest priority task which is ready, cotask.EDF the one
+## whose deadline comes soonest
+SCHED_MODE = cotask.PRIORITY
+
+## Whether the scheduler sleeps until the next task is due when there's nothing to run, instead of spinning
+IDLE_SLEEP = True
+
+## What the timed tasks do when they are released a whole period late: skipping the missed runs keeps them in phase
+## without running them back to back, which would only repeat the same work on the same readings
+OVERRUN = cotask.SKIP
+
+## The camera's acquisition profile, a name in mlx_cam.PROFILES: 'tracking' measures 16 subpages a second at 17 bits
+## over a 1 MHz bus, 'precision' 2 a second at 19 bits; None leaves the camera as it powered on
+CAMERA_PROFILE = 'tracking'
+
+## How close, in degrees of yaw and of pitch, a picture must show the turret to the target for it to count as on
+## target; less than a camera pixel, so it relies on the camera's sub-pixel bearings
+ON_TARGET_DEG = 1.0
+
+## How many pictures in a row must show the turret on target before it locks the motors and fires; after each shot
+## the count starts again, so however fast pictures come the gun fires at most once per this many
+ON_TARGET_PICTURES = 3
+
+## When the camera task gets a new picture: mlx_cam.SLIDING makes one from every subpage and the one before it,
+## mlx_cam.HALF one from every subpage on its own at half the resolution and mlx_cam.PAIRED one from each pair
+ACQUIRE_POLICY = mlx_cam.HALF
+
+## The size, as (rows, columns) of pixels, of the window around the tracked target which is all that is read of most
+## pictures once there is a target, with the whole picture read again every ROI_REFRESH subpages; None reads every
+## picture whole
+ROI_SIZE = (8, 10)
+ROI_REFRESH = 8
+
+## Whether the camera task's period is retuned so that it reads the camera's status register only around the times
+## its subpages are predicted to be ready, and finds each within a millisecond; if False the task keeps its period
+PACE_CAMERA = True
+
+## How many of the most recent task runs are kept in the scheduler's trace
+TRACE_SIZE = 256
+
+## The file on the board's flash to which the trace is saved when the program is stopped, or None not to save it;
+## read it on a PC with python -m sim.trace
+TRACE_FILE = None
 
 
 def main():
@@ -35,23 +108,20 @@ def main():
     # mlx_cam.run()
     # servo.run2(9)
 
-    s_button_pushed = task_share.Share('h', thread_protect=True, name='button_pushed')
-    s_yaw_pos = task_share.Share('f', thread_protect=True, name='yaw_pos')
-    s_yaw_vel = task_share.Share('f', thread_protect=True, name='yaw_vel')
-    s_pitch_pos = task_share.Share('f', thread_protect=True, name='pitch_pos')
-    s_pitch_vel = task_share.Share('f', thread_protect=True, name='pitch_vel')
-    s_desired_pos_x = task_share.Share('f', thread_protect=True, name='desired_pos_x')
-    s_desired_pos_y = task_share.Share('f', thread_protect=True, name='desired_pos_y')
-    s_on_target = task_share.Share('h', thread_protect=True, name='on_target')
-    s_fired = task_share.Share('h', thread_protect=True, name='fired')
+    s_state = task_share.StructShare(STATE_FIELDS, 'f', name='turret_state')
 
-    shares = s_button_pushed, s_yaw_pos, s_yaw_vel, s_pitch_pos, s_pitch_vel, s_desired_pos_x, s_desired_pos_y, s_on_target, s_fired
+    shares = (s_state,)
 
     init_task0 = cotask.Task(task0_init, name='Task_0', priority=100, shares=shares)
-    yaw_task1 = cotask.Task(task1_yaw, name='Task_1', priority=11, period=10, shares=shares)
-    camera_task2 = cotask.Task(task2_camera, name='Task_2', priority=9, period=100, shares=shares)
-    pitch_task3 = cotask.Task(task3_pitch, name='Task_3', priority=10, period=10, shares=shares)
-    fire_task4 = cotask.Task(task4_fire, name='Task_4', priority=12, period=50, shares=shares)
+    yaw_task1 = cotask.Task(task1_yaw, name='Task_1', priority=11, period=10, shares=shares, overrun=OVERRUN)
+    # The camera task is also given its own Task, to retune its period to the camera; the generator doesn't start
+    # until the task first runs, so the Task can be put in its shares once it's made
+    camera_shares = [s_state, None]
+    camera_task2 = cotask.Task(task2_camera, name='Task_2', priority=9, period=10, shares=camera_shares,
+                               overrun=OVERRUN)
+    camera_shares[1] = camera_task2
+    pitch_task3 = cotask.Task(task3_pitch, name='Task_3', priority=10, period=10, shares=shares, overrun=OVERRUN)
+    fire_task4 = cotask.Task(task4_fire, name='Task_4', priority=12, period=50, shares=shares, overrun=OVERRUN)
     # button_task5 = cotask.Task(task5_button, name='Task_5', priority=200, shares=shares)
 
     cotask.task_list.append(init_task0)
@@ -61,13 +131,19 @@ def main():
     cotask.task_list.append(fire_task4)
     # cotask.task_list.append(button_task5)
 
+    cotask.task_list.mode = SCHED_MODE
+    cotask.task_list.idle_sleep = IDLE_SLEEP
+    cotask.task_list.trace = task_trace.TraceRing(TRACE_SIZE)
     gc.collect()
+    cotask.task_list.reset_profile()
 
     while True:
         try:
-            cotask.task_list.pri_sched()
+            cotask.task_list.sched()
         except KeyboardInterrupt:
             break
+    if TRACE_FILE:
+        cotask.task_list.trace.save(cotask.task_list, TRACE_FILE)
     print('Done')
 
 
@@ -79,16 +155,20 @@ def task0_init(shares):     # Initialization of shares on startup
                                 time main() was called.
         @param  shares          The list of inter-task communication variables
     """
-    s_button_pushed, s_yaw_pos, s_yaw_vel, s_pitch_pos, s_pitch_vel, s_desired_pos_x, s_desired_pos_y, s_on_target, s_fired = shares
-    s_button_pushed.put(True)       # Button is not pushed
-    s_yaw_pos.put(0)                # Yaw at 0 degrees
-    s_yaw_vel.put(0)                # Yaw velocity 0
-    s_pitch_pos.put(0)              # Pitch at 0 degrees
-    s_pitch_vel.put(0)              # Pitch velocity 0
-    s_desired_pos_x.put(180)        # Desired x at 180
-    s_desired_pos_y.put(0)          # Desired y at 10
-    s_on_target.put(False)          # Not on target
-    s_fired.put(0)                  # Not fired
+    s_state, = shares
+    state = array('f', [0] * len(STATE_FIELDS))
+    state[BUTTON_PUSHED] = True     # Button is not pushed
+    state[YAW_POS] = 0              # Yaw at 0 degrees
+    state[YAW_VEL] = 0              # Yaw velocity 0
+    state[PITCH_POS] = 0            # Pitch at 0 degrees
+    state[PITCH_VEL] = 0            # Pitch velocity 0
+    state[DESIRED_POS_X] = 180      # Desired x at 180
+    state[DESIRED_POS_Y] = 0        # Desired y at 10
+    state[DESIRED_VEL_X] = 0        # Target not moving in x
+    state[DESIRED_VEL_Y] = 0        # Target not moving in y
+    state[ON_TARGET] = False        # Not on target
+    state[FIRED] = 0                # Not fired
+    s_state.put_all(state)
 
 
 def task1_yaw(shares):
@@ -101,16 +181,20 @@ def task1_yaw(shares):
         @yield                  A placeholder to signify that one loop of the function has been completed and that other
                                 tasks can be run if appropriate
     """
-    s_button_pushed, s_yaw_pos, s_yaw_vel, s_pitch_pos, s_pitch_vel, s_desired_pos_x, s_desired_pos_y, s_on_target, s_fired = shares
+    s_state, = shares
+    state = array('f', [0] * len(STATE_FIELDS))
 
-    yaw_motor = motor_run.Motor('A10', 'B4', 'B5', 3, 'C6', 'C7', 8, 0.1, 0)    # Initialize yaw motor
+    yaw_motor = motor_run.Motor('A10', 'B4', 'B5', 3, 'C6', 'C7', 8, initial_set_point=0, sample_timer=6,
+                                loop_freq=LOOP_FREQ, **YAW_GAINS, **PROFILE_LIMITS)   # Initialize yaw motor
 
     while True:
-        if not s_on_target.get():
-            s_yaw_pos.put(motor_run.move_yaw(yaw_motor, s_desired_pos_x.get()))
-            s_yaw_vel.put(yaw_motor.encoder.read()[1])
+        s_state.get_all(state)
+        if not state[ON_TARGET]:
+            state[YAW_POS] = motor_run.move_yaw(yaw_motor, state[DESIRED_POS_X], state[DESIRED_VEL_X])
+            state[YAW_VEL] = motor_run.yaw_speed(yaw_motor)
+            s_state.put_all(state)
         else:
-            motor_run.move_yaw(yaw_motor, s_yaw_pos.get())
+            motor_run.hold_yaw(yaw_motor)
             print('Motor locked')
         yield 0
 
@@ -120,75 +204,85 @@ def task2_camera(shares):
         @brief                  Task that implements the camera motor function in the form of an FSM and acts as a
                                 controller for the entire system.
         @details                On the first call of this function, the thermal camera is initialized through mlx_cam.
-                                Then, the tasks are run through, determining when to take a picture and whether to
-                                actuate the servo in the firing mechanism.
-        @param  shares          The list of inter-task communication variables
+                                Then pictures are taken continuously, a row at a time on successive runs of the task
+                                so that the motor tasks keep running while it is taken. Each picture is stamped with
+                                the time it was taken and the turret's pose at that time, and the tracked target
+                                seen in it, if there is one, is passed to a target estimator. On every run the estimator's prediction of the
+                                target's bearing, a little ahead of now, is published as the motor setpoints, so the
+                                motors follow the target between pictures instead of waiting for the next one. When
+                                @c ON_TARGET_PICTURES pictures in a row show the turret pointing at the target, it
+                                signals the servo to fire.
+        @param  shares          The list of inter-task communication variables, followed by the @c cotask.Task
+                                which runs this function
         @yield                  A placeholder to signify that one loop of the function has been completed and that other
                                 tasks can be run if appropriate
     """
-    s_button_pushed, s_yaw_pos, s_yaw_vel, s_pitch_pos, s_pitch_vel, s_desired_pos_x, s_desired_pos_y, s_on_target, s_fired = shares
+    s_state, this_task = shares
+    state = array('f', [0] * len(STATE_FIELDS))
+    pose = array('f', [0] * len(STATE_FIELDS))
 
-    camera = mlx_cam.camera_setup()
-    # start_time = utime.ticks_ms()
+    def turret_pose():
+        s_state.get_all(pose)
+        return pose[YAW_POS], pose[PITCH_POS]
 
-    S1 = 1  # Idle
-    S2 = 2  # Take picture
-    S3 = 3  # Return
+    camera = mlx_cam.camera_setup(CAMERA_PROFILE)
+    estimator = target_estimator.TargetEstimator()
+    if ROI_SIZE is not None:
+        camera.follow(*ROI_SIZE, refresh=ROI_REFRESH)
+    frames = camera.acquire(pose=turret_pose, policy=ACQUIRE_POLICY, task=this_task if PACE_CAMERA else None)
+    on_target_count = 0     # Pictures in a row showing the turret on target
 
-    picture_precount = 0
-    state = S1
     while True:
-
-        if state == S1:
-            # print(s_yaw_vel.get(), s_pitch_vel.get())
-            # if s_yaw_vel.get() == 0 and s_pitch_vel.get() == 0:    # If ready to take picture
-            if (s_desired_pos_x.get() - 2) < s_yaw_pos.get() < (s_desired_pos_x.get() + 2) and (s_desired_pos_y.get() - 2) < s_pitch_pos.get() < (s_desired_pos_y.get() + 2):
-                # print('Zero velocity')
-                picture_precount += 1
-            else:
-                picture_precount = 0
-            if picture_precount == 10:
-                state = S2  # Take picture state
-                picture_precount = 0
-
-        if state == S2 and not s_on_target.get():
-            [delta_y, delta_x] = mlx_cam.run(camera)  # Take picture
+        image = next(frames)    # Read the next few rows of the picture
+        s_state.get_all(state)
+        changed = False
+        if image is not None and not state[ON_TARGET]:
+            yaw, pitch = camera.frame_pose     # Where the turret was pointing for this picture
+            target_id, target_x, target_y = camera.locate(      # Picture taken
+                image, yaw, pitch, camera.frame_ms, camera.frame_window)
             print('Picture taken')
-            print(delta_x, delta_y)
-            # stop_time = utime.ticks_ms()
-            # diff_time = utime.ticks_diff(stop_time, start_time)
-            # print(diff_time)
-            if (-10 < delta_x < 10) and (-10 < delta_y < 10):
-                s_on_target.put(True)
-                s_desired_pos_y.put(s_pitch_pos.get())
-                s_desired_pos_x.put(s_yaw_pos.get())
+            on_target = False
+            if target_id:   # Only follow something which stands out, not the hottest speck of noise
+                estimator.update(target_id, target_x, target_y, camera.frame_ms)
+                delta_x = yaw - target_x
+                delta_y = target_y - pitch
+                print(delta_x, delta_y)
+                on_target = -ON_TARGET_DEG < delta_x < ON_TARGET_DEG and -ON_TARGET_DEG < delta_y < ON_TARGET_DEG
+            on_target_count = on_target_count + 1 if on_target else 0
+            if on_target_count >= ON_TARGET_PICTURES:
+                state[ON_TARGET] = True
+                state[DESIRED_POS_Y] = state[PITCH_POS]
+                state[DESIRED_POS_X] = state[YAW_POS]
+                changed = True
                 print('Ready to fire')
-                # state = S3
-                yield 0
-            desired_x = s_yaw_pos.get() - delta_x
+
+        if estimator.valid and not state[ON_TARGET]:
+            desired_x, desired_y, vel_x, vel_y = estimator.predict(utime.ticks_add(utime.ticks_ms(), LEAD_MS))
             if desired_x < 90:
                 desired_x = 90
+                vel_x = 0
             elif desired_x > 270:
                 desired_x = 270
-            desired_y = s_pitch_pos.get() + delta_y
+                vel_x = 0
             if desired_y < -5:
                 desired_y = -5
+                vel_y = 0
             elif desired_y > 15:
                 desired_y = 15
-            s_desired_pos_x.put(desired_x)
-            s_desired_pos_y.put(desired_y)
-            state = S1  # Return to idle
-        else:
-            state = S1
-        if state == S3:
-            print('State 3')
-            if s_fired.get():
-                # s_desired_pos_x.put(0)
-                # s_desired_pos_y.put(0)
-                s_fired.put(False)
-            else:
-                pass
-
+                vel_y = 0
+            state[DESIRED_POS_X] = desired_x
+            state[DESIRED_POS_Y] = desired_y
+            state[DESIRED_VEL_X] = vel_x
+            state[DESIRED_VEL_Y] = vel_y
+            changed = True
+
+        if state[FIRED]:
+            state[FIRED] = False
+            on_target_count = 0     # Make sure of the target again before the next shot
+            changed = True
+
+        if changed:
+            s_state.put_all(state)    # The setpoints and flags change together
         yield 0
 
 
@@ -202,17 +296,21 @@ def task3_pitch(shares):
         @yield                  A placeholder to signify that one loop of the function has been completed and that other
                                 tasks can be run if appropriate
     """
-    s_button_pushed, s_yaw_pos, s_yaw_vel, s_pitch_pos, s_pitch_vel, s_desired_pos_x, s_desired_pos_y, s_on_target, s_fired = shares
+    s_state, = shares
+    state = array('f', [0] * len(STATE_FIELDS))
 
-    pitch_motor = motor_run.Motor('C1', 'A0', 'A1', 5, 'B6', 'B7', 4, 0.1, 0)  # Initialize pitch motor
+    pitch_motor = motor_run.Motor('C1', 'A0', 'A1', 5, 'B6', 'B7', 4, initial_set_point=0, sample_timer=7,
+                                  loop_freq=LOOP_FREQ, **PITCH_GAINS, **PROFILE_LIMITS)  # Initialize pitch motor
 
     while True:
-        print(s_desired_pos_y.get())
-        if not s_on_target.get():
-            s_pitch_pos.put(motor_run.move_pitch(pitch_motor, s_desired_pos_y.get()))
-            s_yaw_vel.put(pitch_motor.encoder.read()[1])
+        s_state.get_all(state)
+        print(state[DESIRED_POS_Y])
+        if not state[ON_TARGET]:
+            state[PITCH_POS] = motor_run.move_pitch(pitch_motor, state[DESIRED_POS_Y], state[DESIRED_VEL_Y])
+            state[PITCH_VEL] = motor_run.pitch_speed(pitch_motor)
+            s_state.put_all(state)
         else:
-            motor_run.move_pitch(pitch_motor, s_pitch_pos.get())
+            motor_run.hold_pitch(pitch_motor)
 
         yield 0
 
@@ -221,33 +319,40 @@ def task4_fire(shares):
     """!
         @brief                  Task that implements the servo function to fire a dart in the form of an FSM
         @details                When the camera task determines that a target is within the gun sights, a conditional
-                                in this task signals the servo to actuate, pushing a dart through the flywheels.
+                                in this task signals the servo to actuate, pushing a dart through the flywheels. The
+                                servo is pulled back on a later run once it has had @c servo.PUSH_MS to push, rather
+                                than by waiting for it, so the other tasks keep running; until then the turret stays
+                                locked on target.
         @param  shares          The list of inter-task communication variables
         @yield                  A placeholder to signify that one loop of the function has been completed and that other
                                 tasks can be run if appropriate
     """
-    s_button_pushed, s_yaw_pos, s_yaw_vel, s_pitch_pos, s_pitch_vel, s_desired_pos_x, s_desired_pos_y, s_on_target, s_fired = shares
+    s_state, = shares
+    state = array('f', [0] * len(STATE_FIELDS))
+    servo_ch = servo.setup()
 
     S1 = 1  # Idle
+    S2 = 2  # Fire state, with the servo pushing a dart
 
-    state = S1
+    fire_state = S1
+    pushed_ms = 0
     while True:
         print('fire check')
-        if s_on_target.get():
-            print('Firing')
-            servo.run()  # Actuate servo
-            s_on_target.put(False)
-            s_fired.put(True)
-        # if state == S1:
-        #     if s_on_target.get():   # if aiming at target:
-        #         state = S2  # Fire state
-        #
-        # elif state == S2:     # Fire state
-        #     print('Firing')
-        #     servo.run()     # Actuate servo
-        #     s_on_target.put(False)
-        #     s_fired.put(True)
-        #     state = S1      # Return to idle state
+        if fire_state == S1:
+            if s_state.get(ON_TARGET):   # if aiming at target:
+                print('Firing')
+                servo.push(servo_ch)     # Actuate servo
+                pushed_ms = utime.ticks_ms()
+                fire_state = S2  # Fire state
+
+        elif fire_state == S2:     # Fire state
+            if utime.ticks_diff(utime.ticks_ms(), pushed_ms) >= servo.PUSH_MS:
+                servo.retract(servo_ch)
+                s_state.get_all(state)
+                state[ON_TARGET] = False
+                state[FIRED] = True
+                s_state.put_all(state)      # Both at once, so no task sees one without the other
+                fire_state = S1      # Return to idle state
 
         yield 0
 
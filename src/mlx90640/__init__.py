@@ -2,24 +2,39 @@
 @file __init__.py
 This file contains a class which controls an MLX90640 thermal infrared camera.
 
-RAW VERSION
-This version is a stripped down MLX90640 driver which produces only raw data,
-not calibrated data, in order to save memory.
+By default only raw data is produced, in order to save memory. Calling
+setup(calibrate=True) also loads the calibration, after which temperatures
+can be worked out one subpage at a time with process_image().
 """
 
 from gc import collect, mem_free
+from utime import ticks_us
 from ucollections import namedtuple
 from mlx90640.regmap import (
     REGISTER_MAP,
+    VOLATILE_REGISTERS,
     EEPROM_MAP,
     RegisterMap,
     CameraInterface,
+    EEPROMImage,
     REG_SIZE,
     EEPROM_ADDRESS,
     EEPROM_SIZE,
 )
-# from mlx90640.calibration import CameraCalibration, TEMP_K
-from mlx90640.image import RawImage, Subpage, get_pattern_by_id
+from mlx90640.calibration import (
+    CameraCalibration,
+    CALIB_CACHE_FILE,
+    NUM_ROWS,
+    TEMP_K,
+)
+from mlx90640.image import (
+    RawImage,
+    ProcessedImage,
+    Subpage,
+    WindowSubpage,
+    get_pattern_by_id,
+)
+from mlx90640.ready import ReadyClock
 
 
 class CameraDetectError(Exception):
@@ -66,35 +81,65 @@ class DataNotAvailableError(Exception):
     pass
 
 
+class ConfigError(Exception):
+    pass
+
+
 class MLX90640:
 
     def __init__(self, i2c, addr):
         """!
         """
         self.iface = CameraInterface(i2c, addr)
-        self.registers = RegisterMap(self.iface, REGISTER_MAP)
-        self.eeprom = RegisterMap(self.iface, EEPROM_MAP, readonly=True)
+        self.registers = RegisterMap(self.iface, REGISTER_MAP,
+                                     volatile=VOLATILE_REGISTERS)
+        self.eeprom = None
         self.calib = None
         self.raw = None
-#         self.image = None
+        self.image = None
         self.last_read = None
+        # learns when the camera has data ready from the status reads
+        self.ready = ReadyClock()
 
 
-    def setup(self, *, calib=None, raw=None, image=None):
+    def setup(self, *, calib=None, raw=None, image=None, calibrate=False,
+              cache_file=CALIB_CACHE_FILE):
         """!
+        Allocate the image buffer and, if asked to, load the camera's
+        calibration. The calibration tables are worked out from the EEPROM on
+        the first boot and kept in @c cache_file, so later boots only have to
+        read that file.
         """
         # We've been having some memory allocation errors which usually happen
         # as this method runs. As a workaround, run gc.collect() several times
         # to keep memory cleaned up, as when the process is finished, there is
         # a bunch of free memory (~27KB or more on STM32L476) available
-#         collect()
-#         self.calib = calib or CameraCalibration(self.iface, self.eeprom)
+        if calib is not None or calibrate:
+            collect()
+            self.calib = calib or CameraCalibration(
+                self.read_eeprom(), self.eeprom, cache_file=cache_file)
+            # the EEPROM copy is only needed while the calibration is built
+            self.eeprom = None
         collect()
 #         print(f"setup: {mem_free()}", end='')
         self.raw = raw or RawImage()
         collect()
 #         print(f" -> {mem_free()}")
-#         self.image = image or ProcessedImage(self.calib)
+        if self.calib is not None:
+            self.image = image or ProcessedImage(self.calib)
+            collect()
+
+
+    def read_eeprom(self):
+        """!
+        Copy the whole EEPROM into RAM with one bulk read, and point
+        @c self.eeprom at the copy so that calibration fields are decoded
+        without further bus traffic.
+        @returns The @c EEPROMImage holding the copy
+        """
+        image = EEPROMImage(self.iface)
+        self.eeprom = RegisterMap(image, EEPROM_MAP, readonly=True)
+        return image
 
 
     @property
@@ -108,6 +153,41 @@ class MLX90640:
         """!
         """
         self.registers['refresh_rate'] = RefreshRate.from_freq(freq)
+        self.ready.reset()
+
+
+    def configure(self, *, refresh_hz=None, adc_bits=None, fmplus=None):
+        """!
+        Change the refresh rate, ADC resolution and I2C Fast-mode Plus
+        setting together, writing each register once, then read the
+        registers back from the camera to check that it took them. Settings
+        left as @c None are not changed.
+        @param refresh_hz How many subpages the camera measures a second,
+                          from 0.5 to 64 in powers of two
+        @param adc_bits The ADC resolution, from 16 to 19 bits
+        @param fmplus Whether the camera's bus interface allows Fast-mode
+                      Plus, up to 1 MHz
+        @raises ConfigError If a register doesn't read back as written
+        """
+        fields = {}
+        if refresh_hz is not None:
+            fields['refresh_rate'] = RefreshRate.from_freq(refresh_hz)
+        if adc_bits is not None:
+            if not 16 <= adc_bits <= 19:
+                raise ValueError(f"no {adc_bits} bit ADC resolution")
+            fields['adc_resolution'] = adc_bits - 16
+        if fmplus is not None:
+            fields['fmplus_disable'] = 0 if fmplus else 1
+        self.registers.update(**fields)
+        self.ready.reset()
+
+        for name in fields:
+            self.registers.invalidate(name)
+        for name, value in fields.items():
+            actual = self.registers[name]
+            if actual != value:
+                raise ConfigError(f"{name} reads back as {actual}, "
+                                  f"not {value}")
 
 
     def get_pattern(self):
@@ -124,76 +204,77 @@ class MLX90640:
 
     def read_vdd(self):
         """!
-        Turned off to save memory for raw driver version.
+        Read the supply voltage, as its difference from 3.3 V. Needs the
+        calibration to have been loaded by @c setup().
         """
         # supply voltage calculation (delta Vdd)
         # type: (self) -> float
         vdd_pix = self.registers['vdd_pix'] * self._adc_res_corr()
-#         return float(vdd_pix - self.calib.vdd_25)/self.calib.k_vdd
-        return float(vdd_pix)
+        return float(vdd_pix - self.calib.vdd_25)/self.calib.k_vdd
 
 
     def _adc_res_corr(self):
         """!
-        Turned off to save memory for raw driver version.
+        Scale from the ADC resolution in use to the one the camera was
+        calibrated at.
         """
         # type: (self) -> float
-#         res_exp = self.calib.res_ee - self.registers['adc_resolution']
-#         return 1 << res_exp
-        return 0
+        res_exp = self.calib.res_ee - self.registers['adc_resolution']
+        return 2.0 ** res_exp
 
 
-    def read_ta(self):
+    def read_ta(self, vdd=None):
         """!
-        Turned off to save memory for raw driver version.
+        Read the ambient (die) temperature, as its difference from 25 degC.
+        @param vdd The supply voltage from @c read_vdd(), if it has already
+                   been read
         """
         # ambient temperature calculation (delta Ta in degC)
         # type: (self) -> float
+        if vdd is None:
+            vdd = self.read_vdd()
         v_ptat = self.registers['ta_ptat']
         v_be = self.registers['ta_vbe']
-#         v_ptat_art = v_ptat/(v_ptat*self.calib.alpha_ptat + v_be) * 262144
-# 
-#         v_ta = v_ptat_art/(1.0 + self.calib.kv_ptat*self.read_vdd() - self.calib.ptat_25)
-
-        # print('v_ptat: ', v_ptat)
-        # print('v_be:', v_be)
-        # print('v_ptat_art: ', v_ptat_art)
+        v_ptat_art = v_ptat/(v_ptat*self.calib.alpha_ptat + v_be) * 262144
 
-#         return v_ta/self.calib.kt_ptat
-        return 0.0
+        v_ta = v_ptat_art/(1.0 + self.calib.kv_ptat*vdd) - self.calib.ptat_25
+        return v_ta/self.calib.kt_ptat
 
 
     def read_gain(self):
         """!
-        Turned off to save memory for raw driver version.
+        Read the gain correction factor for the pixel data.
         """
         # gain calculation
         # type: (self) -> float
-#         return self.calib.gain / self.registers['gain']
-        return float(self.registers['gain'])
+        return self.calib.gain / self.registers['gain']
 
 
     # tr - temperature of reflected environment
     def read_state(self, *, tr=None):
         """!
+        Read everything besides the pixels that is needed to compensate a
+        subpage. The values are only good for the subpage measured at the
+        same time, so this should be called once per subpage.
         """
         gain = self.read_gain()
         cp_sp_0 = gain * self.registers['cp_sp_0']
         cp_sp_1 = gain * self.registers['cp_sp_1']
 
-        ta = self.read_ta()
+        vdd = self.read_vdd()
+        ta = self.read_ta(vdd)
 
         ta_abs = ta + 25
-#         if self.calib.emissivity == 1:
-        ta_r = (ta_abs + TEMP_K)**4
-#         else:
-#             tr = tr if tr is not None else ta_abs - 8
-#             ta_k4 = (ta_abs + TEMP_K)**4
-#             tr_k4 = (tr + TEMP_K)**4
-#             ta_r = tr_k4 - (tr_k4 - ta_k4)/self.calib.emissivity
+        if self.calib.emissivity == 1:
+            ta_r = (ta_abs + TEMP_K)**4
+        else:
+            tr = tr if tr is not None else ta_abs - 8
+            ta_k4 = (ta_abs + TEMP_K)**4
+            tr_k4 = (tr + TEMP_K)**4
+            ta_r = tr_k4 - (tr_k4 - ta_k4)/self.calib.emissivity
 
         return CameraState(
-            vdd = self.read_vdd(),
+            vdd = vdd,
             ta = ta,
             ta_r = ta_r,
             gain = gain,
@@ -206,7 +287,7 @@ class MLX90640:
         """!
         Report whether there's data available from the camera.
         """
-        return bool(self.registers['data_available'])
+        return self.read_status()[0]
 
 
     @property
@@ -216,39 +297,106 @@ class MLX90640:
         return self.registers['last_subpage']
 
 
-    def read_image(self, sp_id = None):
+    def read_status(self):
+        """!
+        Read the status register once. The time of the read goes to
+        @c self.ready, which learns from it when the camera has data ready.
+        @returns A tuple of whether there's data available and which subpage
+                 was measured last
+        """
+        ready = self.ready
+        if ready.period_us is None:
+            ready.period_us = int(1000000 / self.refresh_rate)
+        now = ticks_us()
+        status = self.registers.snapshot('data_available')
+        has_data = bool(status['data_available'])
+        ready.observe(now, has_data)
+        return has_data, status['last_subpage']
+
+
+    def read_image(self, sp_id = None, window = None):
         """!
+        Read the subpage which the camera has just measured.
+        @param window A region of interest as (first row, last row, first
+                      column, last column), the last of each not included.
+                      Only the RAM holding the window's pixels is read, a row
+                      per transaction, and only those pixels are updated. By
+                      default the whole subpage is read.
         """
-        if not self.has_data:
+        has_data, last_subpage = self.read_status()
+        if not has_data:
             raise DataNotAvailableError
 
         if sp_id is None:
-            sp_id = self.last_subpage
+            sp_id = last_subpage
 
-        subpage = Subpage(self.get_pattern(), sp_id)
+        if window is None:
+            subpage = Subpage(self.get_pattern(), sp_id)
+        else:
+            subpage = WindowSubpage(self.get_pattern(), sp_id, *window)
         self.last_read = subpage
 
         # print(f"read SP {subpage.id}")
-        self.raw.read(self.iface, subpage.sp_range())
-        self.registers['data_available'] = 0
+        self.read_rows(subpage, subpage.first_row, subpage.last_row)
+        self.ack_data()
         return self.raw
 
 
-#     def process_image(self, sp_id = None, state = None):
-#         """!
-#         """
-#         if self.last_read is None:
-#             raise DataNotAvailableError
-# 
-#         subpage = self.last_read
-#         if sp_id is not None:
-#             subpage.id = sp_id
-# 
-#         state = state or self.read_state()
-# 
-#         # print(f"process SP {subpage.id}")
-#         raw_data = ((idx, self.raw[idx]) for idx in subpage.sp_range())
-#         self.image.update(raw_data, subpage, state)
-#         return self.image
+    def read_rows(self, subpage, first_row, last_row, into=None):
+        """!
+        Read the pixels of one subpage which lie in a band of rows, without
+        checking or clearing the data available flag. Reading a subpage a few
+        rows at a time keeps each call short.
+        @param into An array of pixels, such as a slot of a @c FrameRing, into
+                    which every pixel of the band, or of the part of it in the
+                    window of a @c WindowSubpage, is put: those of this
+                    subpage as just read, and those of the other as last read.
+                    By default only this subpage's pixels are put into
+                    @c self.raw.
+        """
+        if into is not None:
+            self.raw.read(self.iface, subpage.band(first_row, last_row),
+                          subpage.sp_runs(first_row, last_row), into)
+            return into
+        self.raw.read(self.iface,
+                      subpage.sp_range(first_row, last_row),
+                      subpage.sp_runs(first_row, last_row))
+        return self.raw
+
+
+    def ack_data(self):
+        """!
+        Clear the data available flag so the camera can report the next
+        subpage. The status register is written back as it was last read, so
+        this costs one write.
+        """
+        self.registers['data_available'] = 0
+        self.ready.arm()
+
+
+    def process_rows(self, subpage, first_row, last_row, state, into=None):
+        """!
+        Work out the temperatures of the pixels of one subpage which lie in a
+        band of rows, from the raw data last read by @c read_rows(). The
+        result goes into @c self.image, or the array @c into if one is given,
+        in hundredths of a degree C.
+        """
+        self.image.update(self.raw, subpage, state, first_row, last_row, into)
+        return self.image if into is None else into
+
+
+    def process_image(self, sp_id = None, state = None):
+        """!
+        Work out the temperatures of the whole subpage last read by
+        @c read_image().
+        """
+        if self.last_read is None:
+            raise DataNotAvailableError
 
+        subpage = self.last_read
+        if sp_id is not None:
+            subpage = Subpage(subpage.pattern, sp_id)
 
+        state = state or self.read_state()
+        return self.process_rows(subpage, subpage.first_row, subpage.last_row,
+                                 state)
@@ -1,8 +1,10 @@
+import struct
 from array import array
 from mlx90640.utils import (
     Struct, 
     StructProto,
     field_desc,
+    array_filled,
 )
 from mlx90640.regmap import REG_SIZE
 
@@ -59,16 +61,14 @@ class PixelCalibrationData:
         pix_count = NUM_ROWS * NUM_COLS
         self._data = bytearray(pix_count * REG_SIZE)
 
-        failed = []
-        buf = bytearray(REG_SIZE)
-        for idx in range(pix_count):
-            offset = idx * REG_SIZE
-            iface.read_into(PIX_CALIB_ADDRESS + offset, buf)
-            if buf != bytes(REG_SIZE):
-                self._data[offset:offset+REG_SIZE] = buf
-            else:
-                failed.append(idx)
-        self.failed = tuple(failed)
+        # one read for all the pixel words; a word of zero marks a pixel
+        # which failed factory calibration
+        iface.read_into(PIX_CALIB_ADDRESS, self._data)
+        data = self._data
+        self.failed = tuple(
+            idx for idx in range(pix_count)
+            if not (data[idx * REG_SIZE] or data[idx * REG_SIZE + 1])
+        )
 
     def __len__(self):
         return len(self._data)//REG_SIZE
@@ -81,8 +81,62 @@ class PixelCalibrationData:
 
 TEMP_K = 273.15
 
+# Derived per-pixel tables are saved to this file, keyed by the EEPROM
+# checksum, so they need only be worked out on the first boot with a camera
+CALIB_CACHE_FILE = 'mlx_calib.bin'
+CALIB_CACHE_MAGIC = b'MLXC'
+CALIB_CACHE_VERSION = const(3)
+# magic, version, EEPROM checksum and the shift of each table
+CALIB_CACHE_HEADER = '<4sHI3B'
+# (attribute, array typecode) of each table in the file, in order
+CALIB_CACHE_TABLES = (
+    ('pix_os_ref', 'h'),
+    ('pix_alpha',  'H'),
+    ('pix_kta',    'h'),
+)
+
+# MicroPython's struct raises ValueError for a short buffer
+_STRUCT_ERROR = getattr(struct, 'error', ValueError)
+
+def _pack_table(values, typecode, scaled=True):
+    # Pack a per-pixel table into a 16 bit array. values() makes a fresh
+    # iterator over the table's integers each time it's called, so the
+    # range can be found before the array is filled without keeping a list.
+    # A fixed point table is shifted right by as few bits as fits it, and
+    # its scale must be divided by 1 << shift; a table which can't be made
+    # to fit raises ValueError rather than being saturated.
+    # returns (array, shift)
+    lo, hi = (0, 0xFFFF) if typecode == 'H' else (-0x8000, 0x7FFF)
+    v_min = v_max = 0
+    for value in values():
+        if value < v_min:
+            v_min = value
+        elif value > v_max:
+            v_max = value
+    shift = 0
+    if v_min < lo and lo == 0:
+        raise ValueError("calibration table has negative values")
+    while (v_max >> shift) > hi or (v_min >> shift) < lo:
+        if not scaled:
+            raise ValueError("calibration table out of 16 bit range")
+        shift += 1
+    return array(typecode, (value >> shift for value in values())), shift
+
 class CameraCalibration:
-    def __init__(self, iface, eeprom, *, emissivity=1, use_tgc=False):
+    def __init__(self, iface, eeprom, *, emissivity=1, use_tgc=False,
+                 cache_file=None):
+        # iface should be an EEPROMImage, so that the calibration is read
+        # from RAM rather than one register at a time over I2C, and eeprom a
+        # read-only RegisterMap over it.
+        #
+        # To save memory the per-pixel tables are kept as 16-bit integers:
+        # pix_os_ref is the offset itself, while pix_alpha and pix_kta are
+        # fixed point and must be divided by pix_alpha_scale and
+        # pix_kta_scale. Those are the device's alpha_scale and kta_scale_1,
+        # less any bits the tables were shifted by to fit this camera's
+        # values into 16 bits.
+        # The interleaved pattern offset is worked out when needed by
+        # il_offset() rather than being stored.
         self.emissivity = emissivity
 
         # restore VDD sensor parameters
@@ -103,13 +157,23 @@ class CameraCalibration:
 
         # pixel calibration data
         self.pix_data = PixelCalibrationData(iface)
-        self.pix_os_ref = array('h', self._calc_pix_os_ref(iface, eeprom))
         self.outliers = tuple(idx for idx, data in enumerate(self.pix_data) if data['outlier'])
 
+        # the per-pixel tables either come from the cache file or are worked
+        # out further down and then saved
+        checksum = iface.checksum() if cache_file is not None else None
+        cached = cache_file is not None and self._load_tables(cache_file, checksum)
+        if not cached:
+            self.pix_os_ref, self.pix_os_ref_shift = _pack_table(
+                lambda: self._calc_pix_os_ref(iface, eeprom), 'h', False)
+
         # IR data compensation
         self.kta_scale_1 = 1 << (eeprom['kta_scale_1'] + 8)
         self.kta_scale_2 = 1 << eeprom['kta_scale_2']
-        self.pix_kta = array('f', self._calc_pix_kta(eeprom))
+        if not cached:
+            self.pix_kta, self.pix_kta_shift = _pack_table(
+                lambda: self._calc_pix_kta(eeprom), 'h')
+        self.pix_kta_scale = self.kta_scale_1 >> self.pix_kta_shift
 
         self.kv_scale = 1 << eeprom['kv_scale']
         self.kv_avg = (
@@ -134,7 +198,11 @@ class CameraCalibration:
             self.kv_cp = eeprom['kv_cp'] / self.kv_scale
 
         # sensitivity normalization
-        self.pix_alpha = array('f', self._calc_pix_alpha_ref(iface, eeprom))
+        self.alpha_scale = 1 << (eeprom['alpha_scale'] + 30)
+        if not cached:
+            self.pix_alpha, self.pix_alpha_shift = _pack_table(
+                lambda: self._calc_pix_alpha_ref(iface, eeprom), 'H')
+        self.pix_alpha_scale = self.alpha_scale >> self.pix_alpha_shift
         self.ksta = eeprom['ksta'] / 8192.0
 
         if use_tgc:
@@ -148,7 +216,11 @@ class CameraCalibration:
         self.il_chess_c1 = eeprom['il_chess_c1'] / 16.0
         self.il_chess_c2 = eeprom['il_chess_c2'] / 2.0
         self.il_chess_c3 = eeprom['il_chess_c3'] / 8.0
-        self.il_offset = array('f', self._calc_il_offset())
+        if not cached and cache_file is not None:
+            self._save_tables(cache_file, checksum)
+
+        # the raw pixel words are only needed to build the tables
+        self.pix_data = None
 
         # temperature calculation
         self.drift = 0  # temperature drift correction
@@ -173,6 +245,45 @@ class CameraCalibration:
         alpha_4 = alpha_3*(1.0 + ksto3*(ct4 - ct3))
         self.alpha_ext = (alpha_1, alpha_2, alpha_3, alpha_4)
 
+    def _load_tables(self, path, checksum):
+        # returns True if the file holds tables for this camera's EEPROM
+        try:
+            with open(path, 'rb') as file:
+                header = file.read(struct.calcsize(CALIB_CACHE_HEADER))
+                magic, version, file_checksum, *shifts = struct.unpack(
+                    CALIB_CACHE_HEADER, header)
+                if (magic != CALIB_CACHE_MAGIC or version != CALIB_CACHE_VERSION
+                        or file_checksum != checksum):
+                    return False
+
+                tables = []
+                for name, typecode in CALIB_CACHE_TABLES:
+                    table = array_filled(typecode, IMAGE_SIZE)
+                    nbytes = IMAGE_SIZE * struct.calcsize(typecode)
+                    if file.readinto(table) != nbytes:
+                        return False
+                    tables.append(table)
+        except (OSError, ValueError, _STRUCT_ERROR):
+            # a missing, truncated or corrupt file is built again
+            return False
+        for (name, _), table, shift in zip(CALIB_CACHE_TABLES, tables, shifts):
+            setattr(self, name, table)
+            setattr(self, name + '_shift', shift)
+        return True
+
+    def _save_tables(self, path, checksum):
+        # Failing to save only costs time on the next boot, so carry on
+        try:
+            with open(path, 'wb') as file:
+                file.write(struct.pack(CALIB_CACHE_HEADER, CALIB_CACHE_MAGIC,
+                                       CALIB_CACHE_VERSION, checksum,
+                                       *(getattr(self, name + '_shift')
+                                         for name, _ in CALIB_CACHE_TABLES)))
+                for name, _ in CALIB_CACHE_TABLES:
+                    file.write(getattr(self, name))
+        except OSError:
+            pass
+
     def _calc_pix_os_ref(self, iface, eeprom):
         offset_avg = eeprom['pix_os_average']
         occ_scale_row = 1 << eeprom['scale_occ_row']
@@ -193,8 +304,8 @@ class CameraCalibration:
                 )
 
     def _calc_pix_alpha_ref(self, iface, eeprom):
+        # yields alpha * alpha_scale
         alpha_ref = eeprom['pix_sensitivity_average']
-        alpha_scale = 1 << (eeprom['alpha_scale'] + 30)
         acc_scale_row = 1 << eeprom['scale_acc_row']
         acc_scale_col = 1 << eeprom['scale_acc_col']
         acc_scale_rem = 1 << eeprom['scale_acc_rem']
@@ -210,9 +321,10 @@ class CameraCalibration:
                     + acc_rows[row] * acc_scale_row
                     + acc_cols[col] * acc_scale_col
                     + self.pix_data[idx]['alpha'] * acc_scale_rem
-                ) / alpha_scale
+                )
 
     def _calc_pix_kta(self, eeprom):
+        # yields Kta * kta_scale_1
         # index by [row % 2][col % 2]
         kta_avg = (
             (eeprom['kta_avg_re_ce'], eeprom['kta_avg_re_co']),
@@ -224,16 +336,16 @@ class CameraCalibration:
                 idx = row * NUM_COLS + col
                 kta_ee = self.pix_data[idx]['kta']
                 kta_rc = kta_avg[row % 2][col % 2]
-                yield (kta_rc + kta_ee * self.kta_scale_2)/self.kta_scale_1
-
-    def _calc_il_offset(self):
-        for idx in range(NUM_ROWS*NUM_COLS):
-            il_pattern = idx//32 - (idx//64)*2
-            conv_pattern = (
-                ((idx-2)//4 - (idx-1)//4 + (idx+1)//4 - (idx-1)//4)
-                * (1 - 2*il_pattern)
-            )
-            yield (
-                self.il_chess_c3*(2*il_pattern - 1) 
-                - self.il_chess_c2*conv_pattern
-            )
+                yield kta_rc + kta_ee * self.kta_scale_2
+
+    def il_offset(self, idx):
+        # offset correction for a pixel read in the interleaved pattern
+        il_pattern = idx//32 - (idx//64)*2
+        conv_pattern = (
+            ((idx-2)//4 - (idx-1)//4 + (idx+1)//4 - (idx-1)//4)
+            * (1 - 2*il_pattern)
+        )
+        return (
+            self.il_chess_c3*(2*il_pattern - 1) 
+            - self.il_chess_c2*conv_pattern
+        )
@@ -0,0 +1,306 @@
+"""!
+@file frame.py
+Whole-frame operations on camera images, with interchangeable array backends.
+
+@c NumpyBackend works on a 24x32 ndarray view of an image's pixel array, with
+no copying, using @c ulab.numpy on the board or NumPy on a host. If neither is
+installed, @c PythonBackend does the same operations with plain loops over the
+flat pixel array. Both take and return their own frame objects, made with
+@c view(), so code written against one works with the other:
+@code
+    ops = get_backend()
+    frame = ops.view(pixels(image))
+    row, col = ops.argmax(frame)
+@endcode
+"""
+
+from array import array
+
+try:
+    from ulab import numpy as np
+except ImportError:
+    try:
+        import numpy as np
+    except ImportError:
+        np = None
+
+from mlx90640.calibration import NUM_ROWS, NUM_COLS
+from mlx90640.utils import array_filled
+
+
+## A 3x3 Gaussian blur kernel, row by row
+GAUSSIAN_3X3 = (
+    1/16, 1/8, 1/16,
+    1/8,  1/4, 1/8,
+    1/16, 1/8, 1/16,
+)
+
+
+def pixels(image):
+    """!
+    Find the flat array of pixel values behind an image object.
+    @param image A @c RawImage, a @c ProcessedImage or a flat array
+    @returns The array itself, not a copy
+    """
+    for name in ('pix', 'buf'):
+        data = getattr(image, name, None)
+        if data is not None:
+            return data
+    return image
+
+
+def refine_peak(data, row, col, width=NUM_COLS):
+    """!
+    Locate a peak to a fraction of a pixel by fitting a parabola through it
+    and its neighbours, across the row and down the column. Only the pixel's
+    3x3 neighbourhood of the flat array is read, so this works the same with
+    either backend.
+    @param data The flat array of pixel values
+    @param row The row of the hottest pixel, as from @c argmax()
+    @param col The column of the hottest pixel
+    @param width The number of pixels in each row
+    @returns The (row, column) of the peak as floats
+    """
+    height = len(data) // width
+    idx = row * width + col
+    peak = data[idx]
+    frac_row = frac_col = 0.0
+    if 0 < row < height - 1:
+        frac_row = _parabola_vertex(data[idx - width], peak, data[idx + width])
+    if 0 < col < width - 1:
+        frac_col = _parabola_vertex(data[idx - 1], peak, data[idx + 1])
+    return row + frac_row, col + frac_col
+
+
+def _parabola_vertex(before, peak, after):
+    # offset, from -0.5 to 0.5, of the vertex of the parabola through three
+    # evenly spaced points with the middle one highest
+    curve = before - 2*peak + after
+    if curve >= 0:
+        return 0.0
+    return (before - after) / (2*curve)
+
+
+class _Frame:
+    # a flat array seen as rows of a given width, for PythonBackend
+    __slots__ = ('data', 'width')
+
+    def __init__(self, data, width):
+        self.data = data
+        self.width = width
+
+    @property
+    def shape(self):
+        return len(self.data) // self.width, self.width
+
+
+class PythonBackend:
+    """!
+    Frame operations as plain Python loops, used when no array library is
+    available.
+    """
+    name = 'python'
+
+    def view(self, data, width=NUM_COLS):
+        """!
+        Wrap a flat pixel array as a frame without copying it.
+        """
+        return _Frame(data, width)
+
+    def argmax(self, frame):
+        """!
+        Find the hottest pixel in one pass.
+        @returns The (row, column) of the pixel
+        """
+        data = frame.data
+        best_idx = 0
+        best = data[0]
+        for idx in range(1, len(data)):
+            if data[idx] > best:
+                best_idx = idx
+                best = data[idx]
+        return divmod(best_idx, frame.width)
+
+    def convolve3x3(self, frame, kernel=GAUSSIAN_3X3):
+        """!
+        Filter a frame with a 3x3 kernel, keeping only the pixels whose
+        neighbours are all in the frame.
+        @returns A new frame two pixels narrower and two shorter
+        """
+        data = frame.data
+        width = frame.width
+        rows, cols = frame.shape
+        out_w = cols - 2
+        out = array_filled('f', (rows - 2) * out_w, 0.0)
+        k0, k1, k2, k3, k4, k5, k6, k7, k8 = kernel
+        for row in range(rows - 2):
+            top = row * width
+            mid = top + width
+            bot = mid + width
+            base = row * out_w
+            for col in range(out_w):
+                out[base + col] = (
+                    k0*data[top + col] + k1*data[top + col + 1] + k2*data[top + col + 2]
+                    + k3*data[mid + col] + k4*data[mid + col + 1] + k5*data[mid + col + 2]
+                    + k6*data[bot + col] + k7*data[bot + col + 1] + k8*data[bot + col + 2]
+                )
+        return _Frame(out, out_w)
+
+    def threshold(self, frame, level):
+        """!
+        Mark the pixels hotter than @c level.
+        @returns A frame of 1 where a pixel is above the level and 0 elsewhere
+        """
+        return _Frame(bytearray(1 if value > level else 0
+                                for value in frame.data), frame.width)
+
+    def subtract_background(self, frame, background):
+        """!
+        Subtract a background frame of the same shape, such as an average of
+        earlier frames.
+        @returns A new frame of the differences
+        """
+        return _Frame(array('f', (value - back for value, back
+                                  in zip(frame.data, background.data))),
+                      frame.width)
+
+    def centroid(self, frame, level=0):
+        """!
+        Find the centre of the heat above @c level, weighting each pixel by
+        how far above the level it is.
+        @returns The (row, column) of the centroid as floats, or @c None if no
+                 pixel is above the level
+        """
+        width = frame.width
+        total = row_sum = col_sum = 0
+        idx = 0
+        for value in frame.data:
+            if value > level:
+                weight = value - level
+                row, col = divmod(idx, width)
+                total += weight
+                row_sum += weight * row
+                col_sum += weight * col
+            idx += 1
+        if total <= 0:
+            return None
+        return row_sum / total, col_sum / total
+
+
+class NumpyBackend:
+    """!
+    Frame operations as vectorized calls on ndarrays, with @c ulab.numpy on
+    the board or NumPy on a host.
+    """
+    name = 'numpy'
+
+    def __init__(self):
+        if np is None:
+            raise ImportError("neither ulab nor numpy is available")
+        # row and column index grids for centroid(), by frame shape
+        self._grids = {}
+
+    def view(self, data, width=NUM_COLS):
+        """!
+        Wrap a flat array of 16 bit pixel values as a 2-D ndarray sharing its
+        memory.
+        """
+        frame = np.frombuffer(data, dtype=np.int16)
+        return frame.reshape((len(frame) // width, width))
+
+    def argmax(self, frame):
+        """!
+        Find the hottest pixel.
+        @returns The (row, column) of the pixel
+        """
+        return divmod(int(np.argmax(frame)), frame.shape[1])
+
+    def convolve3x3(self, frame, kernel=GAUSSIAN_3X3):
+        """!
+        Filter a frame with a 3x3 kernel, keeping only the pixels whose
+        neighbours are all in the frame. The kernel is applied as a sum of
+        nine shifted slices, as ulab has no 2-D convolution.
+        @returns A new frame two pixels narrower and two shorter
+        """
+        rows, cols = frame.shape
+        out_h = rows - 2
+        out_w = cols - 2
+        out = frame[0:out_h, 0:out_w] * kernel[0]
+        for k in range(1, 9):
+            i, j = divmod(k, 3)
+            out = out + frame[i:i + out_h, j:j + out_w] * kernel[k]
+        return out
+
+    def threshold(self, frame, level):
+        """!
+        Mark the pixels hotter than @c level.
+        @returns A boolean frame which is true where a pixel is above the level
+        """
+        return frame > level
+
+    def subtract_background(self, frame, background):
+        """!
+        Subtract a background frame of the same shape, such as an average of
+        earlier frames. The difference is worked out in floating point so that
+        it can't wrap around.
+        @returns A new frame of the differences
+        """
+        return frame * 1.0 - background
+
+    def centroid(self, frame, level=0):
+        """!
+        Find the centre of the heat above @c level, weighting each pixel by
+        how far above the level it is.
+        @returns The (row, column) of the centroid as floats, or @c None if no
+                 pixel is above the level
+        """
+        weight = frame * 1.0 - level
+        weight = weight * (weight > 0)
+        total = float(np.sum(weight))
+        if total <= 0:
+            return None
+        rows, cols = self._index_grids(frame.shape)
+        return (float(np.sum(weight * rows)) / total,
+                float(np.sum(weight * cols)) / total)
+
+    def _index_grids(self, shape):
+        grids = self._grids.get(shape)
+        if grids is None:
+            n_rows, n_cols = shape
+            rows = np.array([[row] * n_cols for row in range(n_rows)])
+            cols = np.array([list(range(n_cols))] * n_rows)
+            grids = self._grids[shape] = (rows, cols)
+        return grids
+
+
+## The backends by name
+BACKENDS = {
+    'python': PythonBackend,
+    'numpy': NumpyBackend,
+}
+
+
+def get_backend(name=None):
+    """!
+    Make a frame backend.
+    @param name @c 'numpy' or @c 'python', or @c None to use @c 'numpy' if
+           ulab or NumPy can be imported and @c 'python' otherwise
+    @returns A new backend object
+    """
+    if name is None:
+        name = 'python' if np is None else 'numpy'
+    return BACKENDS[name]()
+
+
+## @cond NO_DOXY
+# Check that the backends agree on a made-up frame
+if __name__ == "__main__":
+    test = array('h', ((idx * 37) % 101 - 50 for idx in range(NUM_ROWS * NUM_COLS)))
+    test[5 * NUM_COLS + 9] = 500
+    for ops in (get_backend('python'),) + ((get_backend('numpy'),) if np else ()):
+        frame = ops.view(test)
+        print(f"{ops.name}: argmax {ops.argmax(frame)}, "
+              f"blurred argmax {ops.argmax(ops.convolve3x3(frame))}, "
+              f"centroid {ops.centroid(frame, 40)}, "
+              f"refined peak {refine_peak(test, *ops.argmax(frame))}")
+## @endcond
@@ -3,13 +3,13 @@
 This file contains image storage and processing classes for the MLX90640 camera
 driver.
 
-RAW VERSION
-This version is a stripped down MLX90640 driver which produces only raw data,
-not calibrated data, in order to save memory.
+RawImage holds the raw pixel data. ProcessedImage turns it into temperatures,
+one subpage at a time, into a single 16 bit buffer so that the calibrated
+driver fits in memory beside the raw one. FrameRing holds a few finished
+frames, so that one can be filled while another is being used.
 """
 
 import math
-import struct
 from array import array
 from ucollections import namedtuple
 from mlx90640.utils import (
@@ -20,17 +20,41 @@ from mlx90640.utils import (
 )
 
 from mlx90640.regmap import REG_SIZE
-from mlx90640.calibration import NUM_COLS, IMAGE_SIZE, TEMP_K
+from mlx90640.calibration import NUM_ROWS, NUM_COLS, IMAGE_SIZE, TEMP_K
 
 PIX_STRUCT_FMT = '>h'
 PIX_DATA_ADDRESS = const(0x0400)
 
+_FULL_FRAME_RUNS = ((0, IMAGE_SIZE),)
+
 class _BasePattern:
+    # per-subpage lookup tables, filled in by _build_tables() at import
+    _sp_idx = None
+    _sp_rows = None
+    _sp_runs = None
+    # the subpage of each pixel
+    _sp_of = None
+
     @classmethod
-    def sp_range(cls, sp_id):
-        return (
-            idx for idx, sp in enumerate(cls.iter_sp()) 
-            if sp == sp_id
+    def sp_range(cls, sp_id, first_row=0, last_row=NUM_ROWS):
+        table = cls._sp_idx[sp_id]
+        if first_row == 0 and last_row == NUM_ROWS:
+            return table
+        rows = cls._sp_rows[sp_id]
+        return memoryview(table)[rows[first_row]:rows[last_row]]
+
+    @classmethod
+    def sp_runs(cls, sp_id, first_row=0, last_row=NUM_ROWS):
+        runs = cls._sp_runs[sp_id]
+        if first_row == 0 and last_row == NUM_ROWS:
+            return runs
+        # clip the runs to the requested rows
+        lo = first_row * NUM_COLS
+        hi = last_row * NUM_COLS
+        return tuple(
+            (max(start, lo), min(start + count, hi) - max(start, lo))
+            for start, count in runs
+            if start < hi and start + count > lo
         )
 
     @classmethod
@@ -39,6 +63,50 @@ class _BasePattern:
             cls.get_sp(idx) for idx in range(IMAGE_SIZE)
         )
 
+    @classmethod
+    def _build_tables(cls):
+        # Pixel indices of each subpage, ascending, and the runs of RAM
+        # (word offset, word count) which hold them. A run covers whole rows
+        # so that neighbouring rows of a subpage merge into one I2C read.
+        # In the interleaved pattern a subpage has every other row, so only
+        # its own rows are read. In the chess pattern every row holds both
+        # subpages, a word each in turn, so a subpage is read as the whole
+        # block: twice the bytes of its pixels, but reading those alone
+        # would take a transaction per word, whose address bytes would cost
+        # more bus time than the words they save (see the test code below).
+        sp_idx = (array('H'), array('H'))
+        sp_of = bytearray(IMAGE_SIZE)
+        for idx, sp in enumerate(cls.iter_sp()):
+            sp_idx[sp].append(idx)
+            sp_of[idx] = sp
+
+        # position in each index table at which every row starts, so that a
+        # band of rows can be read on its own
+        sp_rows = (array('H'), array('H'))
+        for sp_id, table in enumerate(sp_idx):
+            pos = 0
+            for row in range(NUM_ROWS + 1):
+                while pos < len(table) and table[pos] < row * NUM_COLS:
+                    pos += 1
+                sp_rows[sp_id].append(pos)
+
+        sp_runs = ([], [])
+        for sp_id, table in enumerate(sp_idx):
+            runs = sp_runs[sp_id]
+            for idx in table:
+                row_start = idx - idx % NUM_COLS
+                if runs and runs[-1][0] + runs[-1][1] >= row_start:
+                    # same row as the last run, or the row right after it
+                    start = runs[-1][0]
+                    runs[-1] = (start, row_start + NUM_COLS - start)
+                else:
+                    runs.append((row_start, NUM_COLS))
+
+        cls._sp_idx = sp_idx
+        cls._sp_of = sp_of
+        cls._sp_rows = sp_rows
+        cls._sp_runs = tuple(tuple(runs) for runs in sp_runs)
+
 class ChessPattern(_BasePattern):
     pattern_id = 0x1
 
@@ -57,17 +125,145 @@ _READ_PATTERNS = {
     pat.pattern_id : pat for pat in (ChessPattern, InterleavedPattern)
 }
 
+for pat in _READ_PATTERNS.values():
+    pat._build_tables()
+
 def get_pattern_by_id(pattern_id):
     return _READ_PATTERNS.get(pattern_id)
 
 
 class Subpage:
+    # the rows and columns which are read of this subpage
+    first_row = 0
+    last_row = NUM_ROWS
+    first_col = 0
+    last_col = NUM_COLS
+
     def __init__(self, pattern, sp_id):
         self.pattern = pattern
         self.id = sp_id
 
-    def sp_range(self):
-        return self.pattern.sp_range(self.id)
+    def sp_range(self, first_row=0, last_row=NUM_ROWS):
+        return self.pattern.sp_range(self.id, first_row, last_row)
+
+    def sp_runs(self, first_row=0, last_row=NUM_ROWS):
+        return self.pattern.sp_runs(self.id, first_row, last_row)
+
+    def band(self, first_row=0, last_row=NUM_ROWS):
+        # every pixel of both subpages in a band of rows
+        return range(first_row * NUM_COLS, last_row * NUM_COLS)
+
+    def fill(self, pix, first_row, last_row):
+        # Replace the other subpage's pixels in a band of rows with the
+        # average of their neighbours above, below and to each side which
+        # belong to this subpage, so that the image is all from this
+        # subpage's measurement at half the resolution. Only neighbours read
+        # with this subpage are used, so the row below the band must have
+        # been read already, unless it is the last row read.
+        sp_of = self.pattern._sp_of
+        sp_id = self.id
+        top = self.first_row
+        bottom = self.last_row - 1
+        left = self.first_col
+        right = self.last_col - 1
+        for row in range(first_row, last_row):
+            idx = row * NUM_COLS + left
+            for col in range(left, right + 1):
+                if sp_of[idx] != sp_id:
+                    total = 0
+                    count = 0
+                    if row > top and sp_of[idx - NUM_COLS] == sp_id:
+                        total += pix[idx - NUM_COLS]
+                        count += 1
+                    if row < bottom and sp_of[idx + NUM_COLS] == sp_id:
+                        total += pix[idx + NUM_COLS]
+                        count += 1
+                    if col > left and sp_of[idx - 1] == sp_id:
+                        total += pix[idx - 1]
+                        count += 1
+                    if col < right and sp_of[idx + 1] == sp_id:
+                        total += pix[idx + 1]
+                        count += 1
+                    if count:
+                        pix[idx] = total // count
+                idx += 1
+
+
+class WindowSubpage(Subpage):
+    """!
+    The part of a subpage which lies in a window of rows and columns, used to
+    read a region of interest rather than the whole subpage. Each row of the
+    window is fetched with one I2C transaction, and rows which span the full
+    width are merged into one. The tables of pixels and RAM runs are worked
+    out once, when the window is made.
+    """
+
+    def __init__(self, pattern, sp_id, first_row, last_row, first_col,
+                 last_col):
+        super().__init__(pattern, sp_id)
+        first_row = max(0, min(first_row, NUM_ROWS - 1))
+        last_row = max(first_row + 1, min(last_row, NUM_ROWS))
+        first_col = max(0, min(first_col, NUM_COLS - 1))
+        last_col = max(first_col + 1, min(last_col, NUM_COLS))
+        self.first_row = first_row
+        self.last_row = last_row
+        self.first_col = first_col
+        self.last_col = last_col
+        width = last_col - first_col
+        # every pixel of the window, row by row, and those of this subpage,
+        # with the position in that table at which each row starts
+        self._all = array('H')
+        self._idx = array('H')
+        self._rows = array('H')
+        # the RAM run of each row, or None for rows without this subpage
+        self._row_runs = []
+        for row in range(first_row, last_row):
+            self._rows.append(len(self._idx))
+            start = row * NUM_COLS + first_col
+            for idx in range(start, start + width):
+                self._all.append(idx)
+            for idx in pattern.sp_range(sp_id, row, row + 1):
+                if first_col <= idx % NUM_COLS < last_col:
+                    self._idx.append(idx)
+            has_pixels = len(self._idx) > self._rows[-1]
+            self._row_runs.append((start, width) if has_pixels else None)
+        self._rows.append(len(self._idx))
+
+    def sp_range(self, first_row=None, last_row=None):
+        first_row, last_row = self._clip(first_row, last_row)
+        return memoryview(self._idx)[self._rows[first_row]:
+                                     self._rows[last_row]]
+
+    def sp_runs(self, first_row=None, last_row=None):
+        first_row, last_row = self._clip(first_row, last_row)
+        runs = []
+        for run in self._row_runs[first_row:last_row]:
+            if run is None:
+                continue
+            if runs and runs[-1][0] + runs[-1][1] == run[0]:
+                runs[-1] = (runs[-1][0], runs[-1][1] + run[1])
+            else:
+                runs.append(run)
+        return runs
+
+    def band(self, first_row=None, last_row=None):
+        first_row, last_row = self._clip(first_row, last_row)
+        width = self.last_col - self.first_col
+        return memoryview(self._all)[first_row * width:last_row * width]
+
+    def contains(self, row, col):
+        # whether a point, in pixels, lies in the window
+        return (self.first_row <= row < self.last_row
+                and self.first_col <= col < self.last_col)
+
+    def _clip(self, first_row, last_row):
+        # rows of the image to rows of the window
+        first_row = self.first_row if first_row is None \
+            else max(first_row, self.first_row)
+        last_row = self.last_row if last_row is None \
+            else min(last_row, self.last_row)
+        return first_row - self.first_row, max(first_row, last_row) \
+            - self.first_row
 
 
 ## Image Buffers
@@ -75,16 +271,104 @@ class Subpage:
 class RawImage:
     def __init__(self):
         self.pix = array_filled('h', IMAGE_SIZE)
+        # staging area for the whole pixel RAM block, allocated once so that
+        # a frame can be fetched with a single I2C transaction
+        self._buf = bytearray(IMAGE_SIZE * REG_SIZE)
+        self._view = memoryview(self._buf)
 
     def __getitem__(self, idx):
         return self.pix[idx]
 
-    def read(self, iface, update_idx = None):
-        buf = bytearray(REG_SIZE)
-        update_idx = update_idx or range(IMAGE_SIZE)
+    def read(self, iface, update_idx = None, runs = None, into = None):
+        # The camera auto-increments the RAM address, so each run of
+        # (word offset, word count) comes over in a single transaction; by
+        # default that is the whole 0x0400-0x06FF block. Only the pixels in
+        # update_idx are decoded, into self.pix or the array given as into;
+        # the rest of that array is left alone. The staging area keeps every
+        # word as last read, so pixels outside the runs may be decoded too.
+        buf = self._buf
+        pix = self.pix if into is None else into
+        if runs is None:
+            runs = _FULL_FRAME_RUNS
+        for start, count in runs:
+            pos = start * REG_SIZE
+            iface.read_into(PIX_DATA_ADDRESS + start,
+                            self._view[pos:pos + count * REG_SIZE])
+        if update_idx is None:
+            update_idx = range(IMAGE_SIZE)
         for offset in update_idx:
-            iface.read_into(PIX_DATA_ADDRESS + offset, buf)
-            self.pix[offset] = struct.unpack(PIX_STRUCT_FMT, buf)[0]
+            pos = offset * REG_SIZE
+            # big-endian, two's complement word (PIX_STRUCT_FMT) decoded
+            # without going through struct.unpack
+            value = buf[pos] << 8 | buf[pos + 1]
+            if value & 0x8000:
+                value -= 0x10000
+            pix[offset] = value
+
+
+class FrameRing:
+    """!
+    A ring of two or three preallocated frames, each a flat array of pixels
+    with a sequence number, the time it was taken and the turret's pose then.
+
+    The reader fills the back frame while the frame handed over last is used,
+    and frames change hands by swapping indices, so nothing is copied. With
+    two frames, a frame stays whole until the next one has been handed over;
+    with three, it also stays whole while the frame after that is filled, so
+    consecutive frames can be compared without copying either.
+    """
+
+    def __init__(self, slots=2):
+        if not 2 <= slots <= 3:
+            raise ValueError("a frame ring has two or three slots")
+        self.pix = tuple(array_filled('h', IMAGE_SIZE) for _ in range(slots))
+        # sequence number of the frame in each slot, counting from 1
+        self.seqs = array('l', (0 for _ in range(slots)))
+        # when each frame was taken, from utime.ticks_ms()
+        self.stamps = array('l', (0 for _ in range(slots)))
+        # the (yaw, pitch) at which each frame was taken, or None
+        self.poses = [None] * slots
+        self.clear()
+
+    def clear(self):
+        self.seq = 0
+        # frames published but replaced before being taken
+        self.dropped = 0
+        self._back = 0
+        self._ready = -1
+        self._front = -1
+
+    @property
+    def back(self):
+        # the array which the reader fills next
+        return self.pix[self._back]
+
+    def publish(self, stamp_ms, pose=None):
+        # finish the back frame and make it the one handed over next; the
+        # new back frame is one neither handed over nor waiting, or with two
+        # slots, the one handed over last, which the reader now takes back
+        back = self._back
+        self.seq = (self.seq + 1) & 0x3FFFFFFF
+        self.seqs[back] = self.seq
+        self.stamps[back] = stamp_ms
+        self.poses[back] = pose
+        if self._ready >= 0:
+            self.dropped += 1
+        self._ready = back
+        for slot in range(len(self.pix)):
+            if slot != back and slot != self._front:
+                self._back = slot
+                break
+        else:
+            self._back = self._front
+
+    def take(self):
+        # hand over the newest published frame; returns its slot or -1
+        slot = self._ready
+        if slot >= 0:
+            self._front = slot
+            self._ready = -1
+        return slot
 
 
 ImageLimits = namedtuple('ScaleLimits', ('min_h', 'max_h', 'min_idx', 'max_idx'))
@@ -96,123 +380,178 @@ _INTERP_NEIGHBOURS = tuple(
     if row != 0 or col != 0
 )
 
-# class ProcessedImage:
-#     def __init__(self, calib):
-#         # pix_data should be a sequence of ints
-#         self.calib = calib
-#         self.v_ir = array_filled('f', IMAGE_SIZE, 0.0)
-#         self.alpha = array_filled('f', IMAGE_SIZE, 1.0)
-#         self.buf = array_filled('f', IMAGE_SIZE, 1.0)
-# 
-#     def update(self, pix_data, subpage, state):
-#         if self.calib.use_tgc:
-#             pix_os_cp = self._calc_os_cp(subpage, state)
-#             pix_alpha_cp = self.calib.pix_alpha_cp[subpage.id]
-# 
-#         for idx, raw in pix_data:
-#             ## IR data compensation - offset, Vdd, and Ta
-#             kta = self.calib.pix_kta[idx]
-# 
-#             row, col = divmod(idx, NUM_COLS)
-#             kv = self.calib.kv_avg[row % 2][col % 2]
-#             
-#             offset = self.calib.pix_os_ref[idx]
-#             offset *= (1 + kta*state.ta)*(1 + kv*state.vdd)
-# 
-#             v_os = raw*state.gain - offset
-#             if subpage.pattern is InterleavedPattern:
-#                 v_os += self.calib.il_offset[idx]
-#             v_ir = v_os / self.calib.emissivity
-# 
-#             ## IR data gradient compensation
-#             if self.calib.use_tgc:
-#                 v_ir -= self.calib.tgc*pix_os_cp
-# 
-#             # preserve v_ir for temperature calculations
-#             self.v_ir[idx] = v_ir
-# 
-#             alpha = self._calc_alpha(idx, state.ta)
-#             self.buf[idx] = v_ir/alpha
-# 
-#     def _calc_os_cp(self, subpage, state):
-#         pix_os_cp = self.calib.pix_os_cp[subpage.id]
-#         if subpage.pattern is InterleavedPattern:
-#             pix_os_cp += self.calib.il_chess_c1
-#         return state.gain_cp[subpage.id] - pix_os_cp*(1 + self.calib.kta_cp*state.ta)*(1 + self.calib.kv_cp*state.vdd)
-# 
-#     def _calc_os_cp2(self, pattern, state):
-#         pix_os_cp = list(self.calib.pix_os_cp)
-#         if pattern is InterleavedPattern:
-#             for i in range(len(pix_os_cp)):
-#                 pix_os_cp[i] += self.calib.il_chess_c1
-# 
-#         k = (1 + self.calib.kta_cp*state.ta)*(1 + self.calib.kv_cp*state.vdd)
-#         return [
-#             gain_cp_sp - pix_os_cp_sp*k
-#             for pix_os_cp_sp, gain_cp_sp in zip(pix_os_cp, state.gain_cp)
-#         ]
-# 
-#     def _calc_alpha(self, idx, ta):
-#         alpha = self.calib.pix_alpha[idx]
-#         if self.calib.use_tgc:
-#             alpha -= self.calib.tgc*pix_alpha_cp
-#         alpha *= (1 + self.calib.ksta*ta)
-#         return alpha
-# 
-#     def _calc_to(self, idx, alpha, ta_r):
-#         v_ir = self.v_ir[idx]
-# 
-#         s_x = v_ir*(alpha**3) + ta_r*(alpha**4)
-#         s_x = math.sqrt(math.sqrt(s_x))*self.calib.ksto[1]
-# 
-#         to = v_ir/(alpha*(1 - TEMP_K*self.calib.ksto[1]) + s_x) + ta_r
-#         to = math.sqrt(math.sqrt(to)) - TEMP_K
-#         return to + self.calib.drift
-# 
-#     def calc_temperature(self, idx, state):
-#         alpha = self._calc_alpha(idx, state.ta)
-#         return self._calc_to(idx, alpha, state.ta_r)
-# 
-#     def calc_temperature_ext(self, idx, state):
-#         v_ir = self.v_ir[idx]
-#         alpha = self._calc_alpha(idx, state.ta)
-#         to = self._calc_to(idx, alpha, state.ta_r)
-# 
-#         band = self._get_range_band(to)
-#         if band < 0:
-#             return self.calib.ct[0]
-# 
-#         alpha_ext = self.calib.alpha_ext[band]
-#         ksto_ext = self.calib.ksto[band]
-#         ct = self.calib.ct[band]
-#         to_ext = v_ir/(alpha*alpha_ext*(1 + ksto_ext*(to - ct))) + state.ta_r
-#         to_ext = math.sqrt(math.sqrt(to_ext)) - TEMP_K
-#         return to_ext  + self.calib.drift
-# 
-#     def _get_range_band(self, t):
-#         return sum(1 for ct in self.calib.ct if t >= ct) - 1
-# 
-#     def calc_limits(self, *, exclude_idx=()):
-#         # find min/max in place to keep mem usage down
-#         min_h, min_idx = None, None
-#         max_h, max_idx = None, None
-#         for idx, h in enumerate(self.buf):
-#             if idx in exclude_idx:
-#                 continue
-#             if min_h is None or h < min_h:
-#                 min_h, min_idx = h, idx
-#             if max_h is None or h > max_h:
-#                 max_h, max_idx = h, idx
-#         return ImageLimits(min_h, max_h, min_idx, max_idx)
-# 
-#     def interpolate_bad_pixels(self, bad_pixels):
-#         for bad_idx in bad_pixels:
-#             count = 0
-#             total = 0
-#             for offset in _INTERP_NEIGHBOURS:
-#                 idx = bad_idx + offset
-#                 if idx in range(IMAGE_SIZE) and idx not in bad_pixels:
-#                     count += 1
-#                     total += self.buf[idx]
-#             if count > 0:
-#                 self.buf[bad_idx] = total/count
+# temperatures are kept as hundredths of a degree C
+TEMP_SCALE = const(100)
+
+class ProcessedImage:
+    def __init__(self, calib):
+        # only the output buffer is kept; the intermediate values for each
+        # pixel are worked out and used straight away
+        self.calib = calib
+        self.buf = array_filled('h', IMAGE_SIZE)
+
+    def __getitem__(self, idx):
+        return self.buf[idx]
+
+    def update(self, raw, subpage, state, first_row=0, last_row=NUM_ROWS,
+               into=None):
+        # work out the temperatures of one subpage's pixels in a band of rows
+        # in place, in self.buf or the array given as into; pixels of the
+        # other subpage keep their last values
+        calib = self.calib
+        pix = raw.pix
+        buf = self.buf if into is None else into
+        pix_os_ref = calib.pix_os_ref
+        pix_kta = calib.pix_kta
+        pix_alpha = calib.pix_alpha
+        interleaved = subpage.pattern is InterleavedPattern
+
+        # everything which is the same for the whole subpage
+        gain = state.gain
+        kta_ta = state.ta / calib.pix_kta_scale
+        kv_vdd = tuple(
+            1 + kv*state.vdd
+            for kv_row in calib.kv_avg for kv in kv_row
+        )
+        inv_emissivity = 1/calib.emissivity
+        alpha_k = (1 + calib.ksta*state.ta)/calib.pix_alpha_scale
+        tgc_os = tgc_alpha = 0
+        if calib.use_tgc:
+            tgc_os = calib.tgc*self._calc_os_cp(subpage, state)
+            tgc_alpha = calib.tgc*calib.pix_alpha_cp[subpage.id]*(1 + calib.ksta*state.ta)
+        ksto2 = calib.ksto[1]
+        alpha_ksto = 1 - TEMP_K*ksto2
+        ta_r = state.ta_r
+        to_k = TEMP_K - calib.drift
+        sqrt = math.sqrt
+
+        for idx in subpage.sp_range(first_row, last_row):
+            ## IR data compensation - offset, Vdd, and Ta
+            kv = kv_vdd[(idx // NUM_COLS & 1) << 1 | idx & 1]
+            offset = pix_os_ref[idx]*(1 + pix_kta[idx]*kta_ta)*kv
+            v_ir = pix[idx]*gain - offset
+            if interleaved:
+                v_ir += calib.il_offset(idx)
+            v_ir = v_ir*inv_emissivity - tgc_os
+
+            ## normalizing to sensitivity
+            alpha = pix_alpha[idx]*alpha_k - tgc_alpha
+            if alpha <= 0:
+                continue    # failed pixel, leave its last value
+
+            ## object temperature
+            alpha_3 = alpha*alpha*alpha
+            s_x = v_ir*alpha_3 + ta_r*alpha_3*alpha
+            s_x = sqrt(sqrt(s_x))*ksto2 if s_x > 0 else 0
+            to = v_ir/(alpha*alpha_ksto + s_x) + ta_r
+            to = sqrt(sqrt(to)) - to_k if to > 0 else -TEMP_K
+            to = int(to*TEMP_SCALE)
+            buf[idx] = -0x8000 if to < -0x8000 else 0x7FFF if to > 0x7FFF else to
+
+    def _calc_os_cp(self, subpage, state):
+        pix_os_cp = self.calib.pix_os_cp[subpage.id]
+        if subpage.pattern is InterleavedPattern:
+            pix_os_cp += self.calib.il_chess_c1
+        return state.gain_cp[subpage.id] - pix_os_cp*(1 + self.calib.kta_cp*state.ta)*(1 + self.calib.kv_cp*state.vdd)
+
+    def calc_limits(self, *, exclude_idx=()):
+        # find min/max in place to keep mem usage down
+        min_h, min_idx = None, None
+        max_h, max_idx = None, None
+        for idx, h in enumerate(self.buf):
+            if idx in exclude_idx:
+                continue
+            if min_h is None or h < min_h:
+                min_h, min_idx = h, idx
+            if max_h is None or h > max_h:
+                max_h, max_idx = h, idx
+        return ImageLimits(min_h, max_h, min_idx, max_idx)
+
+    def interpolate_bad_pixels(self, bad_pixels):
+        for bad_idx in bad_pixels:
+            count = 0
+            total = 0
+            for offset in _INTERP_NEIGHBOURS:
+                idx = bad_idx + offset
+                if idx in range(IMAGE_SIZE) and idx not in bad_pixels:
+                    count += 1
+                    total += self.buf[idx]
+            if count > 0:
+                self.buf[bad_idx] = total//count
+
+
+## @cond NO_DOXY
+# Count the I2C traffic needed to read one full frame (both subpages) through a
+# stand-in bus which records transactions instead of talking to a camera, and
+# compare the cost of producing each subpage's pixel indices by scanning the
+# pattern (as was done before the tables existed) with iterating the tables
+if __name__ == "__main__":
+    from mlx90640.regmap import CameraInterface
+
+    # On a PC, where utime is the simulation's virtual clock, time the host's
+    # CPU; on the board, its microsecond ticks
+    try:
+        from time import perf_counter
+
+        def ticks_us():
+            return int(perf_counter() * 1000000)
+
+        def ticks_diff(end, start):
+            return end - start
+    except ImportError:
+        from utime import ticks_us, ticks_diff
+
+    class _CountingBus:
+        # counts transactions and bytes, and the time on the wire at 400 kHz:
+        # nine clocks a byte, with a start, the device address, a 16 bit
+        # RAM address and a repeated start and device address before the data
+        def __init__(self):
+            self.transactions = 0
+            self.nbytes = 0
+            self.wire_us = 0
+
+        def readfrom_mem_into(self, addr, mem_addr, buf, addrsize=8):
+            self.transactions += 1
+            self.nbytes += len(buf)
+            self.wire_us += (2 + addrsize // 8 + len(buf)) * 9 * 1000000 // 400000
+
+    def _scan_sp_range(pat, sp_id):
+        return (idx for idx, sp in enumerate(pat.iter_sp()) if sp == sp_id)
+
+    def _pixel_runs(pat, sp_id):
+        # runs which hold a subpage's pixels and nothing else
+        runs = []
+        for idx in pat.sp_range(sp_id):
+            if runs and runs[-1][0] + runs[-1][1] == idx:
+                runs[-1] = (runs[-1][0], runs[-1][1] + 1)
+            else:
+                runs.append((idx, 1))
+        return runs
+
+    image = RawImage()
+    for pat in (ChessPattern, InterleavedPattern):
+        for label, runs_of in (('as read', pat.sp_runs),
+                               ('pixels only', lambda sp_id: _pixel_runs(pat, sp_id))):
+            bus = _CountingBus()
+            iface = CameraInterface(bus, 0x33)
+            start = ticks_us()
+            for sp_id in (0, 1):
+                image.read(iface, pat.sp_range(sp_id), runs_of(sp_id))
+            elapsed = ticks_diff(ticks_us(), start)
+            print(f"{pat.__name__} {label}: {bus.transactions} transactions, "
+                  f"{bus.nbytes} bytes, {bus.wire_us} us on the wire, "
+                  f"{elapsed} us per frame")
+
+        start = ticks_us()
+        for sp_id in (0, 1):
+            for idx in _scan_sp_range(pat, sp_id):
+                pass
+        scan_us = ticks_diff(ticks_us(), start)
+        start = ticks_us()
+        for sp_id in (0, 1):
+            for idx in pat.sp_range(sp_id):
+                pass
+        table_us = ticks_diff(ticks_us(), start)
+        print(f"{pat.__name__}: index generation {scan_us} us scanned, "
+              f"{table_us} us from tables per frame")
+## @endcond
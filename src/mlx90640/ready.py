@@ -0,0 +1,144 @@
+"""!
+@file ready.py
+This file contains a clock which predicts when the MLX90640 camera will next
+have a subpage ready, so that its status register need only be polled around
+that time.
+
+The camera measures subpages at its refresh rate, timed by its own oscillator,
+which may run a few percent away from the nominal rate. Each status read is
+stamped with utime.ticks_us(), and when one finds data after the last subpage
+was acknowledged, the data-ready edge lies between it and the read before;
+the period between edges is learned from those, and the next edge predicted
+from the last one.
+"""
+
+from utime import ticks_add, ticks_diff
+
+# polling starts this long before a predicted edge, at the least
+GUARD_MIN_US = const(1000)
+# and at first, before any edges have been seen
+GUARD_START_US = const(10000)
+# an edge is only bracketed if the read before was this close to it
+BRACKET_MAX_US = const(20000)
+# the period is learned with a gain of 1 / n for the first n edges, to this
+PERIOD_GAIN_MAX = const(8)
+
+
+class ReadyClock:
+    """!
+    Follows the camera's data-ready edges and predicts the next one.
+
+    The driver feeds it every status read through @c observe(), and arms it
+    with @c arm() when the data available flag is cleared. A read which finds
+    data while it's armed is taken as the next edge. If the read before it
+    didn't find data and was close enough, the edge is put halfway between
+    them, and the period is learned and the polling guard narrowed from how
+    far the edge was from where it was predicted; if not, the edge is only
+    known to be no later than the read, and the guard is widened.
+    """
+
+    def __init__(self, period_us=None):
+        self.reset(period_us)
+
+    def reset(self, period_us=None):
+        # the nominal subpage period; None until the driver has read it
+        self.period_us = None if period_us is None else int(period_us)
+        # when the last edge came, from utime.ticks_us(), or None
+        self.edge_us = None
+        # how long before a predicted edge polling starts
+        self.guard_us = GUARD_START_US
+        # status reads since the last edge, and how many it took to find it
+        self.polls = 0
+        self.edge_polls = 0
+        # time from the last edge to the read which found it, and the width
+        # of the span between reads it was found in, or None if it wasn't
+        # bracketed and could have come any time before the read
+        self.latency_us = 0
+        self.bracket_us = None
+        # how far the last bracketed edge was from its prediction
+        self.error_us = 0
+        self._armed = True
+        self._miss_us = None
+        self._bracketed = False
+        self._learned = 0
+
+    def arm(self):
+        # the data available flag has been cleared; the next read which
+        # finds data has found the next edge
+        self._armed = True
+        self._miss_us = None
+
+    def predict(self, now):
+        # the edge after the last one seen which is nearest 'now', but not
+        # before the next one; None if not known
+        edge = self.edge_us
+        period = self.period_us
+        if edge is None or period is None:
+            return None
+        count = (ticks_diff(now, edge) + period // 2) // period
+        return ticks_add(edge, max(1, count) * period)
+
+    def due_in(self, now):
+        # microseconds until polling the status register is worthwhile,
+        # zero or less to poll now, or None if no edge has been seen
+        if not self._armed:
+            return 0
+        edge = self.edge_us
+        if edge is None or self.period_us is None:
+            return None
+        predicted = ticks_add(edge, self.period_us)
+        miss = self._miss_us
+        if miss is not None \
+                and ticks_diff(miss, predicted) > self.period_us // 2:
+            # nothing came near the predicted edge; wait for the one after
+            predicted = self.predict(miss)
+        return ticks_diff(predicted, now) - self.guard_us
+
+    def observe(self, now, has_data):
+        # a status read made at utime.ticks_us() 'now'
+        self.polls += 1
+        if not self._armed:
+            return
+        if not has_data:
+            self._miss_us = now
+            return
+
+        self._armed = False
+        last = self.edge_us
+        period = self.period_us
+        miss = self._miss_us
+        bracketed = miss is not None \
+            and ticks_diff(now, miss) <= BRACKET_MAX_US
+        if bracketed:
+            edge = ticks_add(miss, ticks_diff(now, miss) // 2)
+        elif last is not None and ticks_diff(now, last) >= period:
+            # only known to be no later than now; take the last edge
+            # predicted before then
+            edge = ticks_add(last, ticks_diff(now, last) // period * period)
+        else:
+            edge = now
+
+        if last is not None:
+            span = ticks_diff(edge, last)
+            count = (span + period // 2) // period
+            if bracketed:
+                error = span - count * period
+                self.error_us = error
+                if self._bracketed and count > 0:
+                    if self._learned < PERIOD_GAIN_MAX:
+                        self._learned += 1
+                    self.period_us = period \
+                        + (span // count - period) // self._learned
+                target = max(GUARD_MIN_US, 2 * abs(error))
+                self.guard_us = (self.guard_us + target) // 2
+            else:
+                # the edge came before polling started, or polling started
+                # late
+                self.guard_us = min(2 * self.guard_us, period // 4)
+
+        self.edge_us = edge
+        self._bracketed = bracketed
+        self.bracket_us = ticks_diff(now, miss) if bracketed else None
+        self.latency_us = ticks_diff(now, edge)
+        self.edge_polls = self.polls
+        self.polls = 0
@@ -27,14 +27,14 @@ REGISTER_MAP = {
         field_desc('data_hold',         1,  2),
         field_desc('subpage_repeat',    1,  3),
         field_desc('repeat_select',     3,  4),
-        field_desc('refresh_rate',      6,  7),
+        field_desc('refresh_rate',      3,  7),
         field_desc('adc_resolution',    2, 10),
         field_desc('read_pattern',      1, 12),
     ),
 
-    # I2C Config Register
+    # I2C Config Register; Fast-mode Plus is on at power-on, with bit 0 clear
     0x800F : (
-        field_desc('fmplus_enable',     1, 0),
+        field_desc('fmplus_disable',    1, 0),
         field_desc('i2c_levels',        1, 1),
         field_desc('sda_current_limit', 1, 2),
     ),
@@ -49,6 +49,9 @@ REGISTER_MAP = {
     0x072A : field_desc('vdd_pix',      FD_WORD, signed=True),
 }
 
+# Registers which the camera updates by itself and so must not be cached
+VOLATILE_REGISTERS = (0x8000, 0x0700, 0x0708, 0x070A, 0x0720, 0x0728, 0x072A)
+
 # Calibration Data
 EEPROM_ADDRESS = const(0x2400)
 EEPROM_SIZE    = const(0x340)
@@ -154,50 +157,131 @@ class CameraInterface:
 
 class ReadOnlyError(Exception): pass
 
+class EEPROMImage:
+    # A copy of the whole calibration EEPROM, made with one bulk read, which
+    # answers reads in place of a CameraInterface
+    def __init__(self, iface):
+        self.data = bytearray(EEPROM_SIZE * REG_SIZE)
+        self._view = memoryview(self.data)
+        iface.read_into(EEPROM_ADDRESS, self.data)
+
+    def _pos(self, mem_addr, nbytes):
+        pos = (mem_addr - EEPROM_ADDRESS) * REG_SIZE
+        if pos < 0 or pos + nbytes > len(self.data):
+            raise ValueError(f"address 0x{mem_addr:04X} is not in the EEPROM")
+        return pos
+
+    def read(self, mem_addr):
+        pos = self._pos(mem_addr, REG_SIZE)
+        return bytes(self._view[pos:pos + REG_SIZE])
+    def read_into(self, mem_addr, buf):
+        pos = self._pos(mem_addr, len(buf))
+        buf[:] = self._view[pos:pos + len(buf)]
+    def write(self, mem_addr, buf):
+        raise ReadOnlyError("the EEPROM image can't be written")
+
+    def checksum(self):
+        # Fletcher-32 over the EEPROM words; the sums stay small enough to
+        # avoid allocating long integers along the way
+        data = self.data
+        sum1 = 0
+        sum2 = 0
+        for pos in range(0, len(data), REG_SIZE):
+            sum1 = (sum1 + (data[pos] << 8 | data[pos + 1])) % 0xFFFF
+            sum2 = (sum2 + sum1) % 0xFFFF
+        return sum2 << 16 | sum1
+
 class RegisterMap:
-    def __init__(self, iface, register_map, readonly=False):
+    # Each register has a shadow copy in RAM with a Struct laid over it, both
+    # made once. Registers are read from the camera the first time they are
+    # used and after invalidate(); registers listed as volatile are read
+    # every time, since the camera changes them on its own.
+    def __init__(self, iface, register_map, readonly=False, volatile=()):
         # register_map should be a dict of { I2C address : FieldDesc(s) }
         self.iface = iface
         self.readonly = readonly
-        self._fields = self._build_lookup(register_map)
+        self.volatile = frozenset(volatile)
+        self._fields, self._shadow = self._build_lookup(register_map)
+        self._valid = set()
 
     @staticmethod
     def _build_lookup(register_map):
         lookup = {}
+        shadow = {}
         for address, fields in register_map.items():
             if isinstance(fields, FieldDesc):
                 fields = (fields,)
 
             proto = StructProto(fields)
+            buf = bytearray(REG_SIZE)
+            shadow[address] = (buf, Struct(buf, proto))
             for fld in fields:
                 if fld.name in lookup:
                     raise ValueError(f"duplicate field name: {fld.name}")
-                lookup[fld.name] = (address, proto)
+                lookup[fld.name] = address
 
-        return lookup
+        return lookup, shadow
 
     def __iter__(self):
-        return iter(self.keys())
+        return iter(self._fields)
     def __len__(self):
         return len(self._fields)
     def __contains__(self, name):
         return name in self._fields
 
-    def __getitem__(self, name):
-        address, proto = self._fields[name]
+    def _load(self, address, fresh=False):
+        buf, struct = self._shadow[address]
+        if fresh or address in self.volatile or address not in self._valid:
+            self.iface.read_into(address, buf)
+            self._valid.add(address)
+        return struct
 
-        buf = self.iface.read(address)
-        struct = Struct(buf, proto)
-        return struct[name]
+    def __getitem__(self, name):
+        return self._load(self._fields[name])[name]
 
     def __setitem__(self, name, value):
+        self.update(**{name: value})
+
+    def snapshot(self, name):
+        """!
+        Read the register holding field @c name from the camera once and
+        return it; all of its fields can then be looked up by name without
+        further bus traffic. The result is only good until the next access
+        to the same register.
+        """
+        return self._load(self._fields[name], fresh=True)
+
+    def update(self, **fields):
+        """!
+        Change several fields at once. Fields which live in the same
+        register are merged so that each register is written only once.
+        Volatile registers are modified starting from the copy made by the
+        latest read rather than being read again.
+        """
         if self.readonly:
-            raise ReadOnlyError(f"can't write to '{name}': not permitted")
+            names = ', '.join(fields)
+            raise ReadOnlyError(f"can't write to '{names}': not permitted")
+
+        dirty = []
+        for name, value in fields.items():
+            address = self._fields[name]
+            if address in self._valid:
+                struct = self._shadow[address][1]
+            else:
+                struct = self._load(address)
+            struct[name] = value
+            if address not in dirty:
+                dirty.append(address)
 
-        address, proto = self._fields[name]
+        for address in dirty:
+            self.iface.write(address, self._shadow[address][0])
 
-        buf = bytearray(REG_SIZE)
-        self.iface.read_into(address, buf)
-        struct = Struct(buf, proto)
-        struct[name] = value
-        self.iface.write(address, buf)
+    def invalidate(self, name=None):
+        """!
+        Forget the shadow copy of the register holding field @c name, or of
+        every register, so that the next access reads the camera again.
+        """
+        if name is None:
+            self._valid.clear()
+        else:
+            self._valid.discard(self._fields[name])
@@ -1,9 +1,10 @@
 """!
 @file mlx_cam.py
 
-RAW VERSION
-This version uses a stripped down MLX90640 driver which produces only raw data,
-not calibrated data, in order to save memory.
+By default this uses the MLX90640 driver in its raw mode, which produces only
+raw data, not calibrated data, in order to save memory. Calibrated images, in
+hundredths of a degree C, can be had by creating @c MLX_Cam with
+@c calibrated=True.
 
 This file contains a wrapper that facilitates the use of a Melexis MLX90640
 thermal infrared camera for general use. The wrapper contains a class MLX_Cam
@@ -27,12 +28,38 @@ example.
 
 import utime as time
 from machine import Pin, I2C
-from mlx90640 import MLX90640
+from mlx90640 import MLX90640, DataNotAvailableError
 from mlx90640.calibration import NUM_ROWS, NUM_COLS, IMAGE_SIZE, TEMP_K
-from mlx90640.image import ChessPattern, InterleavedPattern
+from mlx90640.image import (ChessPattern, InterleavedPattern, Subpage,
+                            WindowSubpage, FrameRing)
+from mlx90640.frame import get_backend, pixels, refine_peak
+from tracker import BlobDetector, Tracker
 from array import array as ar
 
 
+## The angle between the centers of neighbouring pixels, in degrees
+DEG_PER_PIXEL = 1.2566
+
+## Named acquisition profiles for MLX_Cam.set_profile() and camera_setup(): how many subpages the camera measures a
+#  second, its ADC resolution in bits, the I2C bus clock in Hz, Fast-mode Plus above 400 kHz, and how many rows
+#  acquire() reads per call so that it keeps up with the camera when run every 10 ms
+PROFILES = {
+    'tracking': {'refresh_hz': 16, 'adc_bits': 17, 'bus_hz': 1000000, 'rows_per_slice': 6},
+    'precision': {'refresh_hz': 2, 'adc_bits': 19, 'bus_hz': 400000, 'rows_per_slice': 1},
+}
+
+## How often the status register is polled while a subpage is about to be ready, in microseconds
+POLL_STEP_US = 1000
+
+## Acquisition policy: an image from each pair of subpages, both read afresh
+PAIRED = 0
+## Acquisition policy: an image from every subpage and the one before it
+SLIDING = 1
+## Acquisition policy: an image from every subpage on its own, at half the
+#  resolution
+HALF = 2
+
+
 class MLX_Cam:
     """!
     @brief   Class which wraps an MLX90640 thermal infrared camera driver to
@@ -40,7 +67,8 @@ class MLX_Cam:
     """
 
     def __init__(self, i2c, address=0x33, pattern=ChessPattern,
-                 width=NUM_COLS, height=NUM_ROWS):
+                 width=NUM_COLS, height=NUM_ROWS, calibrated=False,
+                 backend=None, blob_contrast=None, slots=2, profile=None):
         """!
         @brief   Set up an MLX90640 camera.
         @param   i2c An I2C bus which has been set up to talk to the camera;
@@ -50,6 +78,20 @@ class MLX_Cam:
                  the pixels at a time (default ChessPattern)
         @param   width The width of the image in pixels; leave it at default
         @param   height The height of the image in pixels; leave it at default
+        @param   calibrated If @c True, images hold temperatures in hundredths
+                 of a degree C rather than raw readings; this needs about
+                 5 KB more memory (default False)
+        @param   backend The array library used to process images, @c 'numpy'
+                 for ulab or NumPy or @c 'python' for plain loops; by default
+                 @c 'numpy' if it can be imported
+        @param   blob_contrast How much warmer than the image's average a
+                 pixel must be to count as part of an object when tracking;
+                 by default 200 raw counts, or 3 degrees C if calibrated
+        @param   slots The number of frames in the ring which @c acquire()
+                 fills, two or three (default 2)
+        @param   profile The name of an acquisition profile in @c PROFILES
+                 to set up the camera with, or @c None to leave it as it
+                 powered on; the bus must already run at the profile's clock
         """
         ## The I2C bus to which the camera is attached
         self._i2c = i2c
@@ -61,14 +103,97 @@ class MLX_Cam:
         self._width = width
         ## The height of the image in pixels, which should be 24
         self._height = height
+        ## Whether images are turned into temperatures
+        self._calibrated = calibrated
+        ## The whole-frame operations used to process images
+        self._ops = get_backend(backend)
+        ## Pitch, in degrees, of the middle of each row of pixels from the
+        #  center of the image
+        self._row_deg = ar('f', ((height / 2 - row) * DEG_PER_PIXEL
+                                 for row in range(height)))
+        ## Yaw, in degrees, of the middle of each column of pixels from the
+        #  center of the image
+        self._col_deg = ar('f', (-DEG_PER_PIXEL * (width / 2 - (width - col - 1))
+                                 for col in range(width)))
+        ## The threshold above the image's average for blob detection
+        if blob_contrast is None:
+            blob_contrast = 300 if calibrated else 200
+        self._blob_contrast = blob_contrast
+        # the raw contrast at the camera's power-on 18 bit ADC resolution
+        self._contrast_18 = blob_contrast
+        ## The name of the acquisition profile in use, or None
+        self.profile = None
+        # the rows acquire() reads per call unless told otherwise
+        self._rows_per_slice = 1
+        ## Finds the warm objects in each image
+        self._blobs = BlobDetector(width, height)
+        ## Follows the warm objects from image to image
+        self._tracker = Tracker()
+        ## When the last image from acquire() was taken, from utime.ticks_ms()
+        self.frame_ms = 0
+        ## The (yaw, pitch) of the turret when the last image from acquire()
+        #  was taken, if acquire() was given a way to read it
+        self.frame_pose = None
+        ## The sequence number of the last image from acquire(); a gap means
+        #  images were skipped
+        self.frame_seq = 0
+        ## The region of interest through which the last image from acquire()
+        #  was read, as a @c WindowSubpage, or @c None if it was read whole;
+        #  pixels outside the window are left from an earlier image
+        self.frame_window = None
+        ## How many times the status register was read while waiting for the
+        #  subpages of the last image from acquire()
+        self.frame_polls = 0
+        ## The time in microseconds from the camera having the last image's
+        #  newest subpage ready, as its data-ready clock puts it, to the
+        #  reading of that subpage starting, or @c None if the status reads
+        #  were too far apart to tell
+        self.frame_latency_us = None
+        # the region of interest for each subpage, if one has been set, how
+        # many subpages are read through it between full refreshes, and how
+        # many of each are left before the reading switches over
+        self._roi = None
+        self._refresh = 0
+        self._roi_left = 0
+        self._full_left = 0
+        # the size of the region of interest which follows the best track,
+        # or None if it isn't followed
+        self._follow = None
 
         # The MLX90640 object that does the work
         self._camera = MLX90640(i2c, address)
         self._camera.set_pattern(pattern)
-        self._camera.setup()
+        self._camera.setup(calibrate=calibrated)
 
-        ## A local reference to the image object within the camera driver
-        self._image = self._camera.raw
+        ## The frames filled by acquire(), one while another is being used
+        self._ring = FrameRing(slots)
+
+        if profile is not None:
+            self.set_profile(profile)
+
+    def set_profile(self, name):
+        """!
+        @brief   Set up the camera with one of the named acquisition profiles.
+        @details The refresh rate, ADC resolution and Fast-mode Plus setting
+                 are written together and read back to check that the camera
+                 took them, and @c acquire() then reads as many rows per call
+                 as the profile gives. The bus clock can't be changed here;
+                 make the bus at the profile's @c bus_hz, as
+                 @c camera_setup() does. In raw mode the blob contrast,
+                 given in counts at the camera's power-on 18 bit
+                 resolution, is scaled to the profile's resolution.
+        @param   name A key of @c PROFILES, such as @c 'tracking'
+        @raises  ConfigError If the camera doesn't take the settings
+        """
+        settings = PROFILES[name]
+        self._camera.configure(refresh_hz=settings['refresh_hz'],
+                               adc_bits=settings['adc_bits'],
+                               fmplus=settings['bus_hz'] > 400000)
+        self._rows_per_slice = settings['rows_per_slice']
+        if not self._calibrated:
+            self._blob_contrast = self._contrast_18 \
+                * 2 ** (settings['adc_bits'] - 18)
+        self.profile = name
 
     def get_image(self):
         """!
@@ -79,69 +204,454 @@ class MLX_Cam:
                  combination is sketchy and not fully tested). It is assumed
                  that the camera is in the ChessPattern (default) mode as it
                  probably should be.
+
+                 The status register is only polled, every @c POLL_STEP_US,
+                 from a little before each subpage is predicted to be ready;
+                 until the camera's data-ready times are known it's polled
+                 every 10 ms.
         @returns A reference to the image object we've just filled with data
         """
+        ready = self._camera.ready
         for subpage in (0, 1):
-            while not self._camera.has_data:
-                time.sleep_ms(10)
-                # print('.', end='')
-            image = self._camera.read_image(subpage)
+            while True:
+                wait = ready.due_in(time.ticks_us())
+                if wait is not None and wait > 0:
+                    time.sleep_us(wait)
+                try:
+                    image = self._camera.read_image(subpage)
+                    break
+                except DataNotAvailableError:
+                    # print('.', end='')
+                    if wait is None:
+                        time.sleep_ms(10)
+                    else:
+                        time.sleep_us(POLL_STEP_US)
+            if self._calibrated:
+                image = self._camera.process_image()
 
         return image
 
+    def set_roi(self, first_row, last_row, first_col, last_col, refresh=8):
+        """!
+        @brief   Read only a window of the image from now on.
+        @details @c acquire() then reads only the camera RAM which holds the
+                 window's pixels, a row per I2C transaction, and only those
+                 pixels are updated in each image, so a tracked target can be
+                 followed with a fraction of the bus time. So that targets
+                 which appear elsewhere aren't missed, every @c refresh
+                 subpages the whole image is read again, for as many
+                 subpages as there are frames in the ring, which brings both
+                 subpages of every frame up to date. The window is clipped to
+                 the image.
+        @param   first_row The first row of the window
+        @param   last_row The row after the last one in the window
+        @param   first_col The first column of the window
+        @param   last_col The column after the last one in the window
+        @param   refresh How many subpages are read through the window
+                 between full refreshes
+        """
+        self._roi = tuple(
+            WindowSubpage(self._pattern, sp_id, first_row, last_row,
+                          first_col, last_col)
+            for sp_id in (0, 1))
+        if refresh != self._refresh:
+            self._roi_left = refresh
+        self._refresh = refresh
+
+    def clear_roi(self):
+        """!
+        @brief   Read the whole image again, and stop following tracks.
+        """
+        self._roi = None
+        self._follow = None
+
+    def follow(self, rows=8, cols=10, refresh=8):
+        """!
+        @brief   Keep a window of interest centred on the best track.
+        @details Each time @c locate() finds a tracked object, the region of
+                 interest read by @c acquire() is moved to be centred on
+                 where the object was seen; until then, and whenever nothing
+                 is tracked, the whole image is read.
+        @param   rows The height of the window in pixels
+        @param   cols The width of the window in pixels
+        @param   refresh How many subpages are read through the window
+                 between full refreshes
+        """
+        self._follow = (rows, cols, refresh)
+
+    def _window_for(self, sp_id, slots):
+        # the region of interest through which to read the next subpage, or
+        # None to read it whole, counting down to and through full refreshes
+        if self._roi is None:
+            return None
+        if self._full_left:
+            self._full_left -= 1
+            return None
+        if not self._roi_left:
+            self._roi_left = self._refresh
+            self._full_left = slots - 1
+            return None
+        self._roi_left -= 1
+        return self._roi[sp_id]
+
+    def acquire(self, rows_per_slice=None, pose=None, policy=None, task=None):
+        """!
+        @brief   Assemble images a few rows at a time without blocking.
+        @details This generator spreads the reading of an image over many
+                 calls so that it can be driven from a cooperative task
+                 without holding up the other tasks. Each call either polls
+                 the camera's status register once or reads a band of
+                 @c rows_per_slice rows of the subpage which has just become
+                 available, then returns. In calibrated mode each band is
+                 turned into temperatures as soon as it has been read.
+                 @code
+                     frames = camera.acquire()
+                     while True:
+                         image = next(frames)
+                         if image is not None:
+                             use(image)
+                         yield state
+                 @endcode
+                 Images are read into the back frame of a ring of frames
+                 while the one produced last is being used, and frames change
+                 hands by index without copying, so an image stays whole
+                 until the next one is produced even if it is used over
+                 several calls. When images are produced depends on the
+                 @c policy:
+                 - @c PAIRED: after each pair of subpages, both read afresh.
+                 - @c SLIDING: after every subpage once one of each has been
+                   read. Every band read from the camera carries the other
+                   subpage's pixels as well, as last measured, so each image
+                   holds the newest two subpages at no extra bus traffic.
+                   Temperatures are only worked out for the subpage just
+                   read, so this can't be used with calibrated images.
+                 - @c HALF: after every subpage, with the other subpage's
+                   pixels filled in from their neighbours in this one, so
+                   that the whole image comes from a single measurement at
+                   half the resolution. Nothing in it is older than one
+                   subpage, and a moving object isn't split between two
+                   places.
+
+                 If a region of interest has been set with @c set_roi() or
+                 @c follow(), only its rows are read, and @c frame_window
+                 tells which part of the image is new.
+
+                 The camera driver learns from the times of its status reads
+                 when each subpage becomes ready. If the @c task running the
+                 generator is given, the status register is only read from
+                 a little before the next subpage is due: the task's period
+                 is retuned so that a run lands as that polling starts, and
+                 while it goes on the task runs every @c POLL_STEP_US; once
+                 the subpage is found the task goes back to its own period.
+                 Without a task the status register is read on every call,
+                 since skipping reads without running sooner would save bus
+                 traffic but find each subpage no sooner.
+                 @c frame_polls and @c frame_latency_us tell how many status
+                 reads each image took and how long its data waited before
+                 it began to be read. The wait is only known when the status
+                 register was being read every @c POLL_STEP_US or so as the
+                 subpage became ready, as it is when the task is retuned;
+                 otherwise @c frame_latency_us is @c None.
+        @param   rows_per_slice The number of pixel rows to read per call;
+                 one row takes about 1.5 ms on a 400 kHz bus. By default
+                 this comes from the profile set up, or is 1.
+        @param   pose A function returning the turret's (yaw, pitch) in
+                 degrees. If given, it is called as each subpage becomes
+                 available, and the pose over the subpages in the image is
+                 put in @c frame_pose when the image is produced;
+                 @c frame_ms is the time the image's subpage, or the average
+                 of the times its two subpages, became available, and
+                 @c frame_seq counts the images.
+        @param   policy When images are produced, @c PAIRED, @c SLIDING or
+                 @c HALF; by default @c SLIDING for raw images and @c PAIRED
+                 for calibrated ones
+        @param   task The @c cotask.Task which runs the generator, whose
+                 period is to be retuned to the camera, or @c None to leave
+                 the caller's timing alone
+        @returns A generator which yields @c None until an image is complete
+                 and then yields the image's array of pixels
+        """
+        calibrated = self._calibrated
+        if rows_per_slice is None:
+            rows_per_slice = self._rows_per_slice
+        if policy is None:
+            policy = PAIRED if calibrated else SLIDING
+        elif policy == SLIDING and calibrated:
+            raise ValueError("calibrated images can't be made from the last "
+                             "two subpages; use PAIRED or HALF")
+        camera = self._camera
+        ring = self._ring
+        ring.clear()
+        ready = camera.ready
+        if task is not None:
+            period_ms = normal_ms = task.period / 1000
+            step_ms = POLL_STEP_US / 1000
+        polls = 0
+        subpages_read = 0
+        last_ms = None
+        last_pose = None
+        while True:
+            if task is not None:
+                now_us = time.ticks_us()
+                wait = ready.due_in(now_us)
+                if wait is not None and wait > 0:
+                    # No subpage is due yet. Time the run after next to land
+                    # as polling starts, but never run less often than usual
+                    want_ms = (wait - task.due_in(now_us)) / 1000
+                    want_ms = min(normal_ms, max(step_ms, want_ms))
+                    if want_ms != period_ms:
+                        period_ms = want_ms
+                        task.set_period(period_ms)
+                    yield None
+                    continue
+            has_data, last_subpage = camera.read_status()
+            if not has_data:
+                if task is not None and period_ms != step_ms:
+                    period_ms = step_ms
+                    task.set_period(period_ms)
+                yield None
+                continue
+            if task is not None and period_ms != normal_ms:
+                period_ms = normal_ms
+                task.set_period(period_ms)
+            polls += ready.edge_polls
+
+            # Note when (and where) this subpage was seen
+            now_ms = time.ticks_ms()
+            now_pose = pose() if pose is not None else None
+
+            window = self._window_for(last_subpage, len(ring.pix))
+            subpage = window or Subpage(self._pattern, last_subpage)
+            if calibrated:
+                # Ambient temperature, supply and gain go with the
+                # subpage just measured, so read them before it's acked
+                state = camera.read_state()
+            # Acknowledge right away: if the camera finishes another
+            # subpage while this one is being read, the flag comes back
+            # on rather than being cleared after the fact
+            camera.ack_data()
+            back = ring.back
+            filled = subpage.first_row
+            for first_row in range(subpage.first_row, subpage.last_row,
+                                   rows_per_slice):
+                yield None
+                last_row = min(first_row + rows_per_slice, subpage.last_row)
+                if first_row == subpage.first_row:
+                    # Only known when the edge was found between two close
+                    # status reads; otherwise it may have come any time
+                    # since the read before
+                    bracket = ready.bracket_us
+                    if bracket is not None \
+                            and bracket <= 2 * POLL_STEP_US:
+                        latency_us = time.ticks_diff(time.ticks_us(),
+                                                     ready.edge_us)
+                    else:
+                        latency_us = None
+                if calibrated:
+                    camera.read_rows(subpage, first_row, last_row)
+                    camera.process_rows(subpage, first_row, last_row,
+                                        state, back)
+                else:
+                    camera.read_rows(subpage, first_row, last_row, back)
+                if policy == HALF:
+                    # each row is filled in once the row below it is read
+                    fill_to = last_row if last_row == subpage.last_row \
+                        else last_row - 1
+                    subpage.fill(back, filled, fill_to)
+                    filled = fill_to
+            subpages_read |= 1 << subpage.id
+            first_ms, first_pose = last_ms, last_pose
+            last_ms, last_pose = now_ms, now_pose
+
+            if policy == HALF:
+                # The image was taken with this subpage
+                self.frame_ms = now_ms
+                self.frame_pose = now_pose
+            elif subpages_read != 0b11:
+                continue
+            else:
+                # The image was taken between its two subpages
+                self.frame_ms = time.ticks_add(
+                    first_ms, time.ticks_diff(now_ms, first_ms) // 2)
+                if pose is not None:
+                    self.frame_pose = ((first_pose[0] + now_pose[0]) / 2,
+                                       (first_pose[1] + now_pose[1]) / 2)
+                if policy == PAIRED:
+                    subpages_read = 0
+            self.frame_window = window
+            self.frame_polls = polls
+            self.frame_latency_us = latency_us
+            polls = 0
+            ring.publish(self.frame_ms, self.frame_pose)
+            slot = ring.take()
+            self.frame_seq = ring.seqs[slot]
+            yield ring.pix[slot]
+
     def find_max(self, array):
         """!
-            @brief                  Finds the hottest pixel in an image taken
-            @details                Given an image taken, this method finds the index of the hottest pixel and converts
-                                    it to pitch and yaw degrees from the center of the image
+            @brief                  Finds the hottest spot in an image taken
+            @details                Given an image taken, this method finds the hottest pixel in one pass, locates the
+                                    peak to a fraction of a pixel from its neighbours and converts that to pitch and
+                                    yaw degrees from the center of the image
             @param  array           The image object to be analyzed
-            @return                 The delta x and delta y, in degrees, to the hottest pixel from the center of the
+            @return                 The delta y and delta x, in degrees, to the hottest spot from the center of the
                                     image
         """
-        hottest = max(array)
-        for p_idx in range(self._width * self._height - 1):
-            if array[p_idx] == hottest:
-                return [(self._height / 2 - (p_idx // self._width)) * 1.2566,
-                        -1.2566 * (self._width / 2 - (self._width - (p_idx % self._width) - 1))]
-
-    # def gaussian_filt(self, array):
-    #     matrix = []
-    #     temp_row = ar('f', [])
-    #     mask = ar('f', [1 / 16, 1 / 8, 1 / 16,
-    #                     1 / 8, 1 / 4, 1 / 8,
-    #                     1 / 16, 1 / 8, 1 / 16])
-    #     filtered_array = ar('f', [])
-    #     for p_idx in range(self._width * self._height):
-    #         if (p_idx + 1) % 32 == 0:
-    #             temp_row.append(array[p_idx])
-    #             matrix.append(temp_row)
-    #             temp_row = ar('f', [])
-    #         else:
-    #             temp_row.append(array[p_idx])
-    #     for i in range(len(matrix) - 2):
-    #         for j in range(len(matrix[i]) - 2):
-    #             mask_values = [a * b for a, b in zip(mask[0:3], matrix[i][j:j + 3])] + \
-    #                           [a * b for a, b in zip(mask[3:6], matrix[i + 1][j:j + 3])] + \
-    #                           [a * b for a, b in zip(mask[6:9], matrix[i + 2][j:j + 3])]
-    #             filtered_array.append(sum(mask_values))
-    #
-    #     return filtered_array
-    #
-    # def find_person(self, array):
-    #     filtered_array = self.gaussian_filt(array)
-    #     hottest = max(filtered_array)
-    #     for p_idx in range(len(filtered_array)):
-    #         if filtered_array[p_idx] == hottest:
-    #             return [((self._height - 2) / 2 - (p_idx // (self._width - 2))) * 1.2566,
-    #                     -1.2566 * ((self._width - 2) / 2 - ((self._width - 2) - (p_idx % (self._width - 2)) - 1))]
-
-
-def camera_setup():
+        p_idx, row, col = self.find_peak(array)
+        return self._angles(row, col)
+
+    def find_peak(self, array):
+        """!
+            @brief                  Finds the hottest pixel and the sub-pixel position of the peak around it
+            @param  array           The image object to be analyzed
+            @return                 The index of the hottest pixel, and the row and column of the peak as floats
+        """
+        data = pixels(array)
+        row, col = self._ops.argmax(self._ops.view(data, self._width))
+        p_idx = row * self._width + col
+        row, col = refine_peak(data, row, col, self._width)
+        return p_idx, row, col
+
+    def track(self, array, yaw=0.0, pitch=0.0, now_ms=None, window=None):
+        """!
+            @brief                  Finds the warm objects in an image and updates the tracks following them
+            @details                The bearing of each object is its angle from the center of the image plus the
+                                    turret's pose when the image was taken, so that an object keeps its bearing while
+                                    the turret moves.
+            @param  array           The image object to be analyzed
+            @param  yaw             The yaw of the turret, in degrees, when the image was taken
+            @param  pitch           The pitch of the turret, in degrees, when the image was taken
+            @param  now_ms          When the image was taken, from utime.ticks_ms(); now if not given
+            @param  window          The @c WindowSubpage through which the image was read, as in @c frame_window;
+                                    objects centred outside it are left out, as their pixels are old
+            @return                 The best track, or None if there are no warm objects
+        """
+        data = pixels(array)
+        level = sum(data) / len(data) + self._blob_contrast
+        count = self._blobs.detect(data, level)
+        blobs = self._blobs.blobs
+        if window is not None:
+            kept = 0
+            for b_idx in range(count):
+                blob = blobs[b_idx]
+                if window.contains(blob.row, blob.col):
+                    blobs[b_idx] = blobs[kept]
+                    blobs[kept] = blob
+                    kept += 1
+            count = kept
+        for b_idx in range(count):
+            blob = blobs[b_idx]
+            delta_y, delta_x = self._angles(blob.row, blob.col)
+            # the same sense as main(), which aims at yaw - delta_x
+            blob.az = yaw - delta_x
+            blob.el = pitch + delta_y
+        return self._tracker.update(blobs, count, now_ms)
+
+    def locate(self, array, yaw=0.0, pitch=0.0, now_ms=None, window=None):
+        """!
+            @brief                  Finds the bearing of the object most worth aiming at in an image taken
+            @details                Like find_target(), but gives the bearing at which the best tracked object was
+                                    seen in this image, unsmoothed, along with which object it is, so that a
+                                    @c TargetEstimator can combine it with earlier sightings. If @c follow() has been
+                                    called, the region of interest is moved onto the track, or dropped if there is
+                                    none.
+            @param  array           The image object to be analyzed
+            @param  yaw             The yaw of the turret, in degrees, when the image was taken
+            @param  pitch           The pitch of the turret, in degrees, when the image was taken
+            @param  now_ms          When the image was taken, from utime.ticks_ms(); now if not given
+            @param  window          The @c WindowSubpage through which the image was read, as in @c frame_window
+            @return                 The track's id, or 0 for the hottest spot if nothing is being tracked, and the
+                                    azimuth and elevation in degrees
+        """
+        track = self.track(array, yaw, pitch, now_ms, window)
+        if self._follow is not None:
+            self._aim_roi(track, yaw, pitch)
+        if track is None:
+            delta_y, delta_x = self.find_max(array)
+            return 0, yaw - delta_x, pitch + delta_y
+        return track.id, track.seen_az, track.seen_el
+
+    def _aim_roi(self, track, yaw, pitch):
+        # centre the followed region of interest on where a track was seen,
+        # making new tables only when it moves by a whole pixel
+        if track is None:
+            self._roi = None
+            return
+        rows, cols, refresh = self._follow
+        # the inverse of _angles(), whose tables are linear
+        row = round((self._row_deg[0] - (track.seen_el - pitch)) / DEG_PER_PIXEL)
+        col = round((self._col_deg[0] - (yaw - track.seen_az)) / DEG_PER_PIXEL)
+        first_row = min(max(row - rows // 2, 0), self._height - rows)
+        first_col = min(max(col - cols // 2, 0), self._width - cols)
+        roi = self._roi
+        if roi is None or roi[0].first_row != first_row or roi[0].first_col != first_col:
+            self.set_roi(first_row, first_row + rows, first_col, first_col + cols, refresh)
+
+    def find_target(self, array, yaw=0.0, pitch=0.0):
+        """!
+            @brief                  Finds the object most worth aiming at in an image taken
+            @details                Like find_max(), but aims at the best tracked object, so a person wins over a
+                                    small hot spot such as a lamp and is followed from one image to the next. If
+                                    nothing in the image stands out, the hottest spot is used.
+            @param  array           The image object to be analyzed
+            @param  yaw             The yaw of the turret, in degrees, when the image was taken
+            @param  pitch           The pitch of the turret, in degrees, when the image was taken
+            @return                 The delta y and delta x, in degrees, from the turret's pose to the target
+        """
+        track = self.track(array, yaw, pitch)
+        if track is None:
+            return self.find_max(array)
+        return [track.el - pitch, yaw - track.az]
+
+    def gaussian_filt(self, array):
+        """!
+            @brief                  Blurs an image taken with a 3x3 Gaussian kernel
+            @param  array           The image object to be filtered
+            @return                 A frame, from the array backend, two pixels narrower and two shorter than the
+                                    image
+        """
+        return self._ops.convolve3x3(self._ops.view(pixels(array), self._width))
+
+    def find_person(self, array):
+        """!
+            @brief                  Finds the hottest spot in a blurred image taken
+            @details                Like find_max(), but a single hot pixel doesn't count for as much as a warm
+                                    patch the size of a person
+            @param  array           The image object to be analyzed
+            @return                 The delta y and delta x, in degrees, to the hottest spot from the center of the
+                                    image
+        """
+        row, col = self._ops.argmax(self.gaussian_filt(array))
+        # the filtered frame starts one pixel in from the image's corner
+        return self._angles(row + 1, col + 1)
+
+    def _angles(self, row, col):
+        # degrees from the center of the image to a point, [pitch, yaw],
+        # interpolated from the per-row and per-column tables
+        return [_lookup(self._row_deg, row), _lookup(self._col_deg, col)]
+
+
+def _lookup(table, pos):
+    # linear interpolation in an angle table at a fractional index
+    idx = int(pos)
+    if idx > len(table) - 2:
+        idx = len(table) - 2
+    elif idx < 0:
+        idx = 0
+    return table[idx] + (pos - idx) * (table[idx + 1] - table[idx])
+
+
+def camera_setup(profile=None):
     """!
         @brief                  Sets up the camera object
         @details                Sets up I2C and initializes the camera object
+        @param  profile         The name of an acquisition profile in @c PROFILES; the bus is run at its clock and
+                                the camera set up with its settings. By default the bus runs at 400 kHz and the
+                                camera as it powered on.
         @return                 The camera object
     """
+    bus_hz = PROFILES[profile]['bus_hz'] if profile is not None else 400000
+
     # The following import is only used to check if we have an STM32 board such
     # as a Pyboard or Nucleo; if not, use a different library
     try:
@@ -150,11 +660,11 @@ def camera_setup():
     # Oops, it's not an STM32; assume generic machine.I2C for ESP32 and others
     except ImportError:
         # For ESP32 38-pin cheapo board from NodeMCU, KeeYees, etc.
-        i2c_bus = I2C(1, scl=Pin(22), sda=Pin(21))
+        i2c_bus = I2C(1, scl=Pin(22), sda=Pin(21), freq=bus_hz)
 
     # OK, we do have an STM32, so just use the default pin assignments for I2C1
     else:
-        i2c_bus = I2C(1)
+        i2c_bus = I2C(1, freq=bus_hz)
 
     # print("MXL90640 Easy(ish) Driver Test")
 
@@ -163,31 +673,73 @@ def camera_setup():
     # scanhex = [f"0x{addr:X}" for addr in i2c_bus.scan()]
     # print(f"I2C Scan: {scanhex}")
 
-    # Create the camera object and set it up in default mode
-    cam = MLX_Cam(i2c_bus)
+    # Create the camera object and set it up in the profile's mode
+    cam = MLX_Cam(i2c_bus, profile=profile)
     return cam
 
 
-def run(cam):
+def run(cam, yaw=0.0, pitch=0.0):
     """!
-        @brief                  Takes a picture and finds the hottest pixel, to be sent to the motor controller
-        @details                Given a camera object, this method takes a picture and finds the hottest pixel for the
-                                purpose of aiming the gun
+        @brief                  Takes a picture and finds the best target, to be sent to the motor controller
+        @details                Given a camera object, this method takes a picture and updates the camera's tracks
+                                for the purpose of aiming the gun. The tracks' bearings are worked out from the
+                                turret's pose as the picture is taken; with the default pose of zero, as in the test
+                                code, which has no turret, they are angles in the camera's own frame.
         @param  cam             The previously initialized camera object
-        @return                 The delta x and delta y to the hottest pixel
+        @param  yaw             The yaw of the turret, in degrees, as the picture is taken
+        @param  pitch           The pitch of the turret, in degrees, as the picture is taken
+        @return                 The delta y and delta x, in degrees, from the turret's pose to the best tracked
+                                target, or from the center of the image to the hottest pixel if nothing is being
+                                tracked
     """
     # Get an image
     image = cam.get_image()
-    deltas = cam.find_max(image)
+    deltas = cam.find_target(image, yaw, pitch)
 
     return deltas
 
 
-# The test code sets up the sensor, then grabs and shows an image in a terminal
-# every ten and a half seconds or so.
+# The test code sets up the sensor and takes a picture. Then it runs the camera
+# in a cooperative task next to two do-nothing tasks which stand in for the
+# 10 ms motor tasks, first reading whole images at once and then reading them
+# incrementally, and prints the task profiles; the MAX LATE column shows how
+# long the motor tasks were held up by the camera.
 ## @cond NO_DOXY don't document the test code in the driver documentation
 if __name__ == "__main__":
+    import cotask
+
     camera = camera_setup()
-    run(camera)
+    print(run(camera))
+
+    def motor_stand_in():
+        while True:
+            yield 0
+
+    def blocking_camera():
+        while True:
+            camera.find_max(camera.get_image())
+            yield 0
+
+    def incremental_camera():
+        frames = camera.acquire()
+        while True:
+            image = next(frames)
+            if image is not None:
+                camera.find_max(image)
+            yield 0
+
+    for camera_fun in (blocking_camera, incremental_camera):
+        tasks = cotask.TaskList()
+        tasks.append(cotask.Task(motor_stand_in, name='Yaw', priority=11,
+                                 period=10, profile=True))
+        tasks.append(cotask.Task(motor_stand_in, name='Pitch', priority=10,
+                                 period=10, profile=True))
+        tasks.append(cotask.Task(camera_fun, name='Camera', priority=9,
+                                 period=10, profile=True))
+        start = time.ticks_ms()
+        while time.ticks_diff(time.ticks_ms(), start) < 5000:
+            tasks.pri_sched()
+        print(camera_fun.__name__)
+        print(tasks)
 
 ## @endcond End the block which Doxygen should ignore
@@ -0,0 +1,196 @@
+"""!
+    @file                       motion_profile.py
+    @brief                      Smooth reference motions for the turret's axes
+    @details                    Rather than jumping a motor's setpoint straight to a new aim point, which saturates the
+                                motor, overshoots and slaps the gears through their backlash, the setpoint can be moved
+                                along a profile whose speed, acceleration and, optionally, jerk are limited. A
+                                @c Trajectory works the profile out as it goes: each run looks only at where the
+                                reference is, how fast it moves and where the target is now, so the target can change
+                                at any time, even while the reference is moving the other way, and each run takes the
+                                same small amount of work without making any new objects.
+
+    @date                       October 18, 2026
+"""
+
+import utime
+
+
+class Trajectory:
+    """!
+        @brief                  A time-parameterized reference which moves towards a target within set limits
+        @details                Each run works out the fastest speed from which the reference could still stop at the
+                                target, caps it at the speed limit, adds the target's own rate, and changes the speed
+                                towards that as fast as the acceleration limit allows, which gives a trapezoidal speed
+                                profile. When jerk is limited as well, the trapezoidal reference is averaged over a
+                                short window of runs; the average of a trapezoid is an S-curve whose acceleration
+                                ramps up and down instead of stepping, and which, like the trapezoid, never
+                                overshoots. The average lags by half the window, so the move takes that much longer.
+    """
+    __slots__ = ('max_vel', 'max_accel', 'position', 'velocity', 'accel', 'target', 'target_rate',
+                 '_ref_pos', '_ref_vel', '_pos_ring', '_vel_ring', '_pos_sum', '_vel_sum', '_slot', '_settled',
+                 '_last_us')
+
+    def __init__(self, max_vel, max_accel, max_jerk=None, position=0.0, period=0.01):
+        """!
+            @brief              Constructs a trajectory resting at a position
+            @param  max_vel     The fastest the reference may move, in units per second
+            @param  max_accel   The fastest the reference's speed may change, in units per second squared
+            @param  max_jerk    The fastest the acceleration may change, in units per second cubed, or @c None for
+                                no limit
+            @param  position    Where the reference starts
+            @param  period      How often, in seconds, the trajectory will be run; with @c max_jerk it sets the
+                                length of the averaging window
+        """
+        self.max_vel = max_vel
+        self.max_accel = max_accel
+        window = 1
+        if max_jerk:
+            window = max(1, round(max_accel / max_jerk / period))
+        # the last few positions and speeds of the trapezoidal reference, allocated once, and their sums, kept up
+        # as each one is replaced so that averaging them takes the same work however long the window
+        self._pos_ring = [0.0] * window
+        self._vel_ring = [0.0] * window
+        self.reset(position)
+
+    def reset(self, position, velocity=0.0):
+        """!
+            @brief              Puts the reference at a position, with nowhere to go
+            @details            The next run after a reset starts the clock, so it doesn't move the reference.
+            @param  position    Where the reference is
+            @param  velocity    How fast it is moving
+        """
+        self.position = self._ref_pos = position
+        self.velocity = self._ref_vel = velocity
+        self.accel = 0.0
+        self.target = position
+        self.target_rate = 0.0
+        window = len(self._pos_ring)
+        for slot in range(window):
+            self._pos_ring[slot] = position
+            self._vel_ring[slot] = velocity
+        self._pos_sum = position * window
+        self._vel_sum = velocity * window
+        self._slot = 0
+        self._settled = 0
+        self._last_us = None
+
+    def set_target(self, target, rate=0.0):
+        """!
+            @brief              Changes where the reference is heading
+            @param  target      The new target position
+            @param  rate        How fast the target is moving, in units per second
+        """
+        self.target = target
+        self.target_rate = rate
+
+    @property
+    def done(self):
+        """!
+            @brief              Whether the reference has caught up with the target
+        """
+        return self.position == self.target and self.velocity == self.target_rate
+
+    def run(self, dt=None):
+        """!
+            @brief              Moves the reference along by one step
+            @param  dt          The time since the last run in seconds, or @c None to measure it
+            @return             The reference's position
+        """
+        if dt is None:
+            now_us = utime.ticks_us()
+            dt = 0.0 if self._last_us is None else utime.ticks_diff(now_us, self._last_us) / 1000000
+            self._last_us = now_us
+        if dt <= 0:
+            return self.position
+        max_vel = self.max_vel
+        max_accel = self.max_accel
+        target = self.target
+        target_rate = self.target_rate
+        position = self._ref_pos
+        velocity = self._ref_vel
+
+        # the fastest speed, relative to the target, from which the reference can still stop in time, allowing for
+        # the distance closed during this step
+        distance = target - position
+        ahead = distance >= 0
+        toward = velocity - target_rate
+        if distance < 0:
+            distance = -distance
+            toward = -toward
+        half_step = max_accel * dt / 2
+        room = distance - toward * dt / 2
+        stop_vel = -half_step + (half_step * half_step + 2 * max_accel * room) ** 0.5 if room > 0 else 0.0
+        if stop_vel > max_vel:
+            stop_vel = max_vel
+        want_vel = target_rate + (stop_vel if ahead else -stop_vel)
+        if want_vel > max_vel:
+            want_vel = max_vel
+        elif want_vel < -max_vel:
+            want_vel = -max_vel
+
+        # as near that speed as the acceleration limit allows
+        accel = (want_vel - velocity) / dt
+        if accel > max_accel:
+            accel = max_accel
+        elif accel < -max_accel:
+            accel = -max_accel
+        new_vel = velocity + accel * dt
+        new_pos = position + (velocity + new_vel) * dt / 2
+        # the target moves on too
+        target += target_rate * dt
+        self.target = target
+        # land on the target rather than dither about it
+        step = max_accel * dt
+        if (new_pos >= target if ahead else new_pos <= target) and -step < new_vel - target_rate < step:
+            new_pos = target
+            new_vel = target_rate
+            accel = 0.0
+        self._ref_pos = new_pos
+        self._ref_vel = new_vel
+
+        pos_ring = self._pos_ring
+        window = len(pos_ring)
+        if window == 1:
+            self.position = new_pos
+            self.velocity = new_vel
+            self.accel = accel
+            return new_pos
+        # smooth the trapezoid into an S-curve
+        slot = self._slot
+        vel_ring = self._vel_ring
+        pos_sum = self._pos_sum + new_pos - pos_ring[slot]
+        vel_sum = self._vel_sum + new_vel - vel_ring[slot]
+        self._pos_sum = pos_sum
+        self._vel_sum = vel_sum
+        pos_ring[slot] = new_pos
+        vel_ring[slot] = new_vel
+        self._slot = slot + 1 if slot + 1 < window else 0
+        if new_pos == target and new_vel == target_rate:
+            self._settled += 1
+        else:
+            self._settled = 0
+        if self._settled >= window:
+            position = target
+            velocity = target_rate
+        else:
+            # the average trails a moving target by half the window
+            position = pos_sum / window + target_rate * (window - 1) * dt / 2
+            velocity = vel_sum / window
+        self.accel = (velocity - self.velocity) / dt
+        self.position = position
+        self.velocity = velocity
+        return position
+
+
+## @cond NO_DOXY
+# Print a move, retargeted halfway, as a table
+if __name__ == "__main__":
+    profile = Trajectory(120.0, 600.0, 6000.0)
+    profile.set_target(90.0)
+    for tick in range(150):
+        if tick == 40:
+            profile.set_target(-30.0)
+        profile.run(0.01)
+        if tick % 5 == 0:
+            print(f"{tick * 10:5d} ms {profile.position:8.2f} {profile.velocity:8.2f} {profile.accel:8.1f}")
+## @endcond
@@ -1,55 +1,137 @@
 """!
     @file                       motor_controller.py
-    @brief                      A universal proportional control algorithm
-    @details                    This is a class that implements a basic proportional control algorithm. The difference
-                                between a setpoint and current position is multiplied by a proportional gain value to
-                                produce an output.
-                                
+    @brief                      A universal PID control algorithm with feedforward
+    @details                    This is a class that implements a PID control algorithm. The difference between a
+                                setpoint and current position is multiplied by a proportional gain, the integral of
+                                that difference by an integral gain and the rate of change of the position by a
+                                derivative gain; the setpoint's own rate of change can be fed forward. The output is
+                                clamped, with the integral held while clamping, and a deadband around the setpoint
+                                lets the motor be braked instead of hunting.
+
     @author                     Peyton Archibald
     @author                     Harrison Hirsch
     @date                       February 7, 2023
 """
 
+import utime
+
 
 class MotorController:
     """!
-    @brief                      A class for creating a proportional controller, initially for use with a DC motor
-    @details                    This is a class that implements a basic proportional control algorithm. The difference
-                                between a setpoint and current position is multiplied by a proportional gain value to
-                                produce an output.
+    @brief                      A class for creating a PID controller, initially for use with a DC motor
+    @details                    This is a class that implements a PID control algorithm. With only a proportional
+                                gain it behaves as the original proportional controller: the difference between a
+                                setpoint and current position is multiplied by a proportional gain value to produce an
+                                output. The other terms are switched on by giving them nonzero gains.
     """
 
-    def __init__(self, initial_Kp, initial_set_point):
+    def __init__(self, initial_Kp, initial_set_point, Ki=0.0, Kd=0.0, Kff=0.0, out_min=-100.0, out_max=100.0,
+                 deadband=0.0, d_filter=0.02, i_limit=None):
         """!
             @brief                      Constructs a controller object
-            @details                    Upon instantiation, the controller object has a defined proportional gain and
-                                        initial setpoint. It notifies the user that a motor controller is being created
+            @details                    Upon instantiation, the controller object has defined gains and an initial
+                                        setpoint.
             @param  initial_Kp          The proportional gain to be used
             @param  initial_set_point   The initial setpoint to aim for
-        """  
+            @param  Ki                  The integral gain, per second
+            @param  Kd                  The derivative gain, in seconds; it acts on the measured position rather
+                                        than the error, so steps in the setpoint don't kick the output
+            @param  Kff                 The feedforward gain on the setpoint's rate of change
+            @param  out_min             The lowest output allowed
+            @param  out_max             The highest output allowed
+            @param  deadband            How close to the setpoint counts as there; within it the output is zero,
+                                        the integral is held and @c braking is set
+            @param  d_filter            The time constant, in seconds, of the low pass filter on the derivative
+            @param  i_limit             The most the integral term may add to the output either way, or @c None to
+                                        let it reach the output limits; keeping it a little above what it takes to
+                                        overcome friction stops it winding up during long moves
+        """
         self.Kp = initial_Kp
+        self.Ki = Ki
+        self.Kd = Kd
+        self.Kff = Kff
+        self.out_min = out_min
+        self.out_max = out_max
+        self.deadband = deadband
+        self.d_filter = d_filter
+        self.i_limit = i_limit
         self.set_point = initial_set_point
+        self.set_rate = 0.0
+        ## True when the last run found the position within the deadband, so the motor may be braked
+        self.braking = False
+        self.reset()
         # print("Creating a motor controller")
 
+    def reset(self):
+        """!
+            @brief                  Clears the controller's memory
+            @details                Zeros the integral and derivative so the next run starts afresh, as after the
+                                    motor has been stopped or moved by hand.
+        """
+        self.integral = 0.0
+        self.derivative = 0.0
+        self._last_point = None
+        self._last_us = 0
+
     def run(self, current_point):
         """!
-            @brief                  Runs the proportional control algorithm
-            @details                Subtracts the current point from the setpoint and multiplies it by the gain value.
+            @brief                  Runs the PID control algorithm
+            @details                Works out the proportional, integral, derivative and feedforward terms and adds
+                                    them up. The time between runs is measured, so the task running the controller
+                                    doesn't have to keep to its period exactly. If the output is clamped, the
+                                    integral is only allowed to change in the direction that unclamps it.
             @param  current_point   The current position of the system
             @return                 The output of the control system. For a motor, it is a duty cycle to send to the
                                     motor driver
         """
-        return self.Kp*(self.set_point - current_point)     # Duty cycle = gain*(setpoint-current position)
-    
-    def set_setpoint(self, new_set_point):
+        now_us = utime.ticks_us()
+        error = self.set_point - current_point      # Error = setpoint - current position
+        if self._last_point is None:
+            dt = 0.0
+        else:
+            dt = utime.ticks_diff(now_us, self._last_us) / 1000000
+        self._last_us = now_us
+
+        # Derivative on measurement, low pass filtered
+        if dt > 0:
+            rate = (current_point - self._last_point) / dt
+            self.derivative += (rate - self.derivative) * dt / (self.d_filter + dt)
+        self._last_point = current_point
+
+        # Within the deadband, stop and hold
+        self.braking = -self.deadband < error < self.deadband
+        if self.braking:
+            return 0
+
+        output = self.Kp*error + self.Ki*self.integral - self.Kd*self.derivative + self.Kff*self.set_rate
+
+        # Integrate unless that would push a clamped output further out
+        if dt > 0 and self.Ki:
+            if not ((output >= self.out_max and error > 0) or (output <= self.out_min and error < 0)):
+                self.integral += error * dt
+                if self.i_limit is not None:
+                    limit = self.i_limit / self.Ki
+                    if self.integral > limit:
+                        self.integral = limit
+                    elif self.integral < -limit:
+                        self.integral = -limit
+
+        if output > self.out_max:
+            output = self.out_max
+        elif output < self.out_min:
+            output = self.out_min
+        return output
+
+    def set_setpoint(self, new_set_point, rate=0.0):
         """!
-            @brief                  Changes setpoint of the proportional control algorithm
+            @brief                  Changes setpoint of the control algorithm
             @details                Replaces the previously defined setpoint with a newly defined setpoint
             @param  new_set_point   The new setpoint of the system
+            @param  rate            How fast the setpoint is moving, per second, for the feedforward term
         """
         self.set_point = new_set_point      # Redefine setpoint
-        pass
-    
+        self.set_rate = rate
+
     def set_Kp(self, new_Kp):
         """!
             @brief              Changes gain value of the proportional control algorithm
@@ -59,6 +141,24 @@ class MotorController:
         self.Kp = new_Kp        # Redefine Kp
         pass
 
+    def set_gains(self, Kp=None, Ki=None, Kd=None, Kff=None):
+        """!
+            @brief              Changes any of the gains of the control algorithm
+            @details            Gains which aren't given are left as they were
+            @param  Kp          The new proportional gain
+            @param  Ki          The new integral gain
+            @param  Kd          The new derivative gain
+            @param  Kff         The new feedforward gain
+        """
+        if Kp is not None:
+            self.Kp = Kp
+        if Ki is not None:
+            self.Ki = Ki
+        if Kd is not None:
+            self.Kd = Kd
+        if Kff is not None:
+            self.Kff = Kff
+
     def store_data(self, data_lst, time, position):
         """!
             @brief                  Stores data from a control algorithm
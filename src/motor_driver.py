@@ -45,6 +45,8 @@ class MotorDriver:
         self.motortimer = pyb.Timer(timer, freq=20000)  # Setting up the timer channel for PWM signal
         self.CCW = self.motortimer.channel(1, pyb.Timer.PWM, pin=self.input1pin)  # Setting up channels for motor
         self.CW = self.motortimer.channel(2, pyb.Timer.PWM, pin=self.input2pin)
+        ## The PWM timer's count at which a pulse would fill the whole period, for set_pulse_width()
+        self.full_width = self.motortimer.period() + 1
 
     def set_duty_cycle(self, level):
         """!
@@ -74,6 +76,33 @@ class MotorDriver:
             self.CW.pulse_width_percent(0)
             self.CCW.pulse_width_percent(0)
 
+    def set_pulse_width(self, width):
+        """!
+            @brief 				Sets the width of the PWM pulses to a motor in timer counts
+            @details			Works like set_duty_cycle() but in whole timer counts, from -full_width to
+                                full_width, so that it can be called from an interrupt without floating point.
+            @param width		A signed integer holding the pulse width
+        """
+        if width < 0:
+            self.CW.pulse_width(-width)
+            self.CCW.pulse_width(0)
+        elif width > 0:
+            self.CW.pulse_width(0)
+            self.CCW.pulse_width(width)
+        else:
+            self.CW.pulse_width(0)
+            self.CCW.pulse_width(0)
+
+    def brake(self):
+        """!
+            @brief 				Brakes the motor
+            @details			Drives both motor pins high, which shorts the motor's windings through the
+                                driver so that it stops quickly and resists being turned, instead of coasting
+                                as it does with a duty cycle of zero.
+        """
+        self.CW.pulse_width_percent(100)
+        self.CCW.pulse_width_percent(100)
+
 
 if __name__ == '__main__':
     motor1 = MotorDriver(pyb.Pin.cpu.A10, pyb.Pin.cpu.B4, pyb.Pin.cpu.B5, 3)
@@ -12,6 +12,8 @@
 import motor_driver
 import encoder_reader
 import motor_controller
+import motion_profile
+import control_loop
 
 
 class Motor:
@@ -21,7 +23,9 @@ class Motor:
                                 this class wraps them all into one motor object. All the same methods can be called from
                                 this motor object
     """
-    def __init__(self, en_pin, in1pin, in2pin, motor_timer, pinA, pinB, encoder_timer, initial_Kp, initial_set_point):
+    def __init__(self, en_pin, in1pin, in2pin, motor_timer, pinA, pinB, encoder_timer, initial_Kp, initial_set_point,
+                 Ki=0.0, Kd=0.0, Kff=0.0, deadband=0.0, i_limit=None, max_vel=None, max_accel=None,
+                 max_jerk=None, sample_timer=None, sample_freq=1000, loop_freq=None):
         """!
             @brief                      Constructs a motor object
             @details                    Takes all the necessary pins and automatically instantiates everything needed to
@@ -35,11 +39,38 @@ class Motor:
             @param  encoder_timer       The timer number that the encoder uses
             @param  initial_Kp          The proportional gain to be used
             @param  initial_set_point   The initial setpoint to aim for
+            @param  Ki                  The integral gain, per second
+            @param  Kd                  The derivative gain, in seconds
+            @param  Kff                 The feedforward gain on the setpoint's rate of change
+            @param  deadband            How close to the setpoint, in encoder ticks, the motor is braked instead of
+                                        driven
+            @param  i_limit             The most duty cycle the integral term may add
+            @param  max_vel             The fastest the gun may be moved, in degrees per second; if given, the
+                                        setpoint follows a motion profile to each new position instead of jumping
+            @param  max_accel           The fastest the gun's speed may change, in degrees per second squared
+            @param  max_jerk            The fastest the gun's acceleration may change, in degrees per second cubed,
+                                        or @c None for a trapezoidal profile
+            @param  sample_timer        The number of a free timer with which to sample the encoder from an
+                                        interrupt, or @c None to read the encoder only when the motor is moved
+            @param  sample_freq         How many times a second the encoder is sampled
+            @param  loop_freq           How many times a second to run the controller from the sampler's timer
+                                        interrupt, or @c None to run it whenever the motor is moved; needs a
+                                        @c sample_timer
 
         """
         self.motor = motor_driver.MotorDriver(en_pin, in1pin, in2pin, motor_timer)  # Set up motor
         self.encoder = encoder_reader.EncoderReader(pinA, pinB, encoder_timer)  # Set up encoder
-        self.controller = motor_controller.MotorController(initial_Kp, initial_set_point)  # Set up controller
+        self.controller = motor_controller.MotorController(initial_Kp, initial_set_point, Ki=Ki, Kd=Kd, Kff=Kff,
+                                                            deadband=deadband, i_limit=i_limit)  # Set up controller
+        self.profile = None
+        if max_vel is not None:
+            self.profile = motion_profile.Trajectory(max_vel, max_accel, max_jerk)  # Set up motion profile
+        self.sampler = None
+        if sample_timer is not None:
+            self.sampler = encoder_reader.EncoderSampler(self.encoder, sample_timer, sample_freq)  # Set up sampling
+        self.loop = None
+        if loop_freq is not None:
+            self.loop = control_loop.ControlLoop(self, loop_freq)  # Run the controller from an interrupt
 
 
 def main():
@@ -51,40 +82,142 @@ def main():
     pass
 
 
-def move_yaw(motor, degrees):
+def move_yaw(motor, degrees, rate=0.0):
     """!
         @brief              Moves the yaw motor by a specified number of degrees
-        @details            Updates and reads the yaw motor encoder value, sets the controller setpoint to the desired
-                            number of degrees, runs the controller to calculate and set the duty cycle. The input and
-                            output is converted between gun rotation degrees and motor encoder tics. This method is
-                            meant to be run in a loop, continuously updating the yaw desired position
+        @details            Reads the yaw motor encoder position, as last sampled if the motor has an encoder
+                            sampler, sets the controller setpoint to the desired number of degrees, or the next step
+                            towards it if the motor has a motion profile, runs the controller to calculate and set the
+                            duty cycle, or brakes the motor once it is within the controller's deadband; if the motor
+                            has a control loop, the setpoint is passed to that instead. The input and output is
+                            converted between gun rotation degrees and motor encoder tics. This method is meant to be
+                            run in a loop, continuously updating the yaw desired position
         @param  motor       The motor object that is to be controlled
         @param  degrees     The desired end yaw position of the gun
+        @param  rate        How fast the desired position is moving, in degrees per second, fed forward to the
+                            controller
         @return             The current motor yaw position, in gun degrees
     """
-    encoderPosSpeed = motor.encoder.read()  # Update and read encoder value
-    motor.controller.set_setpoint(degrees * 16384 / 360 * 5.8)  # Set controller setpoint to current step response value
-    desiredDuty = motor.controller.run(encoderPosSpeed[0])  # Run controller to calculate duty cycle
-    motor.motor.set_duty_cycle(desiredDuty)  # Set calculated duty cycle
-    return encoderPosSpeed[0] * 360 / 16384 / 5.8
+    if motor.sampler is not None:
+        position = motor.sampler.position()  # Newest position sampled by the interrupt
+    else:
+        position = motor.encoder.read()[0]  # Update and read encoder value
+    if motor.profile is not None:
+        motor.profile.set_target(degrees, rate)  # Head for the desired position along the profile
+        degrees = motor.profile.run()
+        rate = motor.profile.velocity
+    if motor.loop is not None:
+        motor.loop.target.put((int(degrees * 16384 / 360 * 5.8),
+                               int(rate * 16384 / 360 * 5.8)))  # The interrupt does the rest
+        return position * 360 / 16384 / 5.8
+    motor.controller.set_setpoint(degrees * 16384 / 360 * 5.8, rate * 16384 / 360 * 5.8)  # Set controller setpoint
+    desiredDuty = motor.controller.run(position)  # Run controller to calculate duty cycle
+    if motor.controller.braking:
+        motor.motor.brake()  # Close enough, so hold still
+    else:
+        motor.motor.set_duty_cycle(desiredDuty)  # Set calculated duty cycle
+    return position * 360 / 16384 / 5.8
 
 
-def move_pitch(motor, degrees):
+def hold_yaw(motor):
+    """!
+        @brief              Holds the yaw motor where it is
+        @details            Reads the yaw motor encoder position and makes it the setpoint, with the motion profile,
+                            if the motor has one, put there at rest. Moving the motor to where it was last told to be
+                            would leave the profile carrying on towards the old setpoint and coming back, driving
+                            the motor while the gun is meant to be still; a profile left at rest here also starts
+                            from the gun's real position once the motor is moved again.
+        @param  motor       The motor object that is to be held
+        @return             The current motor yaw position, in gun degrees
+    """
+    if motor.sampler is not None:
+        position = motor.sampler.position()  # Newest position sampled by the interrupt
+    else:
+        position = motor.encoder.read()[0]  # Update and read encoder value
+    degrees = position * 360 / 16384 / 5.8
+    if motor.profile is not None:
+        motor.profile.reset(degrees)  # Stop the profile here
+    return move_yaw(motor, degrees)
+
+
+def yaw_speed(motor):
+    """!
+        @brief              Returns how fast the yaw motor is turning
+        @details            The speed is estimated from the samples taken by the motor's encoder sampler, so the motor
+                            must have been made with a @c sample_timer.
+        @param  motor       The motor object whose speed is wanted
+        @return             The yaw speed of the gun, in degrees per second
+    """
+    return motor.sampler.velocity() * 360 / 16384 / 5.8
+
+
+def move_pitch(motor, degrees, rate=0.0):
     """!
         @brief              Moves the pitch motor by a specified number of degrees
-        @details            Updates and reads the pitch motor encoder value, sets the controller setpoint to the desired
-                            number of degrees, runs the controller to calculate and set the duty cycle. The input and
-                            output is converted between gun rotation degrees and motor encoder tics. This method is
-                            meant to be run in a loop, continuously updating the pitch desired position
+        @details            Reads the pitch motor encoder position, as last sampled if the motor has an encoder
+                            sampler, sets the controller setpoint to the desired number of degrees, or the next step
+                            towards it if the motor has a motion profile, runs the controller to calculate and set the
+                            duty cycle, or brakes the motor once it is within the controller's deadband; if the motor
+                            has a control loop, the setpoint is passed to that instead. The input and output is
+                            converted between gun rotation degrees and motor encoder tics. This method is meant to be
+                            run in a loop, continuously updating the pitch desired position
         @param  motor       The motor object that is to be controlled
         @param  degrees     The desired end pitch position of the gun
+        @param  rate        How fast the desired position is moving, in degrees per second, fed forward to the
+                            controller
         @return             The current motor pitch position, in gun degrees
     """
-    encoderPosSpeed = motor.encoder.read()  # Update and read encoder value
-    motor.controller.set_setpoint(degrees * 16384 / 360 * 4.2)  # Set controller setpoint to current step response value
-    desiredDuty = motor.controller.run(encoderPosSpeed[0])  # Run controller to calculate duty cycle
-    motor.motor.set_duty_cycle(desiredDuty)  # Set calculated duty cycle
-    return encoderPosSpeed[0] * 360 / 16384 / 4.2
+    if motor.sampler is not None:
+        position = motor.sampler.position()  # Newest position sampled by the interrupt
+    else:
+        position = motor.encoder.read()[0]  # Update and read encoder value
+    if motor.profile is not None:
+        motor.profile.set_target(degrees, rate)  # Head for the desired position along the profile
+        degrees = motor.profile.run()
+        rate = motor.profile.velocity
+    if motor.loop is not None:
+        motor.loop.target.put((int(degrees * 16384 / 360 * 4.2),
+                               int(rate * 16384 / 360 * 4.2)))  # The interrupt does the rest
+        return position * 360 / 16384 / 4.2
+    motor.controller.set_setpoint(degrees * 16384 / 360 * 4.2, rate * 16384 / 360 * 4.2)  # Set controller setpoint
+    desiredDuty = motor.controller.run(position)  # Run controller to calculate duty cycle
+    if motor.controller.braking:
+        motor.motor.brake()  # Close enough, so hold still
+    else:
+        motor.motor.set_duty_cycle(desiredDuty)  # Set calculated duty cycle
+    return position * 360 / 16384 / 4.2
+
+
+def hold_pitch(motor):
+    """!
+        @brief              Holds the pitch motor where it is
+        @details            Reads the pitch motor encoder position and makes it the setpoint, with the motion profile,
+                            if the motor has one, put there at rest. Moving the motor to where it was last told to be
+                            would leave the profile carrying on towards the old setpoint and coming back, driving
+                            the motor while the gun is meant to be still; a profile left at rest here also starts
+                            from the gun's real position once the motor is moved again.
+        @param  motor       The motor object that is to be held
+        @return             The current motor pitch position, in gun degrees
+    """
+    if motor.sampler is not None:
+        position = motor.sampler.position()  # Newest position sampled by the interrupt
+    else:
+        position = motor.encoder.read()[0]  # Update and read encoder value
+    degrees = position * 360 / 16384 / 4.2
+    if motor.profile is not None:
+        motor.profile.reset(degrees)  # Stop the profile here
+    return move_pitch(motor, degrees)
+
+
+def pitch_speed(motor):
+    """!
+        @brief              Returns how fast the pitch motor is turning
+        @details            The speed is estimated from the samples taken by the motor's encoder sampler, so the motor
+                            must have been made with a @c sample_timer.
+        @param  motor       The motor object whose speed is wanted
+        @return             The pitch speed of the gun, in degrees per second
+    """
+    return motor.sampler.velocity() * 360 / 16384 / 4.2
 
 
 if __name__ == '__main__':
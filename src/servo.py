@@ -13,22 +13,50 @@
 import pyb
 import utime
 
+## How long, in milliseconds, the servo is held forward for a dart to be pushed into the flywheels
+PUSH_MS = 250
 
-def run():
+
+def setup():
     """!
-        @brief      Sets up and runs the servo to push a dart from the magazine into the flywheels
-        @details    This file sets up the pins and timer to run a servo with PWM. Once the gun is on target,
-                    the servo will rotate 180 degrees to push a dart through the spinning flywheels and then return to
-                    the original position to prepare to fire again.
+        @brief      Sets up the pin and timer which drive the servo
+        @return     The timer channel whose pulse width sets the servo's position
     """
     pinB3 = pyb.Pin(pyb.Pin.cpu.B3, pyb.Pin.OUT_PP)
     tim2 = pyb.Timer(2, prescaler=79, period=19999)
-    ch2 = tim2.channel(2, pyb.Timer.PWM, pin=pinB3)
+    return tim2.channel(2, pyb.Timer.PWM, pin=pinB3)
+
+
+def push(ch2):
+    """!
+        @brief      Rotates the servo forward to push a dart into the flywheels, and returns at once
+        @param  ch2 The servo's timer channel, from setup()
+    """
     ch2.pulse_width(2000)
-    utime.sleep(.25)
+
+
+def retract(ch2):
+    """!
+        @brief      Rotates the servo back, ready to push the next dart
+        @param  ch2 The servo's timer channel, from setup()
+    """
     ch2.pulse_width(800)
 
 
+def run():
+    """!
+        @brief      Sets up and runs the servo to push a dart from the magazine into the flywheels
+        @details    This file sets up the pins and timer to run a servo with PWM. Once the gun is on target,
+                    the servo will rotate 180 degrees to push a dart through the spinning flywheels and then return to
+                    the original position to prepare to fire again. This waits the whole @c PUSH_MS; a task should
+                    call push() and retract() on runs that far apart instead.
+    """
+    ch2 = setup()
+    push(ch2)
+    utime.sleep_ms(PUSH_MS)
+    retract(ch2)
+
+
 # def run2(n):    # No. of darts
 #     pinB3 = pyb.Pin(pyb.Pin.cpu.B3, pyb.Pin.OUT_PP)
 #     tim2 = pyb.Timer(2, prescaler=79, period=19999)
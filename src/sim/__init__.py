@@ -0,0 +1,89 @@
+"""!
+@file sim/__init__.py
+Host-side simulation of the turret hardware.
+
+This package lets the turret software run unmodified under CPython on a
+development machine. It provides stand-ins for the MicroPython modules the
+code imports (@c pyb, @c machine, @c utime, @c uctypes, @c ucollections and
+@c micropython), all running on one virtual clock, plus models of the
+hardware behind them:
+  - an MLX90640 camera with register, RAM and EEPROM spaces which serves a
+    synthetic thermal scene at its configured refresh rate, and
+  - a DC gearmotor and quadrature encoder for each turret axis, driven by the
+    PWM duty cycle of the motor timer.
+
+Call @c install() before importing any of the turret modules:
+@code
+    import sim
+    turret = sim.install()
+    turret.scene.add_target(az=190, el=5)
+    import main
+@endcode
+
+@c python -m sim runs @c main.main() headless; see @c sim/__main__.py.
+"""
+
+import builtins
+import gc
+import sys
+
+from sim.clock import clock, SimulationEnd
+from sim.camera import MLX90640Device, Scene
+from sim.plant import MotorPlant
+
+## Encoder counts per turret degree, from the gearing in motor_run.py
+YAW_COUNTS_PER_DEG = 16384 / 360 * 5.8
+PITCH_COUNTS_PER_DEG = 16384 / 360 * 4.2
+
+
+class Turret:
+    """!
+    Handles to the simulated hardware, as wired on the real turret.
+    """
+
+    def __init__(self, scene=None, camera_eeprom=None):
+        self.yaw = MotorPlant('yaw', counts_per_deg=YAW_COUNTS_PER_DEG)
+        self.pitch = MotorPlant('pitch', max_speed=30000.0,
+                                counts_per_deg=PITCH_COUNTS_PER_DEG)
+        self.scene = scene or Scene()
+        self.camera = MLX90640Device(
+            self.scene, pose=lambda: (self.yaw.degrees, self.pitch.degrees),
+            eeprom=camera_eeprom)
+
+
+_MODULES = ('pyb', 'machine', 'utime', 'uctypes', 'ucollections',
+            'micropython')
+
+
+def install(scene=None, camera_eeprom=None, stop_s=None):
+    """!
+    Put the simulated modules in place of the MicroPython ones, reset the
+    clock and build a fresh turret.
+    @param scene The @c Scene the camera sees; an empty scene if not given
+    @param camera_eeprom Optional EEPROM contents for the camera
+    @param stop_s Virtual run time in seconds after which the clock raises
+           @c SimulationEnd, or @c None to run forever
+    @return The @c Turret holding the simulated hardware
+    """
+    import importlib
+    for name in _MODULES:
+        sys.modules[name] = importlib.import_module('sim.' + name)
+    builtins.const = sys.modules['micropython'].const
+    if not hasattr(gc, 'mem_free'):
+        gc.mem_free = lambda: 96 * 1024
+        gc.mem_alloc = lambda: 0
+
+    pyb = sys.modules['pyb']
+    machine = sys.modules['machine']
+    pyb.unwire_all()
+    machine.detach_all()
+    clock.reset(None if stop_s is None else int(stop_s * 1000000))
+
+    turret = Turret(scene, camera_eeprom)
+    # motor timers 3 and 5 drive PWM; timers 8 and 4 count the encoders
+    pyb.wire_pwm(3, turret.yaw)
+    pyb.wire_encoder(8, turret.yaw)
+    pyb.wire_pwm(5, turret.pitch)
+    pyb.wire_encoder(4, turret.pitch)
+    machine.attach(1, turret.camera)
+    return turret
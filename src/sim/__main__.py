@@ -0,0 +1,104 @@
+"""!
+@file sim/__main__.py
+Run the turret program, @c main.main(), headless against the simulated
+hardware and report how it performed.
+
+From the @c src directory:
+@code
+    python -m sim --seconds 20 --target 190 5
+@endcode
+The run ends after the given number of virtual seconds. The tasks' own
+printouts are hidden unless @c --verbose is given. Afterwards the task
+profiles, the camera's bus traffic and the final turret pose are printed,
+along with how much faster than real time the simulation ran. With
+@c --trace the scheduler's trace is saved to a file as well, to be read with
+@c python -m sim.trace.
+"""
+
+import argparse
+import builtins
+import contextlib
+import io
+import time
+
+import sim
+
+
+def _profile_all_tasks(cotask):
+    # main() creates its tasks without profiling; turn it on for all of them
+    # so the report has run times and lateness
+    task_init = cotask.Task.__init__
+
+    def profiled_init(self, *args, **kwargs):
+        kwargs['profile'] = True
+        task_init(self, *args, **kwargs)
+
+    cotask.Task.__init__ = profiled_init
+
+
+def run(seconds, targets, verbose=False, scene=None, trace=None):
+    """!
+    Run @c main.main() for a number of virtual seconds.
+    @param seconds The virtual run time, including main()'s 5 s start delay
+    @param targets A sequence of (azimuth, elevation) target bearings
+    @param verbose If @c True, let the tasks' printouts through
+    @param scene A @c sim.Scene to use instead of one made from @c targets
+    @param trace A file to which main() saves the scheduler's trace when it
+           stops, for @c python -m sim.trace, or @c None
+    @return The simulated @c Turret, for inspection
+    """
+    scene = scene or sim.Scene()
+    for az, el in targets:
+        scene.add_target(az, el)
+    turret = sim.install(scene=scene, stop_s=seconds)
+
+    import cotask
+    import main
+
+    _profile_all_tasks(cotask)
+    builtins.input = lambda prompt='': ''
+    trace_file = main.TRACE_FILE
+    main.TRACE_FILE = trace
+
+    wall_start = time.perf_counter()
+    try:
+        if verbose:
+            main.main()
+        else:
+            with contextlib.redirect_stdout(io.StringIO()):
+                main.main()
+    finally:
+        main.TRACE_FILE = trace_file
+    wall = time.perf_counter() - wall_start
+
+    print(cotask.task_list)
+    camera = turret.camera
+    print(f"camera: {camera.frames} subpages measured, "
+          f"{camera.transactions} I2C transactions, "
+          f"{camera.bytes_read} bytes read, "
+          f"{camera.status_reads} status reads")
+    print(f"turret: yaw {turret.yaw.degrees:.2f} deg, "
+          f"pitch {turret.pitch.degrees:.2f} deg")
+    print(f"{seconds:.1f} s simulated in {wall:.2f} s "
+          f"({seconds / wall:.1f}x real time)")
+    return turret
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        prog='python -m sim',
+        description='Run the turret program against simulated hardware.')
+    parser.add_argument('--seconds', type=float, default=20.0,
+                        help='virtual run time in seconds (default 20)')
+    parser.add_argument('--target', type=float, nargs=2, action='append',
+                        metavar=('AZ', 'EL'),
+                        help='add a hot target at this bearing in degrees '
+                             '(default 190 5); may be repeated')
+    parser.add_argument('--verbose', action='store_true',
+                        help="show the tasks' printouts")
+    parser.add_argument('--trace', metavar='FILE',
+                        help="save the scheduler's trace to FILE, to be read "
+                             'with python -m sim.trace')
+    args = parser.parse_args()
+    run(args.seconds, args.target or [(190.0, 5.0)], args.verbose,
+        trace=args.trace)
@@ -0,0 +1,1222 @@
+"""!
+@file bench.py
+Benchmarks which run the turret code against the simulated hardware.
+
+Run them all, or the ones named, from the @c src directory:
+@code
+    python -m sim.bench
+    python -m sim.bench registers
+@endcode
+Times reported are virtual: they count bus time and the time charged for
+clock reads, not the host's CPU time.
+"""
+
+import sys
+
+import sim
+
+
+def _camera(target=(0.0, 0.0)):
+    # a fresh simulation with one target in front of the camera
+    turret = sim.install()
+    turret.scene.add_target(*target)
+    import mlx_cam
+    return turret, mlx_cam.camera_setup()
+
+
+def _next_image(frames, period_ms=10):
+    # drive an acquisition generator as a task with the given period would
+    import utime
+    image = next(frames)
+    while image is None:
+        utime.sleep_ms(period_ms)
+        image = next(frames)
+    return image
+
+
+def registers(frames=6):
+    """!
+    I2C transactions per frame with the register shadow cache, compared with
+    reading the camera on every register access as was done before.
+    """
+    sim.install()
+    from mlx90640.regmap import RegisterMap, REGISTER_MAP, VOLATILE_REGISTERS
+
+    class UncachedRegisterMap(RegisterMap):
+        # every access goes to the camera and every field is written with
+        # its own read-modify-write
+        def _load(self, address, fresh=False):
+            return RegisterMap._load(self, address, True)
+
+        def update(self, **fields):
+            for name, value in fields.items():
+                self._valid.discard(self._fields[name])
+                RegisterMap.update(self, **{name: value})
+
+    print('registers: I2C transactions per frame')
+    for map_class in (UncachedRegisterMap, RegisterMap):
+        for mode in ('get_image', 'acquire'):
+            turret, camera = _camera()
+            driver = camera._camera
+            driver.registers = map_class(driver.iface, REGISTER_MAP,
+                                         volatile=VOLATILE_REGISTERS)
+            _next_image(camera.acquire())       # settle into the frame cycle
+            turret.camera.reset_counters()
+            if mode == 'get_image':
+                for _ in range(frames):
+                    camera.get_image()
+            else:
+                acquisition = camera.acquire()
+                for _ in range(frames):
+                    _next_image(acquisition)
+            dev = turret.camera
+            print(f"  {map_class.__name__:<20s} {mode:<10s}"
+                  f"{dev.transactions / frames:8.1f} total"
+                  f"{dev.status_reads / frames:8.1f} status reads"
+                  f"{(dev.transactions - dev.status_reads) / frames:8.1f}"
+                  f" other")
+
+
+def calibration():
+    """!
+    Bus traffic and time to load the camera calibration: decoding the EEPROM
+    one register at a time over I2C, from a bulk EEPROM copy on the first
+    boot, and from the cache file on later boots.
+    """
+    import os
+    import tempfile
+    import time
+    sim.install()
+    from mlx90640.regmap import RegisterMap, EEPROM_MAP
+    from mlx90640.calibration import CameraCalibration
+
+    print('calibration: loading the camera calibration')
+    cache_file = os.path.join(tempfile.mkdtemp(), 'mlx_calib.bin')
+    for how in ('per register', 'first boot', 'later boot'):
+        turret, camera = _camera()
+        driver = camera._camera
+        turret.camera.reset_counters()
+        start_us = sim.clock.now_us
+        cpu_start = time.perf_counter()
+        if how == 'per register':
+            CameraCalibration(driver.iface, RegisterMap(
+                driver.iface, EEPROM_MAP, readonly=True))
+        else:
+            driver.setup(calibrate=True, cache_file=cache_file)
+        cpu_ms = (time.perf_counter() - cpu_start) * 1000
+        dev = turret.camera
+        print(f"  {how:<14s}{dev.transactions:6d} transactions"
+              f"{dev.bytes_read:7d} bytes"
+              f"{(sim.clock.now_us - start_us) / 1000:8.1f} ms on the bus"
+              f"{cpu_ms:8.1f} ms host CPU")
+
+
+def _nbytes(*buffers):
+    # memory held by arrays and bytearrays, not counting object headers
+    import struct
+    return sum(
+        len(buf) * (struct.calcsize(buf.typecode)
+                    if hasattr(buf, 'typecode') else 1)
+        for buf in buffers
+    )
+
+
+def temperature(frames=4):
+    """!
+    Memory held by the image buffers and calibration tables, and host CPU
+    time per frame, for raw and calibrated images. The layout used before,
+    with float tables and three float image buffers, is given for
+    comparison.
+    """
+    import os
+    import tempfile
+    import time
+    sim.install()
+    from mlx90640.calibration import IMAGE_SIZE
+
+    # the calibration cache is written to the working directory
+    os.chdir(tempfile.mkdtemp())
+    print('temperature: image memory and compute time per frame')
+    float_tables = 2 * IMAGE_SIZE + 3 * 4 * IMAGE_SIZE
+    float_buffers = 3 * 4 * IMAGE_SIZE
+    print(f"  {'float layout':<12s}{float_tables:7d} bytes of tables"
+          f"{float_buffers:7d} bytes of image buffers")
+    for calibrated in (False, True):
+        turret = sim.install()
+        turret.scene.add_target(0.0, 0.0)
+        import mlx_cam
+        from machine import I2C
+        camera = mlx_cam.MLX_Cam(I2C(1), calibrated=calibrated)
+        driver = camera._camera
+        tables = 0
+        if calibrated:
+            calib = driver.calib
+            tables = _nbytes(calib.pix_os_ref, calib.pix_alpha, calib.pix_kta)
+        buffers = _nbytes(driver.raw.pix, driver.raw._buf, *camera._ring.pix)
+        if calibrated:
+            buffers += _nbytes(driver.image.buf)
+
+        acquisition = camera.acquire()
+        _next_image(acquisition)
+        cpu_s = 0
+        for _ in range(frames):
+            cpu_start = time.perf_counter()
+            _next_image(acquisition)
+            cpu_s += time.perf_counter() - cpu_start
+        mode = 'calibrated' if calibrated else 'raw'
+        print(f"  {mode:<12s}{tables:7d} bytes of tables"
+              f"{buffers:7d} bytes of image buffers"
+              f"{cpu_s * 1000 / frames:8.1f} ms host CPU")
+
+
+def frame(repeats=50):
+    """!
+    Host CPU time per frame for each whole-frame operation, with each of the
+    array backends that can be imported. The two-pass search which
+    @c find_max() used before is given for comparison.
+    """
+    import time
+    from array import array
+    turret, camera = _camera((3.0, 2.0))
+    from mlx90640.frame import BACKENDS, GAUSSIAN_3X3, pixels
+
+    data = pixels(_next_image(camera.acquire()))
+
+    def two_pass_argmax():
+        hottest = max(data)
+        for p_idx in range(len(data) - 1):
+            if data[p_idx] == hottest:
+                return p_idx
+
+    def per_frame_us(fun):
+        start = time.perf_counter()
+        for _ in range(repeats):
+            fun()
+        return (time.perf_counter() - start) * 1e6 / repeats
+
+    print('frame: host CPU time per frame, us')
+    print(f"  {'two-pass argmax':<22s}{per_frame_us(two_pass_argmax):9.1f}")
+    for name, backend in BACKENDS.items():
+        try:
+            ops = backend()
+        except ImportError:
+            print(f"  {name}: not available")
+            continue
+        view = ops.view(data)
+        background = ops.view(array('h', data))
+        blurred = ops.convolve3x3(view)
+        timings = (
+            ('view', lambda: ops.view(data)),
+            ('argmax', lambda: ops.argmax(view)),
+            ('convolve3x3', lambda: ops.convolve3x3(view, GAUSSIAN_3X3)),
+            ('threshold', lambda: ops.threshold(view, 0)),
+            ('subtract_background',
+             lambda: ops.subtract_background(view, background)),
+            ('centroid', lambda: ops.centroid(view, 0)),
+        )
+        print(f"  {name}: argmax {ops.argmax(view)},"
+              f" blurred argmax {ops.argmax(blurred)},"
+              f" centroid {ops.centroid(view, 0)}")
+        for op_name, fun in timings:
+            print(f"    {op_name:<20s}{per_frame_us(fun):9.1f}")
+
+
+def acquisition(seconds=10, period_ms=10, target=(3.0, 2.0)):
+    """!
+    How late the motor tasks run while the camera task takes pictures, with
+    the whole picture read in one run by @c get_image() as before and a few
+    rows at a time by @c acquire(). Two stand-in motor tasks at 10 ms and
+    higher priority share the scheduler with the camera task, as in
+    @c main.
+    """
+    sim.install()
+    import cotask
+    import mlx_cam
+
+    def motor_stand_in():
+        while True:
+            yield 0
+
+    print(f"acquisition: motor task lateness over {seconds} s, "
+          f"{period_ms} ms tasks")
+    for label in ('blocking', 'incremental'):
+        turret = sim.install()
+        turret.scene.add_target(*target)
+        camera = mlx_cam.camera_setup()
+        images = []
+
+        def camera_task():
+            if label == 'blocking':
+                while True:
+                    images.append(camera.find_max(camera.get_image()))
+                    yield 0
+            frames = camera.acquire()
+            while True:
+                image = next(frames)
+                if image is not None:
+                    images.append(camera.find_max(image))
+                yield 0
+
+        task_list = cotask.TaskList(idle_sleep=True)
+        task_list.idle_hook = lambda wait: sim.clock.advance(
+            1000 if wait is None else wait)
+        motors = (cotask.Task(motor_stand_in, name='Yaw', priority=11,
+                              period=period_ms, profile=True),
+                  cotask.Task(motor_stand_in, name='Pitch', priority=10,
+                              period=period_ms, profile=True))
+        for task in motors:
+            task_list.append(task)
+        task_list.append(cotask.Task(camera_task, name='Camera', priority=9,
+                                     period=period_ms, profile=True))
+        while sim.clock.now_us < seconds * 1000000:
+            task_list.pri_sched()
+        lateness = '  '.join(
+            f"{task.name} {task._late_sum / max(task._runs, 1) / 1000:6.2f}"
+            f" ms mean {task._latest / 1000:7.2f} ms max, "
+            f"{task.misses:3d} misses" for task in motors)
+        print(f"  {label:<12s}{len(images) / seconds:5.2f} images/s  "
+              f"{lateness}")
+
+
+def _paired_acquire(camera, rows_per_slice=1):
+    # MLX_Cam.acquire() as it was before the frame ring: the rows are read
+    # into the driver's one raw image, which is produced after each pair of
+    # subpages and then read over in place
+    from mlx90640.image import Subpage
+    driver = camera._camera
+    while True:
+        subpages_read = 0
+        while subpages_read != 0b11:
+            has_data, last_subpage = driver.read_status()
+            if not has_data:
+                yield None
+                continue
+            subpage = Subpage(camera._pattern, last_subpage)
+            driver.ack_data()
+            for first_row in range(0, camera._height, rows_per_slice):
+                yield None
+                driver.read_rows(subpage, first_row,
+                                 min(first_row + rows_per_slice,
+                                     camera._height))
+            subpages_read |= 1 << subpage.id
+        yield driver.raw.pix
+
+
+def pipeline(seconds=20, period_ms=10, hold_calls=40):
+    """!
+    Images produced per second and bytes read from the camera per image by
+    the camera task's acquisition, with the single raw image used before and
+    with a ring of two and three frames. Each image is used over
+    @c hold_calls calls, as a target extractor spread over several task runs
+    would, and the pixels changed underneath it in that time are counted.
+    """
+    from array import array
+    sim.install()
+    import utime
+    import mlx_cam
+    from machine import I2C
+    print(f"pipeline: images over {seconds} s with a {period_ms} ms task")
+    for label, slots in (('single image', None), ('ring of 2', 2),
+                         ('ring of 3', 3)):
+        turret = sim.install()
+        turret.scene.add_target(3.0, 2.0)
+        camera = mlx_cam.MLX_Cam(I2C(1), slots=slots or 2)
+        frames = _paired_acquire(camera) if slots is None \
+            else camera.acquire()
+        _next_image(frames, period_ms)
+        turret.camera.reset_counters()
+        start_us = sim.clock.now_us
+        images = 0
+        torn = 0
+        held = None
+        copy = array('h', [0] * 768)
+        calls = 0
+        while sim.clock.now_us - start_us < seconds * 1000000:
+            image = next(frames)
+            calls += 1
+            if held is not None and calls >= hold_calls:
+                torn += sum(1 for new, old in zip(held, copy) if new != old)
+                held = None
+            if image is not None:
+                images += 1
+                held = image
+                copy[:] = image
+                calls = 0
+            utime.sleep_ms(period_ms)
+        dev = turret.camera
+        print(f"  {label:<14s}{images / seconds:6.2f} images/s"
+              f"{dev.bytes_read / images:8.0f} bytes per image"
+              f"{torn / images:7.0f} pixels changed while in use")
+
+
+def roi(seconds=20, period_ms=10, sizes=(None, (8, 10), (4, 6)), refresh=8,
+        target=(3.0, 2.0), newcomer=(-8.0, -4.0)):
+    """!
+    Bytes read from the camera and virtual time spent in the acquisition per
+    tracking update, reading whole images and through regions of interest
+    of a few sizes which follow the target, with the mean bearing error
+    while the target is alone; then how long a second target which appears halfway through
+    takes to be tracked, found only by the periodic full refreshes.
+    """
+    sim.install()
+    import utime
+    import mlx_cam
+    from machine import I2C
+    print(f"roi: tracking updates over {seconds} s, whole image read again"
+          f" every {refresh} subpages")
+    for size in sizes:
+        turret = sim.install()
+        turret.scene.add_target(*target)
+        camera = mlx_cam.MLX_Cam(I2C(1))
+        if size is not None:
+            camera.follow(*size, refresh=refresh)
+        frames = camera.acquire()
+        turret.camera.reset_counters()
+        start_us = sim.clock.now_us
+        busy_us = 0
+        updates = alone = 0
+        error = 0.0
+        appeared_us = seen_us = None
+        while sim.clock.now_us - start_us < seconds * 1000000:
+            call_us = sim.clock.now_us
+            image = next(frames)
+            busy_us += sim.clock.now_us - call_us
+            if image is not None:
+                updates += 1
+                track_id, az, el = camera.locate(image, 0.0, 0.0,
+                                                 camera.frame_ms,
+                                                 camera.frame_window)
+                if appeared_us is None:
+                    error += ((az - target[0]) ** 2
+                              + (el - target[1]) ** 2) ** 0.5
+                    alone = updates
+                if appeared_us is not None and seen_us is None and any(
+                        track.active and abs(track.az - newcomer[0]) < 2
+                        and abs(track.el - newcomer[1]) < 2
+                        for track in camera._tracker.tracks):
+                    seen_us = sim.clock.now_us
+            if appeared_us is None and \
+                    sim.clock.now_us - start_us >= seconds * 500000:
+                turret.scene.add_target(*newcomer)
+                appeared_us = sim.clock.now_us
+            utime.sleep_ms(period_ms)
+        dev = turret.camera
+        label = 'whole image' if size is None else f"{size[0]}x{size[1]} window"
+        seen = 'never' if seen_us is None \
+            else f"{(seen_us - appeared_us) / 1e6:.1f} s"
+        print(f"  {label:<14s}{updates / seconds:5.2f} updates/s"
+              f"{dev.bytes_read / updates:7.0f} bytes"
+              f"{busy_us / 1000 / updates:7.1f} ms per update,"
+              f" error {error / alone:5.2f} deg; newcomer tracked after {seen}")
+
+
+def policy(seconds=20, period_ms=10, cam_rate=1.0, rate=4.0, start_az=176.0,
+           settle_s=10):
+    """!
+    For each acquisition policy, images per second, how old each image is
+    when it is handed over and how far the target's bearing in it is from
+    where the target really is at that moment, for a fixed camera watching a
+    target crossing its view at @c cam_rate degrees a second; then how far
+    behind a target moving at @c rate degrees a second @c main.main() aims,
+    as a yaw error and as the time the target takes to cover it, after
+    @c settle_s seconds.
+    """
+    import contextlib
+    import io
+    sim.install()
+    import cotask
+    import mlx_cam
+    import utime
+    from machine import I2C
+    from sim.__main__ import run
+
+    policies = (('PAIRED', mlx_cam.PAIRED), ('SLIDING', mlx_cam.SLIDING),
+                ('HALF', mlx_cam.HALF))
+    print(f"policy: targets moving at {cam_rate} deg/s for the camera alone,"
+          f" {rate} deg/s for main")
+    cam_start = -cam_rate * seconds / 2
+    for name, acquire_policy in policies:
+        turret = sim.install()
+        turret.scene.add_target(cam_start, 2.0, az_rate=cam_rate)
+        camera = mlx_cam.MLX_Cam(I2C(1))
+        frames = camera.acquire(policy=acquire_policy)
+        start_us = sim.clock.now_us
+        images = 0
+        age_ms = 0
+        error = 0.0
+        while sim.clock.now_us - start_us < seconds * 1000000:
+            image = next(frames)
+            if image is not None:
+                images += 1
+                age_ms += utime.ticks_diff(utime.ticks_ms(), camera.frame_ms)
+                track_id, az, el = camera.locate(image)
+                error += cam_start + cam_rate * sim.clock.now_us / 1e6 - az
+            utime.sleep_ms(period_ms)
+        print(f"  {name:<8s} camera: {images / seconds:5.2f} images/s,"
+              f" {age_ms / images:6.1f} ms old, bearing"
+              f" {error / images:5.2f} deg behind")
+
+    for name, acquire_policy in policies:
+        import main
+        saved = main.ACQUIRE_POLICY
+        main.ACQUIRE_POLICY = acquire_policy
+        scene = sim.Scene()
+        scene.add_target(start_az, 3.0, az_rate=rate)
+        errors = []
+        turrets = []
+
+        def sample():
+            if sim.clock.now_us >= settle_s * 1000000:
+                t_s = sim.clock.now_us / 1e6
+                errors.append(start_az + rate * t_s - turrets[0].yaw.degrees)
+
+        def install(*args, **kwargs):
+            turrets.append(sim_install(*args, **kwargs))
+            sim.clock.every(50000, sample)
+            return turrets[0]
+
+        sim_install = sim.install
+        sim.install = install
+        cotask.task_list = cotask.TaskList()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                run(seconds, (), scene=scene)
+        finally:
+            sim.install = sim_install
+            main.ACQUIRE_POLICY = saved
+        lag = sum(errors) / len(errors)
+        print(f"  {name:<8s} main: yaw {lag:5.2f} deg behind on average,"
+              f" {1000 * lag / rate:5.0f} ms of the target's motion;"
+              f" {max(abs(e) for e in errors):5.2f} deg at most")
+
+
+class _PrintLog:
+    # stands in for stdout, noting the virtual time of each line printed
+    def __init__(self):
+        self.lines = []
+        self._text = ''
+
+    def write(self, text):
+        self._text += text
+        while '\n' in self._text:
+            line, self._text = self._text.split('\n', 1)
+            self.lines.append((sim.clock.now_us, line))
+
+    def flush(self):
+        pass
+
+
+def profiles(seconds=10, period_ms=10, target=(3.0, 2.0)):
+    """!
+    Images produced per second, subpages measured by the camera per image and
+    virtual time spent reading the camera per image, with the camera as it
+    powered on and under each acquisition profile in @c mlx_cam.PROFILES,
+    driven every @c period_ms as the camera task is. Then a camera which
+    ignores writes to its control register shows the read-back check.
+    """
+    sim.install()
+    import utime
+    import mlx_cam
+    from mlx90640 import ConfigError
+    from sim.camera import CONTROL_ADDRESS
+    print(f"profiles: images over {seconds} s with a {period_ms} ms task")
+    for name in (None,) + tuple(mlx_cam.PROFILES):
+        turret = sim.install()
+        turret.scene.add_target(*target)
+        camera = mlx_cam.camera_setup(name)
+        frames = camera.acquire()
+        _next_image(frames, period_ms)
+        turret.camera.reset_counters()
+        start_us = sim.clock.now_us
+        images = 0
+        read_us = 0
+        while sim.clock.now_us - start_us < seconds * 1000000:
+            call_us = sim.clock.now_us
+            image = next(frames)
+            read_us += sim.clock.now_us - call_us
+            if image is not None:
+                images += 1
+            utime.sleep_ms(period_ms)
+        dev = turret.camera
+        label = 'power-on' if name is None else name
+        print(f"  {label:<10s}{images / seconds:6.2f} images/s"
+              f"{dev.frames / images:6.2f} subpages per image"
+              f"{read_us / images / 1000:7.1f} ms reading per image")
+
+    turret = sim.install()
+    camera = mlx_cam.camera_setup()
+    dev = turret.camera
+    write = dev.write
+
+    def stuck_write(mem_addr, data):
+        # the control register keeps its power-on value
+        if mem_addr != CONTROL_ADDRESS:
+            write(mem_addr, data)
+    dev.write = stuck_write
+    try:
+        camera.set_profile('tracking')
+    except ConfigError as err:
+        print(f"  stuck control register: ConfigError: {err}")
+    else:
+        print("  stuck control register: not detected")
+
+
+def ready(seconds=20, warmup_s=3, period_ms=10, clock_error=0.03,
+          target=(3.0, 2.0)):
+    """!
+    Status register reads per image and the delay from a subpage being ready
+    to its reading starting, for the camera task's acquisition reading the
+    status register on every run as before, and with the task's period
+    retuned to the predicted data-ready times, at the power-on refresh rate
+    and under the 'tracking' profile. The camera's oscillator runs
+    @c clock_error fast, so its period has to be learned; counting starts
+    after @c warmup_s. Delays are the simulated camera's own, followed by
+    the driver's mean estimate of them over the images for which it could
+    make one.
+    """
+    sim.install()
+    import cotask
+    import mlx_cam
+    print(f"ready: camera task every {period_ms} ms, camera clock "
+          f"{100 * clock_error:+.0f}%, over {seconds} s")
+    for profile in (None, 'tracking'):
+        for label in ('every run', 'paced'):
+            turret = sim.install()
+            turret.scene.add_target(*target)
+            dev = turret.camera
+            dev.clock_error = clock_error
+            camera = mlx_cam.camera_setup(profile)
+            driver = camera._camera
+
+            # the simulated camera's ready time of each subpage, noted as it
+            # is acknowledged, and the delay to the first read of its rows
+            delays = []
+            pending = []
+            ack_data = driver.ack_data
+            read_rows = driver.read_rows
+
+            def noted_ack():
+                pending[:] = [dev.ready_us]
+                ack_data()
+
+            def timed_read(*args, **kwargs):
+                if pending:
+                    delays.append(sim.clock.now_us - pending.pop())
+                return read_rows(*args, **kwargs)
+            driver.ack_data = noted_ack
+            driver.read_rows = timed_read
+
+            images = []
+
+            def camera_task():
+                frames = camera.acquire(
+                    task=task if label == 'paced' else None)
+                while True:
+                    if next(frames) is not None:
+                        images.append(camera.frame_latency_us)
+                    yield 0
+
+            task_list = cotask.TaskList(idle_sleep=True)
+            task_list.idle_hook = lambda wait: sim.clock.advance(
+                1000 if wait is None else wait)
+            task = cotask.Task(camera_task, name='camera', priority=1,
+                               period=period_ms)
+            task_list.append(task)
+            while sim.clock.now_us < warmup_s * 1000000:
+                task_list.pri_sched()
+            dev.reset_counters()
+            del delays[:], images[:]
+            while sim.clock.now_us < (warmup_s + seconds) * 1000000:
+                task_list.pri_sched()
+
+            estimates = [us for us in images if us is not None]
+            estimated = (f"driver's mean estimate {sum(estimates) / len(estimates) / 1000:5.2f} ms"
+                         f" over the {100 * len(estimates) // len(images)}% of images it could estimate"
+                         if estimates else "no image's delay could be estimated")
+            delays.sort()
+            name = 'power-on' if profile is None else profile
+            print(f"  {name:<9s}{label:<10s}{len(images) / seconds:6.2f} images/s"
+                  f"{dev.status_reads / len(images):6.1f} status reads per image;"
+                  f" delay {sum(delays) / len(delays) / 1000:5.2f} ms mean"
+                  f" {delays[len(delays) * 99 // 100] / 1000:5.2f} ms p99,"
+                  f" {estimated}")
+
+
+def localization(trials=30, targets=((190.6, 5.5), (171.3, -3.4), (203.9, 9.2))):
+    """!
+    How far the bearing worked out by @c find_max() is from a target's true
+    bearing, and how many pictures @c main.main() takes to declare it is on
+    target, with and without sub-pixel location. Whole-pixel location puts
+    the hottest spot, and the centroid of each blob which main() tracks, at
+    the middle of the pixel it falls in.
+    """
+    import contextlib
+    import random
+    sim.install()
+    import cotask
+    import mlx_cam
+    from sim.__main__ import run
+
+    angles = mlx_cam.MLX_Cam._angles
+
+    def whole_pixel(self, row, col):
+        return angles(self, round(row), round(col))
+
+    rng = random.Random(405)
+    bearings = [(rng.uniform(-15, 15), rng.uniform(-12, 12))
+                for _ in range(trials)]
+    print('localization: bearing error and pictures to get on target')
+    for how in ('whole pixel', 'sub-pixel'):
+        mlx_cam.MLX_Cam._angles = whole_pixel if how == 'whole pixel' else angles
+        turret, camera = _camera()
+        frames = camera.acquire()
+        errors = []
+        for az, el in bearings:
+            turret.scene.targets[:] = [[az, el, 2500, 2.0, 0.0, 0.0]]
+            _next_image(frames)     # let a subpage from the old scene pass
+            delta_y, delta_x = camera.find_max(_next_image(frames))
+            # main() aims at yaw - delta_x and pitch + delta_y
+            err_az = -delta_x - az
+            err_el = delta_y - el
+            errors.append((err_az * err_az + err_el * err_el) ** 0.5)
+
+        pictures = []
+        ready_s = []
+        for target in targets:
+            log = _PrintLog()
+            # main() adds its tasks to the module's list, so start afresh
+            cotask.task_list = cotask.TaskList()
+            with contextlib.redirect_stdout(log):
+                run(20, [target], verbose=True)
+            taken = 0
+            for when_us, line in log.lines:
+                if line == 'Picture taken':
+                    taken += 1
+                elif line == 'Ready to fire':
+                    ready_s.append(f'{when_us / 1e6:.1f}')
+                    break
+            else:
+                ready_s.append('never')
+            pictures.append(taken)
+        print(f"  {how:<12s} error {sum(errors) / len(errors):5.2f} deg mean"
+              f"{max(errors):6.2f} deg max; pictures {pictures},"
+              f" ready at {', '.join(ready_s)} s")
+
+
+def tracking(frames=20, person=(196.0, 7.0), lamp=(185.0, 1.0)):
+    """!
+    Which of a person and a small, hotter lamp the turret aims at, and the
+    host CPU time per frame for blob detection and tracking, both for a
+    normal scene and for a worst-case checkerboard image with as many blobs
+    as possible.
+    """
+    import contextlib
+    import io
+    import time
+    from array import array
+    sim.install()
+    import cotask
+    from sim.__main__ import run
+
+    print('tracking: aiming with a decoy, and time per frame')
+    # the camera stays put, so place the targets as seen from yaw 190
+    turret, camera = _camera(target=(person[0] - 190.0, person[1]))
+    del turret.scene.targets[:]
+    turret.scene.add_target(person[0] - 190.0, person[1], amplitude=1200,
+                            sigma=3.0)
+    turret.scene.add_target(lamp[0] - 190.0, lamp[1], amplitude=4000,
+                            sigma=0.5)
+    acquisition = camera.acquire()
+    track_s = 0
+    for _ in range(frames):
+        image = _next_image(acquisition)
+        start = time.perf_counter()
+        camera.track(image, 190.0, 0.0)
+        track_s += time.perf_counter() - start
+    worst = array('h', (1000 if (idx // 32 + idx) % 2 else 0
+                        for idx in range(768)))
+    start = time.perf_counter()
+    for _ in range(frames):
+        camera.track(worst)
+    worst_s = time.perf_counter() - start
+    print(f"  track() {track_s * 1000 / frames:.2f} ms per frame,"
+          f" {worst_s * 1000 / frames:.2f} ms on a checkerboard")
+
+    def hottest_spot(self, array, yaw=0.0, pitch=0.0, now_ms=None, window=None):
+        # locate() as if the hottest spot were always the tracked target
+        delta_y, delta_x = self.find_max(array)
+        return 1, yaw - delta_x, pitch + delta_y
+
+    for how in ('hottest spot', 'best track'):
+        import mlx_cam
+        locate = mlx_cam.MLX_Cam.locate
+        if how == 'hottest spot':
+            mlx_cam.MLX_Cam.locate = hottest_spot
+        decoy = sim.Scene()
+        decoy.add_target(*person, amplitude=1200, sigma=3.0)
+        decoy.add_target(*lamp, amplitude=4000, sigma=0.5)
+        cotask.task_list = cotask.TaskList()
+        with contextlib.redirect_stdout(io.StringIO()):
+            turret = run(20, (), scene=decoy)
+        mlx_cam.MLX_Cam.locate = locate
+        print(f"  {how:<12s} aimed at yaw {turret.yaw.degrees:6.2f},"
+              f" pitch {turret.pitch.degrees:5.2f}"
+              f" (person {person[0]}, {person[1]}; lamp {lamp[0]}, {lamp[1]})")
+
+
+def estimator(seconds=25, settle_s=10, rate=2.0, start_az=176.0):
+    """!
+    How closely the turret follows a target moving at a steady rate when
+    the setpoint is the last sighting, as before, and when it is predicted
+    forward by the target estimator.
+    """
+    import contextlib
+    import io
+    sim.install()
+    import cotask
+    import target_estimator
+    from sim.__main__ import run
+
+    estimator_init = target_estimator.TargetEstimator.__init__
+
+    def last_sighting(self, *args, **kwargs):
+        estimator_init(self, alpha=1.0, beta=0.0)
+
+    print(f"estimator: following a target moving at {rate} deg/s")
+    for how in ('last sighting', 'predicted'):
+        if how == 'last sighting':
+            target_estimator.TargetEstimator.__init__ = last_sighting
+        scene = sim.Scene()
+        scene.add_target(start_az, 3.0, az_rate=rate)
+        errors = []
+        turrets = []
+
+        def sample():
+            if sim.clock.now_us >= settle_s * 1000000:
+                t_s = sim.clock.now_us / 1e6
+                yaw = turrets[0].yaw.degrees
+                errors.append(abs(yaw - (start_az + rate * t_s)))
+
+        def install(*args, **kwargs):
+            # sample the turret's pose through the run
+            turrets.append(sim_install(*args, **kwargs))
+            sim.clock.every(50000, sample)
+            return turrets[0]
+
+        sim_install = sim.install
+        sim.install = install
+        cotask.task_list = cotask.TaskList()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                run(seconds, (), scene=scene)
+        finally:
+            sim.install = sim_install
+            target_estimator.TargetEstimator.__init__ = estimator_init
+        print(f"  {how:<14s} yaw error {sum(errors) / len(errors):5.2f} deg mean"
+              f" {max(errors):5.2f} deg max after {settle_s} s")
+
+
+def _axis_run(axis, gains, setpoint, seconds, use_rate=True, period_ms=10):
+    # drive one motor through move_yaw/move_pitch as its task would; setpoint
+    # gives the (degrees, rate) wanted at a time in seconds, and the angle
+    # reached and duty cycle are returned for every run
+    turret = sim.install()
+    import utime
+    import motor_run
+    if axis == 'yaw':
+        motor = motor_run.Motor('A10', 'B4', 'B5', 3, 'C6', 'C7', 8, initial_set_point=0, **gains)
+        move = motor_run.move_yaw
+        plant = turret.yaw
+    else:
+        motor = motor_run.Motor('C1', 'A0', 'A1', 5, 'B6', 'B7', 4, initial_set_point=0, **gains)
+        move = motor_run.move_pitch
+        plant = turret.pitch
+    start_us = sim.clock.now_us
+    trace = []
+    while sim.clock.now_us - start_us < seconds * 1000000:
+        t_s = (sim.clock.now_us - start_us) / 1e6
+        degrees, rate = setpoint(t_s)
+        move(motor, degrees, rate if use_rate else 0.0)
+        trace.append((t_s, degrees, plant.degrees, plant.duty))
+        utime.sleep_ms(period_ms)
+    return trace
+
+
+def _step_stats(trace, step, tolerance):
+    # overshoot in percent, time to settle within the tolerance for good
+    # (None if it never does) and time spent at full duty, from _axis_run()
+    peak = max(angle for _, _, angle, _ in trace) if step > 0 else min(angle for _, _, angle, _ in trace)
+    overshoot = max(0.0, (peak - step) / step * 100)
+    settle = None
+    for t_s, _, angle, _ in reversed(trace):
+        if abs(angle - step) > tolerance:
+            break
+        settle = t_s
+    saturated = 0.0
+    for run in range(1, len(trace)):
+        if trace[run - 1][3] <= -100 or trace[run - 1][3] >= 100:
+            saturated += trace[run][0] - trace[run - 1][0]
+    return overshoot, settle, saturated
+
+
+def _seconds(t_s):
+    return f"{t_s:4.2f} s" if t_s is not None else "  --  "
+
+
+def controller(steps=(2.0, 10.0, 30.0, 90.0), tolerance=0.25, ramps=(10.0, 30.0)):
+    """!
+    Step responses of the motors with the proportional controller used
+    before and with the PID controller and the gains in @c main, then how far
+    each axis lags setpoints ramping at steady rates with and without
+    feedforward.
+    """
+    sim.install()
+    import main
+    controllers = (
+        ('P only', {'initial_Kp': 0.1}, {'initial_Kp': 0.1}),
+        ('PID', main.YAW_GAINS, main.PITCH_GAINS),
+    )
+    print(f"controller: overshoot and time to settle within {tolerance} deg")
+    for axis in ('yaw', 'pitch'):
+        for how, yaw_gains, pitch_gains in controllers:
+            gains = yaw_gains if axis == 'yaw' else pitch_gains
+            results = []
+            for step in steps:
+                trace = _axis_run(axis, gains, lambda t_s: (step, 0.0), 3.0)
+                overshoot, settle, _ = _step_stats(trace, step, tolerance)
+                results.append(f"{step:g} deg {overshoot:4.1f}% " + _seconds(settle))
+            print(f"  {axis:<5s} {how:<6s} " + ", ".join(results))
+    print("controller: lag behind a moving setpoint, mean over the last second of 3")
+    for axis in ('yaw', 'pitch'):
+        gains = main.YAW_GAINS if axis == 'yaw' else main.PITCH_GAINS
+        for how, use_rate in (('without feedforward', False), ('with feedforward', True)):
+            results = []
+            for ramp in ramps:
+                trace = _axis_run(axis, gains, lambda t_s: (ramp * t_s, ramp), 3.0, use_rate)
+                lags = [wanted - angle for t_s, wanted, angle, _ in trace if t_s >= 2.0]
+                results.append(f"{ramp:g} deg/s {sum(lags) / len(lags):5.2f} deg")
+            print(f"  {axis:<5s} {how:<19s} " + ", ".join(results))
+
+
+def profile(steps=(2.0, 10.0, 30.0, 90.0), tolerance=0.25, retarget=(60.0, -20.0, 0.2)):
+    """!
+    Step responses of the motors with the setpoint jumped straight to the
+    target, as before, and moved along the motion profile with the limits in
+    @c main, including the time spent at full duty cycle; then a move which
+    is retargeted the other way part way through.
+    """
+    sim.install()
+    import main
+    print(f"profile: overshoot, time to settle within {tolerance} deg and time at full duty")
+    first, second, switch_s = retarget
+    for axis in ('yaw', 'pitch'):
+        gains = main.YAW_GAINS if axis == 'yaw' else main.PITCH_GAINS
+        for how, limits in (('jump', {}), ('profile', main.PROFILE_LIMITS)):
+            results = []
+            for step in steps:
+                trace = _axis_run(axis, dict(gains, **limits), lambda t_s: (step, 0.0), 3.0)
+                overshoot, settle, saturated = _step_stats(trace, step, tolerance)
+                results.append(f"{step:g} deg {overshoot:4.1f}% {_seconds(settle)} {saturated:4.2f} s")
+            trace = _axis_run(axis, dict(gains, **limits),
+                              lambda t_s: (first if t_s < switch_s else second, 0.0), 3.0)
+            overshoot, settle, saturated = _step_stats(trace, second, tolerance)
+            results.append(f"{first:g} then {second:g} deg {overshoot:4.1f}% {_seconds(settle)} {saturated:4.2f} s")
+            print(f"  {axis:<5s} {how:<7s} " + ", ".join(results))
+
+
+def encoder(seconds=2.0, period_ms=10, late_ms=20, duties=(50.0, 5.0, 0.5)):
+    """!
+    Speed estimates from an encoder read by a task which runs late by up to
+    @c late_ms, as the motor tasks do when the camera task holds the bus: the
+    change in count per run, as reported before, against the interrupt
+    sampler's estimate, both compared with the simulated motor's true speed.
+    Also how old the newest sample is when the task reads it, and how evenly
+    the samples are spaced.
+    """
+    import random
+    turret = sim.install()
+    import utime
+    import encoder_reader
+    import motor_driver
+    plant = turret.yaw
+    # without static friction the motor can turn as slowly as wanted
+    plant.friction = 0.0
+    driver = motor_driver.MotorDriver('A10', 'B4', 'B5', 3)
+    reader = encoder_reader.EncoderReader('C6', 'C7', 8)
+    sampler = encoder_reader.EncoderSampler(reader, 6)
+    rand = random.Random(405)
+    print(f"encoder: speed error with a {period_ms} ms task up to {late_ms} ms late")
+    for duty in duties:
+        driver.set_duty_cycle(duty)
+        utime.sleep_ms(500)
+        reader.read()
+        errors_delta = []
+        errors_sampled = []
+        ages = []
+        start_us = sim.clock.now_us
+        while sim.clock.now_us - start_us < seconds * 1000000:
+            utime.sleep_ms(period_ms + rand.randrange(late_ms + 1))
+            _, delta = reader.read()
+            speed = sampler.velocity()
+            ages.append(sampler.age())
+            plant.update()
+            true_speed = plant.velocity
+            errors_delta.append(delta * 1000 / period_ms - true_speed)
+            errors_sampled.append(speed - true_speed)
+
+        def rms(errors):
+            return (sum(e * e for e in errors) / len(errors)) ** 0.5 / abs(true_speed) * 100
+
+        print(f"  {true_speed:7.0f} counts/s  count per run {rms(errors_delta):6.1f}% rms,"
+              f" sampled {rms(errors_sampled):5.1f}% rms, newest sample {sum(ages) / len(ages):4.0f} us old"
+              f" on average, {max(ages):4d} us at most")
+    times = [sampler.times[(sampler.head - n) % sampler.size] for n in range(sampler.size)]
+    gaps = [times[n] - times[n + 1] for n in range(len(times) - 1)]
+    print(f"  sample spacing {min(gaps)}-{max(gaps)} us")
+    sampler.stop()
+
+
+def loop(seconds=12, freqs=(1000, 2000), target=(190.0, 5.0)):
+    """!
+    Time between runs of the yaw controller while @c main runs with the
+    camera, with the controller run from the yaw task as before and from a
+    timer interrupt at each of @c freqs.
+    """
+    import contextlib
+    import io
+    sim.install()
+    import cotask
+    import main
+    import motor_run
+    import control_loop
+    from sim.__main__ import run
+
+    move_yaw = motor_run.move_yaw
+    loop_init = control_loop.ControlLoop.__init__
+    print("loop: time between runs of the yaw controller with the camera running")
+    for freq in (None,) + tuple(freqs):
+        times = []
+        loops = []
+
+        def timed_move_yaw(motor, *args):
+            times.append(sim.clock.now_us)
+            return move_yaw(motor, *args)
+
+        def kept_init(self, motor, *args, **kwargs):
+            loop_init(self, motor, *args, **kwargs)
+            loops.append(self)
+
+        motor_run.move_yaw = timed_move_yaw
+        control_loop.ControlLoop.__init__ = kept_init
+        main.LOOP_FREQ = freq
+        cotask.task_list = cotask.TaskList()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                turret = run(seconds, (target,))
+        finally:
+            motor_run.move_yaw = move_yaw
+            control_loop.ControlLoop.__init__ = loop_init
+            main.LOOP_FREQ = None
+        aim = f"aimed at yaw {turret.yaw.degrees:6.2f}, pitch {turret.pitch.degrees:5.2f}"
+        if freq is None:
+            gaps = sorted(times[n + 1] - times[n] for n in range(len(times) - 1))
+            print(f"  yaw task        {gaps[0]:5d}-{gaps[-1]:5d} us, median {gaps[len(gaps) // 2]:5d} us,"
+                  f" 99th percentile {gaps[len(gaps) * 99 // 100]:5d} us; {aim}")
+        else:
+            yaw_loop = loops[0]
+            print(f"  interrupt {freq:4d} Hz {yaw_loop.period_min:5d}-{yaw_loop.period_max:5d} us"
+                  f" over {yaw_loop.runs} runs; {aim}")
+
+
+def scheduler(seconds=20, target=(190.0, 5.0)):
+    """!
+    Deadline misses and CPU use of each task while @c main runs, under
+    priority and earliest-deadline-first scheduling, with the overrun policies
+    and with and without sleeping when idle.
+    """
+    import contextlib
+    import io
+    sim.install()
+    import cotask
+    import main
+    from sim.__main__ import run
+
+    settings = (('priority, catch up, spin', cotask.PRIORITY, cotask.CATCH_UP, False),
+                ('priority, catch up, sleep', cotask.PRIORITY, cotask.CATCH_UP, True),
+                ('priority, skip, sleep', cotask.PRIORITY, cotask.SKIP, True),
+                ('priority, shift, sleep', cotask.PRIORITY, cotask.SHIFT, True),
+                ('EDF, skip, sleep', cotask.EDF, cotask.SKIP, True))
+    print(f"scheduler: {seconds} s of main; misses, skipped releases and runs per task, busy and idle CPU")
+    for label, mode, overrun, idle_sleep in settings:
+        main.SCHED_MODE = mode
+        main.OVERRUN = overrun
+        main.IDLE_SLEEP = idle_sleep
+        cotask.task_list = cotask.TaskList()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                turret = run(seconds, (target,))
+        finally:
+            main.SCHED_MODE = cotask.PRIORITY
+            main.OVERRUN = cotask.SKIP
+            main.IDLE_SLEEP = True
+        task_list = cotask.task_list
+        elapsed = cotask.utime.ticks_diff(cotask.utime.ticks_us(), task_list._since)
+        tasks = sorted((task for pri in task_list.pri_list for task in pri[2:] if task.period),
+                       key=lambda task: task.name)
+        busy = sum(task.utilization(elapsed) for task in tasks)
+        counts = '  '.join(f"{task.name[-1]}:{task.misses:3d}/{task.skipped:3d}/{task._runs:4d}" for task in tasks)
+        print(f"  {label:26s} {counts}  busy {100 * busy:4.1f}%, idle {100 * task_list._idle_us / elapsed:4.1f}%;"
+              f" aimed at {turret.yaw.degrees:6.2f}, {turret.pitch.degrees:5.2f}")
+
+
+def _scan_pass(task_list):
+    # the priority scheduler as it was before the heap: ask every task in
+    # turn, reading the clock each time, until one runs
+    for pri in task_list.pri_list:
+        tries = 2
+        length = len(pri)
+        while tries < length:
+            ran = pri[pri[1]].schedule()
+            tries += 1
+            pri[1] += 1
+            if pri[1] >= length:
+                pri[1] = 2
+            if ran:
+                return
+
+
+def _empty_task():
+    while True:
+        yield 0
+
+
+def overhead(counts=(5, 20, 100), seconds=2.0):
+    """!
+    Cost of a pass of the priority scheduler with @c counts tasks which do
+    nothing, with periods of 10 to 100 ms spread over five priorities,
+    scanning every task as before and with the heap and ready bitmap, without
+    and with a trace ring recording every run. The virtual time per pass is
+    the clock reads it makes; the host time stands for the interpreted work.
+    """
+    import time
+    sim.install()
+    import cotask
+    import task_trace
+    print(f"overhead: priority scheduler passes over {seconds:.0f} s with tasks which do nothing")
+    for count in counts:
+        for label, sched_pass, traced in (('scan', _scan_pass, False), ('heap', cotask.TaskList.pri_sched, False),
+                                          ('traced', cotask.TaskList.pri_sched, True)):
+            sim.clock.reset()
+            task_list = cotask.TaskList()
+            if traced:
+                task_list.trace = task_trace.TraceRing()
+            for num in range(count):
+                task_list.append(cotask.Task(_empty_task, name=f'Task_{num}', priority=num % 5,
+                                             period=10 + 10 * (num % 10), profile=True))
+            passes = 0
+            stop_us = int(seconds * 1000000)
+            wall_start = time.perf_counter()
+            while sim.clock.now_us < stop_us:
+                sched_pass(task_list)
+                passes += 1
+            wall = time.perf_counter() - wall_start
+            tasks = [task for pri in task_list.pri_list for task in pri[2:]]
+            runs = sum(task._runs for task in tasks)
+            late = sum(task._late_sum for task in tasks) / runs
+            print(f"  {count:3d} tasks, {label:6s}: {passes:6d} passes, {sim.clock.now_us / passes:7.1f} us virtual"
+                  f" and {1000000 * wall / passes:6.1f} us host per pass; {runs} runs, {late:7.1f} us late on"
+                  f" average")
+
+
+def shares(ops=20000, seconds=20, target=(190.0, 5.0)):
+    """!
+    Host time per put and get, and interrupt masking, of the shares and
+    queues which disable interrupts and of the single-producer,
+    single-consumer ones which don't; then how often @c main disables
+    interrupts. The host time stands for the interpreted work, which on the
+    board is done with interrupts off in the protected classes.
+    """
+    import contextlib
+    import io
+    import time
+    sim.install()
+    import pyb
+    import task_share
+    from sim.__main__ import run
+
+    pair = task_share.Share('l', thread_protect=True)
+    pair_rate = task_share.Share('l', thread_protect=True)
+    seq = task_share.SeqShare('l', 2)
+    read = [0, 0]
+
+    def protected_pair():
+        pair.put(1)
+        pair_rate.put(2)
+        return pair.get(), pair_rate.get()
+
+    fields = tuple(f'field_{num}' for num in range(11))
+    record = task_share.StructShare(fields)
+    snapshot = [0.0] * len(fields)
+    separate = [task_share.Share('f', thread_protect=True) for _ in fields]
+
+    def separate_shares():
+        for share in separate:
+            share.put(1.0)
+        return [share.get() for share in separate]
+
+    protected = task_share.Share('f', thread_protect=True)
+    unprotected = task_share.Share('f', thread_protect=False)
+    queue = task_share.Queue('l', 16, thread_protect=True)
+    spsc = task_share.SPSCQueue('l', 16)
+    cases = (('Share, interrupts off', lambda: (protected.put(1.0), protected.get())),
+             ('Share, unprotected', lambda: (unprotected.put(1.0), unprotected.get())),
+             ('2 Shares, interrupts off', protected_pair),
+             ('SeqShare of 2', lambda: (seq.put((1, 2)), seq.try_get(read))),
+             ('Queue, interrupts off', lambda: (queue.put(1), queue.get())),
+             ('SPSCQueue', lambda: (spsc.try_put(1), spsc.try_get())),
+             ('11 Shares, interrupts off', separate_shares),
+             ('StructShare of 11', lambda: (record.put_all(snapshot), record.get_all(snapshot))))
+    print(f"shares: host time and interrupt masks per put and get, over {ops} of each")
+    for label, put_get in cases:
+        disables = pyb.irq_disables
+        wall_start = time.perf_counter()
+        for _ in range(ops):
+            put_get()
+        wall = time.perf_counter() - wall_start
+        print(f"  {label:26s} {1000000000 * wall / ops:6.0f} ns, {(pyb.irq_disables - disables) / ops:3.1f} masks")
+
+    disables = pyb.irq_disables
+    with contextlib.redirect_stdout(io.StringIO()):
+        run(seconds, (target,))
+    main_seconds = seconds - 5
+    print(f"  main masks interrupts {(pyb.irq_disables - disables) / main_seconds:.0f} times a second")
+
+
+## Benchmarks by name, in the order they are run by default
+BENCHMARKS = {
+    'registers': registers,
+    'calibration': calibration,
+    'temperature': temperature,
+    'frame': frame,
+    'acquisition': acquisition,
+    'pipeline': pipeline,
+    'roi': roi,
+    'policy': policy,
+    'profiles': profiles,
+    'ready': ready,
+    'localization': localization,
+    'tracking': tracking,
+    'estimator': estimator,
+    'controller': controller,
+    'profile': profile,
+    'encoder': encoder,
+    'loop': loop,
+    'scheduler': scheduler,
+    'overhead': overhead,
+    'shares': shares,
+}
+
+
+if __name__ == '__main__':
+    for bench_name in sys.argv[1:] or BENCHMARKS:
+        BENCHMARKS[bench_name]()
@@ -0,0 +1,255 @@
+"""!
+@file camera.py
+A register-level model of the MLX90640 thermal camera as seen over I2C.
+
+The model keeps the camera's RAM, its control and status registers and an
+EEPROM image in one 16-bit word space indexed by register address. A new
+subpage is "measured" each refresh period: the pixels belonging to that
+subpage are rendered from a synthetic scene into RAM, the status register's
+@c last_subpage field is updated and @c data_available is set, just like the
+real part. Reads and writes cost bus time on the virtual clock.
+"""
+
+import math
+import random
+
+from sim.clock import clock
+
+NUM_ROWS = 24
+NUM_COLS = 32
+IMAGE_SIZE = NUM_ROWS * NUM_COLS
+
+RAM_ADDRESS = 0x0400
+RAM_SIZE = 0x0340
+EEPROM_ADDRESS = 0x2400
+EEPROM_SIZE = 0x0340
+STATUS_ADDRESS = 0x8000
+CONTROL_ADDRESS = 0x800D
+I2C_CONFIG_ADDRESS = 0x800F
+I2C_ADDRESS_ADDRESS = 0x8010
+
+## RAM words other than pixels: Vbe, CP subpage 0, gain, PTAT, CP subpage 1
+#  and Vdd
+RAM_STATE_WORDS = {
+    0x0700: 0x4BF2,
+    0x0708: 0xFFCA,
+    0x070A: 0x1881,
+    0x0720: 0x06AF,
+    0x0728: 0xFFC8,
+    0x072A: 0xCCC5,
+}
+
+## Angle between neighbouring pixels, matching the 1.2566 degree figure used
+#  by @c mlx_cam.MLX_Cam.find_max()
+DEG_PER_PIXEL = 1.2566
+
+
+class Scene:
+    """!
+    A synthetic thermal scene: a uniform background with hot spots placed at
+    world bearings. Each hot spot is a 2-D Gaussian in (azimuth, elevation)
+    and may drift at a constant rate.
+    """
+
+    def __init__(self, background=-300, noise=20, seed=405):
+        self.background = background
+        self.noise = noise
+        self.targets = []
+        self._rng = random.Random(seed)
+
+    def add_target(self, az, el, amplitude=2500, sigma=2.0,
+                   az_rate=0.0, el_rate=0.0):
+        """!
+        Put a hot spot into the scene.
+        @param az The azimuth of the target in turret yaw degrees
+        @param el The elevation of the target in turret pitch degrees
+        @param amplitude Peak raw count above the background
+        @param sigma Width of the hot spot in degrees
+        @param az_rate Azimuth drift in degrees per second
+        @param el_rate Elevation drift in degrees per second
+        """
+        self.targets.append([az, el, amplitude, sigma, az_rate, el_rate])
+
+    def render(self, az, el, t_s):
+        value = self.background
+        for t_az, t_el, amp, sigma, az_rate, el_rate in self.targets:
+            d_az = az - (t_az + az_rate * t_s)
+            d_el = el - (t_el + el_rate * t_s)
+            value += amp * math.exp(-(d_az * d_az + d_el * d_el)
+                                    / (2 * sigma * sigma))
+        if self.noise:
+            value += self._rng.gauss(0, self.noise)
+        return max(-32768, min(32767, int(value)))
+
+
+def synthetic_eeprom(seed=90640):
+    """!
+    Make up a plausible EEPROM for the camera, loosely following the worked
+    example in the MLX90640 datasheet, with a little pixel-to-pixel spread in
+    offset, sensitivity and Kta.
+    @return A list of 832 EEPROM words
+    """
+    rng = random.Random(seed)
+    words = [0] * EEPROM_SIZE
+    fixed = {
+        0x10: 0x4210,   # Kptat, offset scale: row 2, col 1, remainder 0
+        0x11: 0xFFBB,   # average pixel offset
+        0x20: 0x6444,   # alpha scale, sensitivity scale: row, col, remainder
+        0x21: 0x2FF1,   # average pixel sensitivity
+        0x30: 0x18EF,   # gain
+        0x31: 0x2FF1,   # PTAT at 25 C
+        0x32: 0x5952,   # Kv PTAT, Kt PTAT
+        0x33: 0x9D68,   # Kvdd, Vdd at 25 C
+        0x34: 0x2222,   # Kv averages
+        0x36: 0x5354,   # Kta averages, odd rows
+        0x37: 0x5452,   # Kta averages, even rows
+        0x38: 0x2363,   # resolution, Kv scale, Kta scales
+        0x3C: 0xF020,   # KsTa, TGC
+        0x3D: 0x9797,   # KsTo 1, 2
+        0x3E: 0x9797,   # KsTo 3, 4
+        0x3F: 0x2889,   # step, CT3, CT4, KsTo scale
+    }
+    for addr, word in fixed.items():
+        words[addr] = word
+    # row and column offset and sensitivity corrections
+    for addr in list(range(0x12, 0x20)) + list(range(0x22, 0x30)):
+        words[addr] = 0x1111
+    for idx in range(IMAGE_SIZE):
+        offset = rng.randint(-8, 8) & 0x3F
+        alpha = rng.randint(-8, 8) & 0x3F
+        kta = rng.randint(1, 3)
+        words[0x40 + idx] = offset << 10 | alpha << 4 | kta << 1
+    return words
+
+
+def _chess_sp(idx):
+    return (idx // 32 - (idx // 64) * 2) ^ (idx - (idx // 2) * 2)
+
+
+def _interleaved_sp(idx):
+    return idx // 32 - (idx // 64) * 2
+
+
+class MLX90640Device:
+    """!
+    The simulated camera. Attach it to a @c machine.I2C bus with
+    @c sim.machine.attach() (done by @c sim.install()).
+    """
+
+    def __init__(self, scene=None, address=0x33, pose=None, eeprom=None):
+        """!
+        @param scene The @c Scene being looked at; a single target is used if
+               none is given
+        @param address The 7-bit I2C address of the camera
+        @param pose A function returning the (yaw, pitch) of the camera in
+               degrees, or @c None for a fixed camera looking at (0, 0)
+        @param eeprom An optional sequence of 832 EEPROM words; if none is
+               given, @c synthetic_eeprom() is used
+        """
+        self.address = address
+        self.scene = scene or Scene()
+        self.pose = pose or (lambda: (0.0, 0.0))
+        self._words = {}
+        for addr in range(RAM_SIZE):
+            self._words[RAM_ADDRESS + addr] = 0
+        # ambient, supply and gain readings from the datasheet's worked
+        # example, so that calibrated temperatures come out sensible
+        self._words.update(RAM_STATE_WORDS)
+        eeprom = eeprom if eeprom is not None else synthetic_eeprom()
+        for addr in range(EEPROM_SIZE):
+            self._words[EEPROM_ADDRESS + addr] = eeprom[addr]
+        self._words[STATUS_ADDRESS] = 0x0000
+        # power-on default: chess pattern, 18-bit ADC, 2 Hz, subpages on
+        self._words[CONTROL_ADDRESS] = 0x1901
+        self._words[I2C_CONFIG_ADDRESS] = 0x0000
+        self._words[I2C_ADDRESS_ADDRESS] = 0xBE00 | address
+
+        ## How far the camera's oscillator runs from its nominal rate, as a
+        #  fraction; 0.02 measures subpages 2% faster than the refresh rate
+        self.clock_error = 0.0
+        ## When the last subpage became ready, in virtual microseconds
+        self.ready_us = None
+
+        self._next_subpage = 0
+        self._next_frame_us = clock.now_us + self.subpage_period_us()
+
+        ## Counters which benchmarks may inspect and reset
+        self.transactions = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.status_reads = 0
+        self.frames = 0
+
+    # -- measurement model ---------------------------------------------------
+
+    def subpage_period_us(self):
+        rate_code = (self._words[CONTROL_ADDRESS] >> 7) & 0x7
+        return int(1000000 / 2.0 ** (rate_code - 1) / (1 + self.clock_error))
+
+    def _update(self):
+        # measure every subpage which has come due since the last access
+        while clock.now_us >= self._next_frame_us:
+            self._measure(self._next_subpage)
+            self._next_frame_us += self.subpage_period_us()
+            if self._words[CONTROL_ADDRESS] & 0x1:
+                self._next_subpage ^= 1
+
+    def _measure(self, sp_id):
+        chess = self._words[CONTROL_ADDRESS] & 0x1000
+        get_sp = _chess_sp if chess else _interleaved_sp
+        yaw, pitch = self.pose()
+        t_s = self._next_frame_us / 1e6
+        words = self._words
+        # the scene is in counts at the power-on 18 bit ADC resolution; each
+        # bit more or less doubles or halves them
+        scale = 2.0 ** (((words[CONTROL_ADDRESS] >> 10) & 0x3) - 2)
+        for idx in range(IMAGE_SIZE):
+            if get_sp(idx) != sp_id:
+                continue
+            row, col = divmod(idx, NUM_COLS)
+            az = yaw + DEG_PER_PIXEL * (col - (NUM_COLS // 2 - 1))
+            el = pitch + DEG_PER_PIXEL * (NUM_ROWS // 2 - row)
+            value = int(self.scene.render(az, el, t_s) * scale)
+            value = max(-32768, min(32767, value))
+            words[RAM_ADDRESS + idx] = value & 0xFFFF
+        status = words[STATUS_ADDRESS] & ~0x000F
+        words[STATUS_ADDRESS] = status | 0x0008 | sp_id
+        self.ready_us = self._next_frame_us
+        self.frames += 1
+
+    # -- bus interface -------------------------------------------------------
+
+    def read(self, mem_addr, nbytes):
+        self._update()
+        self.transactions += 1
+        self.bytes_read += nbytes
+        if mem_addr == STATUS_ADDRESS:
+            self.status_reads += 1
+        out = bytearray(nbytes)
+        for pos in range(0, nbytes, 2):
+            word = self._words.get(mem_addr + pos // 2, 0)
+            out[pos] = word >> 8
+            if pos + 1 < nbytes:
+                out[pos + 1] = word & 0xFF
+        return out
+
+    def write(self, mem_addr, data):
+        self._update()
+        self.transactions += 1
+        self.bytes_written += len(data)
+        for pos in range(0, len(data) - 1, 2):
+            addr = mem_addr + pos // 2
+            word = data[pos] << 8 | data[pos + 1]
+            if addr == STATUS_ADDRESS:
+                # only the data_available and overwrite bits are writable
+                word = (self._words[addr] & 0x0007) | (word & 0x0018)
+            if addr in self._words and not (
+                    EEPROM_ADDRESS <= addr < EEPROM_ADDRESS + EEPROM_SIZE):
+                self._words[addr] = word
+
+    def reset_counters(self):
+        self.transactions = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.status_reads = 0
+        self.frames = 0
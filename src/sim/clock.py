@@ -0,0 +1,90 @@
+"""!
+@file clock.py
+The virtual clock which drives the whole simulation.
+
+Nothing in the simulation looks at the host's wall clock. Time only moves when
+the code under test sleeps, reads the time, or spends time on a simulated bus,
+so a run proceeds as fast as the host can execute it and is repeatable from
+one run to the next.
+"""
+
+
+class SimulationEnd(KeyboardInterrupt):
+    """!
+    Raised by the clock when a run's time limit has been reached. It is a
+    @c KeyboardInterrupt so that @c main.main() shuts down the same way it
+    does when Ctrl-C is pressed on the board.
+    """
+
+
+class Clock:
+    """!
+    A microsecond clock with optional timed callbacks.
+    """
+
+    ## Time charged for each read of the clock, in microseconds. This stands
+    #  for a @c ticks_us() call plus the interpreted code around it on the
+    #  STM32L476, and keeps a scheduler which spins on the clock from
+    #  spinning forever.
+    READ_COST_US = 10
+
+    def __init__(self):
+        self.now_us = 0
+        self.stop_us = None
+        # timed callbacks: [due_us, period_us, callback] lists
+        self._timers = []
+
+    def reset(self, stop_us=None):
+        self.now_us = 0
+        self.stop_us = stop_us
+        self._timers = []
+
+    def advance(self, us):
+        """!
+        Move time forward, firing any timed callbacks which fall due along
+        the way.
+        @param us The number of microseconds to advance
+        """
+        target = self.now_us + max(0, int(us))
+        if not self._timers and self.stop_us is None:
+            self.now_us = target
+            return
+        while self._timers:
+            entry = min(self._timers, key=lambda t: t[0])
+            if entry[0] > target:
+                break
+            self.now_us = entry[0]
+            if entry[1]:
+                entry[0] += entry[1]
+            else:
+                self._timers.remove(entry)
+            entry[2]()
+        self.now_us = target
+        if self.stop_us is not None and self.now_us >= self.stop_us:
+            self.stop_us = None
+            raise SimulationEnd
+
+    def read(self):
+        self.advance(self.READ_COST_US)
+        return self.now_us
+
+    def next_due(self):
+        """!
+        @return The time of the next timed callback, or @c None
+        """
+        if not self._timers:
+            return None
+        return min(t[0] for t in self._timers)
+
+    def every(self, period_us, callback):
+        entry = [self.now_us + period_us, period_us, callback]
+        self._timers.append(entry)
+        return entry
+
+    def cancel(self, entry):
+        if entry in self._timers:
+            self._timers.remove(entry)
+
+
+## The clock shared by every simulated module
+clock = Clock()
@@ -0,0 +1,91 @@
+"""!
+@file machine.py
+Stand-in for the parts of MicroPython's @c machine module used by the turret:
+an I2C controller with simulated devices attached to it.
+"""
+
+from sim.clock import clock
+
+# devices on each bus, by bus id: { bus_id: { address: device } }
+_buses = {}
+
+
+def attach(bus_id, device):
+    """!
+    Connect a simulated device (such as @c sim.camera.MLX90640Device) to a
+    bus. The device needs @c read(mem_addr, nbytes) and
+    @c write(mem_addr, data) methods and an @c address attribute.
+    """
+    _buses.setdefault(bus_id, {})[device.address] = device
+
+
+def detach_all():
+    _buses.clear()
+
+
+class Pin:
+    IN = 0
+    OUT = 1
+    OPEN_DRAIN = 2
+    PULL_UP = 1
+    PULL_DOWN = 2
+
+    def __init__(self, pin_id, mode=-1, pull=-1, value=None):
+        self.id = pin_id
+        self._value = value or 0
+
+    def value(self, value=None):
+        if value is None:
+            return self._value
+        self._value = int(bool(value))
+
+
+class I2C:
+    """!
+    An I2C controller. Each transaction advances the virtual clock by the
+    time the bytes would take on the wire at the configured frequency, plus
+    a fixed software overhead.
+    """
+
+    ## Fixed cost of setting up one transaction, in microseconds
+    OVERHEAD_US = 30
+
+    def __init__(self, bus_id, scl=None, sda=None, freq=400000, timeout=50000):
+        self.bus_id = bus_id
+        self.freq = freq
+        self.transactions = 0
+        self.nbytes = 0
+
+    def init(self, scl=None, sda=None, freq=400000, timeout=50000):
+        self.freq = freq
+
+    def _device(self, addr):
+        try:
+            return _buses.get(self.bus_id, {})[addr]
+        except KeyError:
+            raise OSError(19) from None     # ENODEV, as on the board
+
+    def _spend(self, nbytes, addrsize):
+        # start + address byte, memory address, repeated start + address byte
+        overhead = 2 + addrsize // 8
+        clock.advance(self.OVERHEAD_US
+                      + (overhead + nbytes) * 9 * 1000000 // self.freq)
+        self.transactions += 1
+        self.nbytes += nbytes
+
+    def scan(self):
+        return sorted(_buses.get(self.bus_id, {}))
+
+    def readfrom_mem(self, addr, memaddr, nbytes, *, addrsize=8):
+        data = self._device(addr).read(memaddr, nbytes)
+        self._spend(nbytes, addrsize)
+        return bytes(data)
+
+    def readfrom_mem_into(self, addr, memaddr, buf, *, addrsize=8):
+        data = self._device(addr).read(memaddr, len(buf))
+        buf[:] = data
+        self._spend(len(buf), addrsize)
+
+    def writeto_mem(self, addr, memaddr, buf, *, addrsize=8):
+        self._device(addr).write(memaddr, bytes(buf))
+        self._spend(len(buf), addrsize)
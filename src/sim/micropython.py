@@ -0,0 +1,25 @@
+"""!
+@file micropython.py
+Stand-in for the @c micropython module. The code emitters are no-ops here.
+"""
+
+
+def const(value):
+    return value
+
+
+def native(func):
+    return func
+
+
+def viper(func):
+    return func
+
+
+def alloc_emergency_exception_buf(size):
+    pass
+
+
+def schedule(func, arg):
+    func(arg)
+    return True
@@ -0,0 +1,72 @@
+"""!
+@file plant.py
+A brushed DC motor with a quadrature encoder, driven by PWM duty cycle.
+
+The motor is modelled as a first order system from duty cycle to shaft speed
+with a static friction band, which is close enough to the gearmotors on the
+turret to tune controllers against. The state is brought up to date lazily,
+using the exact solution for a constant input, whenever the duty cycle
+changes or the encoder is read.
+"""
+
+import math
+
+from sim.clock import clock
+
+
+class MotorPlant:
+    """!
+    One axis of the turret: motor, gearing and encoder.
+    """
+
+    def __init__(self, name, max_speed=45000.0, tau=0.05, friction=8.0,
+                 counts_per_deg=16384 / 360 * 5.8, position=0.0):
+        """!
+        @param name A name for diagnostic printouts
+        @param max_speed Encoder counts per second at 100% duty cycle
+        @param tau Mechanical time constant in seconds
+        @param friction Duty cycle, in percent, below which the motor stalls
+        @param counts_per_deg Encoder counts per degree of turret motion
+        @param position Starting position in encoder counts
+        """
+        self.name = name
+        self.max_speed = max_speed
+        self.tau = tau
+        self.friction = friction
+        self.counts_per_deg = counts_per_deg
+        self.position = float(position)
+        self.velocity = 0.0
+        self.duty = 0.0
+        self._last_us = clock.now_us
+
+    def update(self):
+        now = clock.now_us
+        dt = (now - self._last_us) / 1e6
+        self._last_us = now
+        if dt <= 0:
+            return
+        duty = self.duty
+        if -self.friction < duty < self.friction:
+            target = 0.0
+        else:
+            target = self.max_speed * duty / 100.0
+        decay = math.exp(-dt / self.tau)
+        self.position += (target * dt
+                          + (self.velocity - target) * self.tau * (1 - decay))
+        self.velocity = target + (self.velocity - target) * decay
+
+    def set_duty(self, duty):
+        self.update()
+        self.duty = max(-100.0, min(100.0, duty))
+
+    def counter(self):
+        """!
+        @return The 16-bit encoder timer count, as the hardware would show it
+        """
+        self.update()
+        return int(math.floor(self.position)) & 0xFFFF
+
+    @property
+    def degrees(self):
+        self.update()
+        return self.position / self.counts_per_deg
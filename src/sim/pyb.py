@@ -0,0 +1,244 @@
+"""!
+@file pyb.py
+Stand-in for the parts of MicroPython's @c pyb module used by the turret:
+pins, timers in PWM and encoder mode, timer callbacks and interrupt masking.
+
+Timers are connected to the simulated hardware through @c wire_pwm() and
+@c wire_encoder(); @c sim.install() wires them the way the turret is wired.
+"""
+
+from sim.clock import clock
+
+# timer number -> plant, for PWM outputs and for encoder inputs
+_pwm_plants = {}
+_encoder_plants = {}
+
+
+def wire_pwm(timer, plant):
+    _pwm_plants[timer] = plant
+
+
+def wire_encoder(timer, plant):
+    _encoder_plants[timer] = plant
+
+
+def unwire_all():
+    _pwm_plants.clear()
+    _encoder_plants.clear()
+
+
+_irq_enabled = True
+
+## How many times interrupts have been disabled, for the benchmarks
+irq_disables = 0
+
+
+def disable_irq():
+    global _irq_enabled, irq_disables
+    state = _irq_enabled
+    _irq_enabled = False
+    irq_disables += 1
+    return state
+
+
+def enable_irq(state=True):
+    global _irq_enabled
+    _irq_enabled = state
+
+
+def info():
+    pass
+
+
+def millis():
+    return clock.read() // 1000
+
+
+def micros():
+    return clock.read()
+
+
+def elapsed_millis(start):
+    return millis() - start
+
+
+def elapsed_micros(start):
+    return micros() - start
+
+
+def delay(ms):
+    clock.advance(ms * 1000)
+
+
+def udelay(us):
+    clock.advance(us)
+
+
+def wfi():
+    # sleep until the next timed event, or for a millisecond (the SysTick)
+    due = clock.next_due()
+    step = 1000 - clock.now_us % 1000
+    if due is not None:
+        step = min(step, max(0, due - clock.now_us))
+    clock.advance(step)
+
+
+class _CpuPins:
+    def __getattr__(self, name):
+        return name
+
+
+class Pin:
+    IN = 0
+    OUT_PP = 1
+    OUT_OD = 2
+    AF_PP = 3
+    AF_OD = 4
+    ANALOG = 5
+    PULL_NONE = 0
+    PULL_UP = 1
+    PULL_DOWN = 2
+
+    cpu = _CpuPins()
+    board = _CpuPins()
+
+    def __init__(self, pin_id, mode=IN, pull=PULL_NONE, af=-1):
+        self.id = pin_id
+        self.mode = mode
+        self._value = 0
+
+    def value(self, value=None):
+        if value is None:
+            return self._value
+        self._value = int(bool(value))
+
+    def high(self):
+        self._value = 1
+
+    def low(self):
+        self._value = 0
+
+    def name(self):
+        return str(self.id)
+
+
+class TimerChannel:
+    def __init__(self, timer, channel, mode):
+        self.timer = timer
+        self.channel = channel
+        self.mode = mode
+        self._percent = 0.0
+        self._width = 0
+
+    def pulse_width_percent(self, value=None):
+        if value is None:
+            return self._percent
+        self._percent = float(value)
+        self.timer._pwm_changed()
+
+    def pulse_width(self, value=None):
+        if value is None:
+            return self._width
+        self._width = value
+        self._percent = 100.0 * value / (self.timer.period() + 1)
+        self.timer._pwm_changed()
+
+    def capture(self, value=None):
+        return 0
+
+    def compare(self, value=None):
+        return 0
+
+    def callback(self, fun):
+        pass
+
+
+class Timer:
+    PWM = 0
+    PWM_INVERTED = 1
+    OC_TIMING = 2
+    IC = 3
+    ENC_A = 4
+    ENC_B = 5
+    ENC_AB = 6
+    UP = 0
+    DOWN = 1
+
+    ## The clock the timers count, in Hz, as on the STM32L476
+    SOURCE_FREQ = 80000000
+
+    def __init__(self, num, freq=None, prescaler=0, period=0xFFFF, **kwargs):
+        self.num = num
+        self._freq = freq
+        self._period = period
+        self._channels = {}
+        self._callback = None
+        self._entry = None
+        self._count = 0
+
+    def init(self, *, freq=None, prescaler=0, period=0xFFFF, **kwargs):
+        self.deinit()
+        self._freq = freq
+        self._period = period
+        if self._callback is not None:
+            self.callback(self._callback)
+
+    def deinit(self):
+        if self._entry is not None:
+            clock.cancel(self._entry)
+            self._entry = None
+
+    def freq(self, value=None):
+        if value is None:
+            return self._freq
+        self.init(freq=value)
+
+    def period(self, value=None):
+        """!
+        The auto-reload value; with a frequency, the largest which fits in
+        16 bits after prescaling, as MicroPython chooses it.
+        """
+        if value is not None:
+            self._period = value
+            return None
+        if not self._freq:
+            return self._period
+        ticks = self.SOURCE_FREQ // self._freq
+        while ticks > 0x10000:
+            ticks //= 2
+        return ticks - 1
+
+    def channel(self, channel, mode=None, pin=None, **kwargs):
+        if mode is None:
+            return self._channels.get(channel)
+        chan = TimerChannel(self, channel, mode)
+        self._channels[channel] = chan
+        return chan
+
+    def counter(self, value=None):
+        plant = _encoder_plants.get(self.num)
+        if plant is not None:
+            return plant.counter()
+        return self._count
+
+    def callback(self, fun):
+        """!
+        Run @c fun(timer) at the timer's frequency on the virtual clock, as
+        an interrupt would.
+        """
+        self.deinit()
+        self._callback = fun
+        if fun is not None and self._freq:
+            self._entry = clock.every(int(1000000 / self._freq),
+                                      lambda: fun(self))
+
+    def _pwm_changed(self):
+        plant = _pwm_plants.get(self.num)
+        if plant is None:
+            return
+        # channel 1 drives the motor one way and channel 2 the other, as in
+        # motor_driver.MotorDriver
+        ch1 = self._channels.get(1)
+        ch2 = self._channels.get(2)
+        duty = (ch1._percent if ch1 else 0.0) - (ch2._percent if ch2 else 0.0)
+        plant.set_duty(duty)
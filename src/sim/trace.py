@@ -0,0 +1,251 @@
+"""!
+@file sim/trace.py
+Read a scheduler trace dumped by @c task_trace.TraceRing and show it.
+
+The trace may come from the board, saved to flash or captured from the USB
+serial port, or from a simulated run with @c python -m sim --trace. From the
+@c src directory:
+@code
+    python -m sim.trace trace.bin
+    python -m sim.trace trace.bin --width 120 --span 100
+@endcode
+This prints a table of each task's run times and lateness percentiles and a
+timeline of the most recent runs, one row per task. Percentiles of the run
+times in the ring are exact; those taken from the histograms, which cover
+every run since the profile was last reset, are the upper edges of their
+buckets, so they are within a factor of two.
+"""
+
+import argparse
+import struct
+
+# the layouts in task_trace.py, repeated so this runs without MicroPython;
+# version 1 had one byte task ids
+_HEADER = '<4sHHHHI'
+_LAYOUTS = {1: ('<BBlHHH', '<IBhI'), 2: ('<HBlHHH', '<IHhI')}
+_TICKS_PERIOD = 1 << 30
+
+
+class TraceTask:
+    """!
+    A task described in a trace.
+    """
+
+    def __init__(self, task_id, name, priority, period, misses, overruns,
+                 run_hist, late_hist):
+        self.id = task_id
+        self.name = name
+        self.priority = priority
+        ## The period in microseconds, or @c None for a task run by go()
+        self.period = period
+        self.misses = misses
+        self.overruns = overruns
+        self.run_hist = run_hist
+        self.late_hist = late_hist
+        ## The task's (start, state, duration) records, start times in
+        #  microseconds from the first record in the trace
+        self.runs = []
+
+
+class Trace:
+    """!
+    The contents of a trace dump.
+    """
+
+    def __init__(self, version, dump_us, tasks, records):
+        self.version = version
+        ## When the dump was made, from @c utime.ticks_us() on the board
+        self.dump_us = dump_us
+        ## The tasks by id
+        self.tasks = tasks
+        ## The (start, task id, state, duration) records, oldest first, start
+        #  times in microseconds from the first record
+        self.records = records
+
+
+def decode(data):
+    """!
+    Decode a trace dump.
+    @param data The bytes of the dump
+    @return A @c Trace
+    """
+    magic, version, n_tasks, n_buckets, n_records, dump_us = \
+        struct.unpack_from(_HEADER, data, 0)
+    if magic != b'CTRC':
+        raise ValueError("not a task trace dump")
+    if version not in _LAYOUTS:
+        raise ValueError(f"unknown trace format version {version}")
+    task_format, record_format = _LAYOUTS[version]
+    pos = struct.calcsize(_HEADER)
+    hist_format = f'<{n_buckets}I'
+    hist_size = struct.calcsize(hist_format)
+    tasks = {}
+    for _ in range(n_tasks):
+        task_id, priority, period, misses, overruns, name_len = \
+            struct.unpack_from(task_format, data, pos)
+        pos += struct.calcsize(task_format)
+        name = data[pos:pos + name_len].decode()
+        pos += name_len
+        run_hist = list(struct.unpack_from(hist_format, data, pos))
+        pos += hist_size
+        late_hist = list(struct.unpack_from(hist_format, data, pos))
+        pos += hist_size
+        tasks[task_id] = TraceTask(task_id, name, priority,
+                                   None if period < 0 else period, misses,
+                                   overruns, run_hist, late_hist)
+
+    records = []
+    record_size = struct.calcsize(record_format)
+    first = last = None
+    elapsed = 0
+    for _ in range(n_records):
+        start, task_id, state, duration = \
+            struct.unpack_from(record_format, data, pos)
+        pos += record_size
+        # the board's microsecond ticks wrap around every 2 ** 30 us
+        if first is None:
+            first = start
+        else:
+            elapsed += (start - last) % _TICKS_PERIOD
+        last = start
+        records.append((elapsed, task_id, state, duration))
+        if task_id in tasks:
+            tasks[task_id].runs.append((elapsed, state, duration))
+    return Trace(version, dump_us, tasks, records)
+
+
+def load(path):
+    """!
+    Read and decode a trace dump from a file.
+    @param path The file's name
+    @return A @c Trace
+    """
+    with open(path, 'rb') as stream:
+        return decode(stream.read())
+
+
+def percentile(values, fraction):
+    """!
+    Find a percentile of some values, by the nearest rank.
+    @param values The values, in any order
+    @param fraction The percentile as a fraction, such as 0.99
+    @return The value, or @c None if there are none
+    """
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1,
+                      int(fraction * len(ordered) + 0.999999) - 1))
+    return ordered[rank]
+
+
+def hist_percentile(hist, fraction):
+    """!
+    Find a percentile of the values counted in a histogram.
+    @param hist The bucket counts, bucket @c n counting values below
+           2 ** (n + 1) microseconds
+    @param fraction The percentile as a fraction
+    @return The upper edge of the bucket holding the percentile in
+            microseconds, @c float('inf') if it is in the last bucket, or
+            @c None if the histogram is empty
+    """
+    total = sum(hist)
+    if not total:
+        return None
+    rank = fraction * total
+    count = 0
+    for bucket, bucket_count in enumerate(hist):
+        count += bucket_count
+        if count >= rank:
+            return float('inf') if bucket == len(hist) - 1 \
+                else 2 ** (bucket + 1)
+    return float('inf')
+
+
+def _ms(us):
+    if us is None:
+        return '       -'
+    if us == float('inf'):
+        return '   >long'
+    return f"{us / 1000:8.3f}"
+
+
+def report(trace):
+    """!
+    Make a table of each task's run times and lateness.
+    @param trace A @c Trace
+    @return The table as a string, times in milliseconds
+    """
+    lines = ['TASK             PERIOD  MISSES  |  RING RUNS   P50 RUN'
+             '   P99 RUN   MAX RUN  |  ALL RUNS  P99 RUN<  P50 LATE<'
+             ' P99 LATE<']
+    for task in sorted(trace.tasks.values(), key=lambda task: task.id):
+        durations = [run[2] for run in task.runs]
+        period = '       -' if task.period is None \
+            else f"{task.period / 1000:8.1f}"
+        lines.append(
+            f"{task.name:<16s}{period}{task.misses:8d}  |{len(durations):11d}"
+            f"  {_ms(percentile(durations, 0.5))}  "
+            f"{_ms(percentile(durations, 0.99))}  "
+            f"{_ms(max(durations) if durations else None)}  |"
+            f"{sum(task.run_hist):10d}  {_ms(hist_percentile(task.run_hist, 0.99))}"
+            f"  {_ms(hist_percentile(task.late_hist, 0.5))}"
+            f"  {_ms(hist_percentile(task.late_hist, 0.99))}")
+    return '\n'.join(lines)
+
+
+def timeline(trace, width=100, span_us=None):
+    """!
+    Draw the most recent runs of each task as rows of characters.
+    Each column stands for an equal slice of time; a column is @c # where the
+    task ran for most of the slice, @c + where it ran for part of it and @c .
+    where it didn't run.
+    @param trace A @c Trace
+    @param width The number of columns
+    @param span_us How much time to show, ending with the last record, or
+           @c None for all the records
+    @return The timeline as a string
+    """
+    if not trace.records:
+        return '(no runs recorded)'
+    end = max(start + duration for start, _, _, duration in trace.records)
+    begin = 0 if span_us is None else max(0, end - span_us)
+    slice_us = max(1, (end - begin) / width)
+    lines = [f"{(end - begin) / 1000:.1f} ms, {slice_us / 1000:.3f} ms per "
+             f"column"]
+    for task in sorted(trace.tasks.values(), key=lambda task: task.id):
+        busy = [0.0] * width
+        ran = [False] * width
+        for start, _, duration in task.runs:
+            stop = start + duration
+            if stop < begin:
+                continue
+            first = int((max(start, begin) - begin) / slice_us)
+            last = min(width - 1, int((stop - begin) / slice_us))
+            for col in range(first, last + 1):
+                col_start = begin + col * slice_us
+                overlap = min(stop, col_start + slice_us) - max(start, col_start)
+                busy[col] += max(overlap, 0)
+                ran[col] = True
+        row = ''.join('#' if busy[col] >= slice_us / 2 else '+' if ran[col]
+                      else '.' for col in range(width))
+        lines.append(f"{task.name:<16s}{row}")
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        prog='python -m sim.trace',
+        description='Show a scheduler trace dumped by task_trace.TraceRing.')
+    parser.add_argument('file', help='the trace dump')
+    parser.add_argument('--width', type=int, default=100,
+                        help='timeline columns (default 100)')
+    parser.add_argument('--span', type=float,
+                        help='milliseconds of timeline to show, ending with '
+                             'the last run (default all)')
+    args = parser.parse_args()
+    dumped = load(args.file)
+    print(report(dumped))
+    print()
+    print(timeline(dumped, args.width,
+                   None if args.span is None else args.span * 1000))
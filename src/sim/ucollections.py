@@ -0,0 +1,6 @@
+"""!
+@file ucollections.py
+Stand-in for the @c ucollections module.
+"""
+
+from collections import namedtuple, deque, OrderedDict
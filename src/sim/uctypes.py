@@ -0,0 +1,79 @@
+"""!
+@file uctypes.py
+A pure Python stand-in for the parts of MicroPython's @c uctypes module used by
+the MLX90640 register decoder: scalar fields and 16-bit bitfields laid over a
+byte buffer.
+"""
+
+import struct as _struct
+
+_TYPE_SHIFT = 27
+_OFFSET_MASK = (1 << 17) - 1
+
+UINT8 = 0 << 27
+INT8 = 1 << 27
+UINT16 = 2 << 27
+INT16 = 3 << 27
+BFUINT16 = 10 << 27
+
+BF_POS = 17
+BF_LEN = 22
+
+LITTLE_ENDIAN = 0
+BIG_ENDIAN = 1
+NATIVE = 2
+
+_SCALARS = {
+    UINT8 >> _TYPE_SHIFT: 'B',
+    INT8 >> _TYPE_SHIFT: 'b',
+    UINT16 >> _TYPE_SHIFT: 'H',
+    INT16 >> _TYPE_SHIFT: 'h',
+}
+
+
+class _Address:
+    # stands in for a raw pointer; it just carries the buffer along
+    def __init__(self, buf):
+        self.buf = buf
+
+
+def addressof(buf):
+    return _Address(buf)
+
+
+class struct:
+    def __init__(self, addr, layout, layout_type=NATIVE):
+        object.__setattr__(self, '_buf', addr.buf)
+        object.__setattr__(self, '_layout', layout)
+        object.__setattr__(self, '_endian',
+                           '>' if layout_type == BIG_ENDIAN else '<')
+
+    def _decode(self, name):
+        desc = self._layout[name]
+        kind = desc >> _TYPE_SHIFT
+        offset = desc & _OFFSET_MASK
+        if kind == BFUINT16 >> _TYPE_SHIFT:
+            fmt = self._endian + 'H'
+            pos = (desc >> BF_POS) & 0x1F
+            bits = (desc >> BF_LEN) & 0x1F
+            return fmt, offset, pos, bits
+        return self._endian + _SCALARS[kind], offset, None, None
+
+    def __getattr__(self, name):
+        if name not in self._layout:
+            raise AttributeError(name)
+        fmt, offset, pos, bits = self._decode(name)
+        value = _struct.unpack_from(fmt, self._buf, offset)[0]
+        if pos is None:
+            return value
+        return (value >> pos) & ((1 << bits) - 1)
+
+    def __setattr__(self, name, value):
+        fmt, offset, pos, bits = self._decode(name)
+        if pos is None:
+            _struct.pack_into(fmt, self._buf, offset, value)
+            return
+        mask = ((1 << bits) - 1) << pos
+        word = _struct.unpack_from(fmt, self._buf, offset)[0]
+        word = (word & ~mask) | ((value << pos) & mask)
+        _struct.pack_into(fmt, self._buf, offset, word)
@@ -0,0 +1,43 @@
+"""!
+@file utime.py
+Stand-in for MicroPython's @c utime module, running on the virtual clock.
+"""
+
+from sim.clock import clock
+
+_TICKS_PERIOD = 1 << 30
+_TICKS_MAX = _TICKS_PERIOD - 1
+_TICKS_HALF = _TICKS_PERIOD // 2
+
+
+def ticks_us():
+    return clock.read() & _TICKS_MAX
+
+
+def ticks_ms():
+    return (clock.read() // 1000) & _TICKS_MAX
+
+
+def ticks_add(ticks, delta):
+    return (ticks + delta) & _TICKS_MAX
+
+
+def ticks_diff(ticks1, ticks2):
+    diff = (ticks1 - ticks2) & _TICKS_MAX
+    return ((diff + _TICKS_HALF) & _TICKS_MAX) - _TICKS_HALF
+
+
+def sleep_us(us):
+    clock.advance(us)
+
+
+def sleep_ms(ms):
+    clock.advance(ms * 1000)
+
+
+def sleep(s):
+    clock.advance(s * 1000000)
+
+
+def time():
+    return clock.now_us // 1000000
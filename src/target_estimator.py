@@ -0,0 +1,136 @@
+"""!
+    @file                       target_estimator.py
+    @brief                      Estimates where the target is and how fast it moves, for aiming the turret
+    @details                    Sightings of the target come from the camera a second or so apart, each one stamped
+                                with the time its image was taken and the bearing worked out from the turret's pose
+                                at that time. A @c TargetEstimator smooths them with an alpha-beta filter on each
+                                axis and predicts the bearing forward to any time, so the motor setpoints can follow
+                                the target continuously between pictures and lead it by the time the motors take to
+                                respond.
+
+    @date                       October 18, 2026
+"""
+
+import utime
+
+
+class AxisFilter:
+    """!
+        @brief                  An alpha-beta filter for one angle
+        @details                Keeps an angle and its rate as of the last sighting. A new sighting is compared with
+                                the prediction for its time; a fraction @c alpha of the difference corrects the
+                                angle and a fraction @c beta, spread over the time since the last sighting, corrects
+                                the rate.
+    """
+    __slots__ = ('alpha', 'beta', 'max_rate', 'angle', 'rate')
+
+    def __init__(self, alpha, beta, max_rate):
+        """!
+            @brief              Constructs a filter
+            @param  alpha       The weight given to a new angle over the prediction
+            @param  beta        The weight given to a new angle in correcting the rate
+            @param  max_rate    The largest rate, in degrees per second, that the filter will believe
+        """
+        self.alpha = alpha
+        self.beta = beta
+        self.max_rate = max_rate
+        self.angle = 0.0
+        self.rate = 0.0
+
+    def reset(self, angle):
+        """!
+            @brief              Starts again from one sighting, assumed to be standing still
+            @param  angle       The angle seen, in degrees
+        """
+        self.angle = angle
+        self.rate = 0.0
+
+    def correct(self, angle, dt):
+        """!
+            @brief              Takes in a new sighting
+            @param  angle       The angle seen, in degrees
+            @param  dt          The time since the last sighting, in seconds
+        """
+        predicted = self.angle + self.rate * dt
+        residual = angle - predicted
+        self.angle = predicted + self.alpha * residual
+        if dt > 0:
+            rate = self.rate + self.beta * residual / dt
+            max_rate = self.max_rate
+            self.rate = -max_rate if rate < -max_rate else max_rate if rate > max_rate else rate
+
+    def predict(self, dt):
+        """!
+            @brief              Predicts the angle some time after the last sighting
+            @param  dt          The time since the last sighting, in seconds
+            @return             The predicted angle in degrees
+        """
+        return self.angle + self.rate * dt
+
+
+class TargetEstimator:
+    """!
+        @brief                  Combines timestamped sightings of the target into a bearing and rate
+        @details                Sightings of a different target than before, as told by the id given with each one,
+                                start the estimate afresh. Predictions are only carried forward for @c horizon_ms
+                                past the last sighting, so a target which is lost isn't chased off into the distance.
+    """
+
+    def __init__(self, alpha=0.5, beta=0.2, max_rate=60.0, horizon_ms=2000):
+        """!
+            @brief              Constructs an estimator with no target
+            @param  alpha       The weight given to a new bearing over the prediction
+            @param  beta        The weight given to a new bearing in correcting the rate
+            @param  max_rate    The largest rate, in degrees per second, that the estimator will believe
+            @param  horizon_ms  How long after the last sighting the rate is still used in predictions
+        """
+        self.horizon_ms = horizon_ms
+        self.az = AxisFilter(alpha, beta, max_rate)
+        self.el = AxisFilter(alpha, beta, max_rate)
+        ## The id of the target being estimated, or @c None before the first sighting
+        self.target_id = None
+        ## When the target was last seen, from utime.ticks_ms()
+        self.seen_ms = 0
+
+    @property
+    def valid(self):
+        """!
+            @brief              Whether the target has been seen yet
+        """
+        return self.target_id is not None
+
+    def update(self, target_id, az, el, seen_ms):
+        """!
+            @brief              Takes in a sighting of the target
+            @param  target_id   Which target was seen; a change starts the estimate afresh
+            @param  az          The azimuth (turret yaw) of the target in degrees
+            @param  el          The elevation (turret pitch) of the target in degrees
+            @param  seen_ms     When the image was taken, from utime.ticks_ms()
+        """
+        if target_id != self.target_id or not target_id:
+            # a new target, or only the hottest spot with nothing to follow
+            self.az.reset(az)
+            self.el.reset(el)
+        else:
+            dt = utime.ticks_diff(seen_ms, self.seen_ms) / 1000
+            self.az.correct(az, dt)
+            self.el.correct(el, dt)
+        self.target_id = target_id
+        self.seen_ms = seen_ms
+
+    def predict(self, when_ms=None):
+        """!
+            @brief              Predicts the target's bearing
+            @param  when_ms     The time to predict for, from utime.ticks_ms(), usually a little in the future to
+                                allow for the motors' response; now if not given
+            @return             A tuple of the azimuth and elevation in degrees and their rates in degrees per
+                                second
+        """
+        if when_ms is None:
+            when_ms = utime.ticks_ms()
+        dt_ms = utime.ticks_diff(when_ms, self.seen_ms)
+        if dt_ms > self.horizon_ms:
+            dt_ms = self.horizon_ms
+        dt = dt_ms / 1000
+        return (self.az.predict(dt), self.el.predict(dt),
+                self.az.rate, self.el.rate)
@@ -3,6 +3,14 @@
 This file contains classes which allow tasks to share data without the risk
 of data corruption by interrupts. 
 
+The classes @c Queue and @c Share protect their data by disabling interrupts
+while it is being moved. The classes @c SPSCQueue and @c SeqShare do without
+that, so they never delay an interrupt: each has only one writer and one
+reader (each of which may be a task or an interrupt service routine), and
+they are arranged so that neither side can see the other's work half done.
+A @c StructShare holds a record of several named fields, double buffered so
+that readers always get all the fields from the same moment.
+
 @author JR Ridgely
 @date   2017-Jan-01 JRR Approximate date of creation of file
 @date   2021-Dec-18 JRR Docstrings changed to work without DoxyPyPy
@@ -25,6 +33,7 @@ SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 import array
 import gc
 import pyb
+import utime
 import micropython
 
 
@@ -450,3 +459,527 @@ class Share (BaseShare):
                 type_code_strings[self._type_code]))
 
 
+# ============================================================================
+
+class SPSCQueue (BaseShare):
+    """!
+    A queue for one producer and one consumer which never disables interrupts.
+
+    The producer only ever changes the write index and the consumer only the
+    read index, and each index is changed only after the data it covers has
+    been written or read, so the producer and consumer can interrupt each other
+    at any point without corrupting the queue. One slot is left empty, so
+    that a full queue can be told from an empty one by the indices alone. This
+    makes the queue safe to fill from an interrupt service routine and empty
+    from a task, or the other way round, but not to be put into or read from
+    by more than one of either.
+
+    Rather than waiting forever when the queue is full or empty, as
+    @c Queue.put() and @c Queue.get() do, @c try_put() and @c try_get() give up
+    at once or after a timeout:
+
+    @code
+    import task_share
+
+    # Filled by an interrupt, emptied by a task
+    my_queue = task_share.SPSCQueue ('l', 32, name="Samples")
+
+    # In the interrupt service routine
+    my_queue.try_put (some_data)
+
+    # In the task, take whatever has arrived
+    while my_queue.any ():
+        something = my_queue.try_get ()
+    @endcode
+    """
+    ## A counter used to give serial numbers to queues for diagnostic use.
+    ser_num = 0
+
+    def __init__ (self, type_code, size, name = None):
+        """!
+        Initialize a queue object to carry and buffer data between a producer
+        and a consumer.
+
+        @param type_code The type of data items which the queue can hold, as
+               for @c Queue
+        @param size The maximum number of items which the queue can hold
+        @param name A short name for the queue, default @c SPSCQueueN where
+               @c N is a serial number for the queue
+        """
+        # First call the parent class initializer
+        super ().__init__ (type_code, False, name)
+
+        self._size = size
+        self._name = str (name) if name != None \
+            else 'SPSCQueue' + str (SPSCQueue.ser_num)
+        SPSCQueue.ser_num += 1
+
+        # Allocate memory in which the queue's data will be stored, with the
+        # one slot which is always left empty
+        self._buffer = array.array (type_code, range (size + 1))
+
+        # Initialize pointers to be used for reading and writing data
+        self.clear ()
+
+        # Since we may have allocated a bunch of memory, call the garbage
+        # collector to neaten up what memory is left for future use
+        gc.collect ()
+
+
+    @micropython.native
+    def try_put (self, item, timeout_us = 0):
+        """!
+        Put an item into the queue if there's room for it.
+
+        If the queue is full, this method waits up to @c timeout_us
+        microseconds for the consumer to make room. An interrupt service
+        routine must not wait, so it should leave @c timeout_us at 0.
+        @param item The item to be placed into the queue
+        @param timeout_us How long to wait for room, in microseconds
+        @return @c True if the item was put in, @c False if there was no room
+        """
+        wr_idx = self._wr_idx
+        next_idx = wr_idx + 1
+        if next_idx > self._size:
+            next_idx = 0
+
+        # Wait (if allowed) until there's room in the buffer for the data
+        if next_idx == self._rd_idx:
+            if timeout_us <= 0:
+                return False
+            start = utime.ticks_us ()
+            while next_idx == self._rd_idx:
+                if utime.ticks_diff (utime.ticks_us (), start) >= timeout_us:
+                    return False
+
+        # Write the data, and only then let the consumer see it
+        self._buffer[wr_idx] = item
+        self._wr_idx = next_idx
+
+        # Record maximum fillage
+        num_items = self.num_in ()
+        if num_items > self._max_full:
+            self._max_full = num_items
+        return True
+
+
+    @micropython.native
+    def try_get (self, timeout_us = 0, default = None):
+        """!
+        Read an item from the queue if there's one there.
+
+        If the queue is empty, this method waits up to @c timeout_us
+        microseconds for the producer to put something in. An interrupt
+        service routine should leave @c timeout_us at 0.
+        @param timeout_us How long to wait for an item, in microseconds
+        @param default What to return if the queue stays empty
+        @return The item read from the queue, or @c default
+        """
+        rd_idx = self._rd_idx
+
+        # Wait (if allowed) until there's something in the queue
+        if rd_idx == self._wr_idx:
+            if timeout_us <= 0:
+                return default
+            start = utime.ticks_us ()
+            while rd_idx == self._wr_idx:
+                if utime.ticks_diff (utime.ticks_us (), start) >= timeout_us:
+                    return default
+
+        # Read the item, and only then give its slot back to the producer
+        to_return = self._buffer[rd_idx]
+        rd_idx += 1
+        if rd_idx > self._size:
+            rd_idx = 0
+        self._rd_idx = rd_idx
+        return (to_return)
+
+
+    def put (self, item, in_ISR = False):
+        """!
+        Put an item into the queue, waiting until there's room for it.
+
+        From an interrupt service routine this doesn't wait; the item is
+        dropped if the queue is full.
+        @param item The item to be placed into the queue
+        @param in_ISR Set this to @c True if calling from within an ISR
+        """
+        if in_ISR:
+            self.try_put (item)
+        else:
+            while not self.try_put (item):
+                pass
+
+
+    def get (self, in_ISR = False):
+        """!
+        Read an item from the queue, waiting until there's one there.
+
+        From an interrupt service routine this doesn't wait; @c None is
+        returned if the queue is empty.
+        @param in_ISR Set this to @c True if calling from within an ISR
+        @return The item read from the queue
+        """
+        if in_ISR:
+            return self.try_get ()
+        while self.empty ():
+            pass
+        return self.try_get ()
+
+
+    @micropython.native
+    def any (self):
+        """!
+        Check if there are any items in the queue.
+        @return @c True if items are in the queue, @c False if not
+        """
+        return (self._rd_idx != self._wr_idx)
+
+
+    @micropython.native
+    def empty (self):
+        """!
+        Check if the queue is empty.
+        @return @c True if queue is empty, @c False if it's not empty
+        """
+        return (self._rd_idx == self._wr_idx)
+
+
+    @micropython.native
+    def full (self):
+        """!
+        Check if the queue is full.
+        @return @c True if the queue is full
+        """
+        next_idx = self._wr_idx + 1
+        if next_idx > self._size:
+            next_idx = 0
+        return (next_idx == self._rd_idx)
+
+
+    @micropython.native
+    def num_in (self):
+        """!
+        Check how many items are in the queue. If the producer or consumer
+        interrupts this, the count may be out by the one item being moved.
+        @return The number of items in the queue
+        """
+        num_items = self._wr_idx - self._rd_idx
+        if num_items < 0:
+            num_items += self._size + 1
+        return (num_items)
+
+
+    def clear (self):
+        """!
+        Remove all contents from the queue. This must not be done while the
+        producer or consumer might be using the queue.
+        """
+        self._rd_idx = 0
+        self._wr_idx = 0
+        self._max_full = 0
+
+
+    def __repr__ (self):
+        """!
+        This method puts diagnostic information about the queue into a string.
+        """
+        return ('{:<12s} SPSCQueue<{:s}> Max Full {:d}/{:d}'.format (
+                self._name, type_code_strings[self._type_code],
+                self._max_full, self._size))
+
+
+# ============================================================================
+
+class SeqShare (BaseShare):
+    """!
+    A share of several items, read and written together without disabling
+    interrupts.
+
+    The share has one writer, which may be a task or an interrupt service
+    routine. A sequence number is made odd while the writer is changing the
+    data and even again when it's done, and a reader checks that the number
+    was even and didn't change while it copied the data out. A reader which
+    is interrupted by the writer therefore finds out and tries again, and one
+    which runs in the middle of a write, as an interrupt service routine
+    interrupting a writing task does, sees the odd number and doesn't use
+    the data. So that the items stay together, such as a position and the
+    time it was measured, they are always put and read as a group:
+
+    @code
+    import task_share
+
+    # A position and speed, written by an interrupt
+    my_share = task_share.SeqShare ('l', 2, name="Axis")
+
+    # In the interrupt service routine
+    my_share.put ((position, speed))
+
+    # In a task, with a list made once to read into
+    reading = [0, 0]
+    my_share.get (reading)
+    @endcode
+    """
+    ## A counter used to give serial numbers to shares for diagnostic use.
+    ser_num = 0
+
+    def __init__ (self, type_code, count = 1, name = None):
+        """!
+        Create a shared group of data items.
+
+        @param type_code The type of the data items, as for @c Share
+        @param count How many items are shared together
+        @param name A short name for the share, default @c SeqShareN where
+               @c N is a serial number for the share
+        """
+        # First call the parent class initializer
+        super ().__init__ (type_code, False, name)
+
+        self._count = count
+        self._buffer = array.array (type_code, [0] * count)
+
+        # Even when the data is whole, odd while it's being written. It's
+        # kept below MicroPython's small integer limit, so that an interrupt
+        # service routine which writes the share doesn't allocate memory
+        self._seq = 0
+
+        ## How many times a reader has found the data being written, for
+        #  diagnostic use
+        self.retries = 0
+
+        self._name = str (name) if name != None \
+            else 'SeqShare' + str (SeqShare.ser_num)
+        SeqShare.ser_num += 1
+
+
+    @micropython.native
+    def put (self, data, in_ISR = False):
+        """!
+        Write a group of items into the share, overwriting the old ones.
+        @param data A sequence of as many items as the share holds
+        @param in_ISR Accepted so that this can be used in place of a
+               @c Share; it makes no difference
+        """
+        buffer = self._buffer
+        self._seq = (self._seq + 1) & 0x3FFFFFFF
+        for idx in range (self._count):
+            buffer[idx] = data[idx]
+        self._seq = (self._seq + 1) & 0x3FFFFFFF
+
+
+    @micropython.native
+    def try_get (self, into = None, timeout_us = 0):
+        """!
+        Read the group of items from the share, if they aren't being written.
+
+        If the writer is changing the data, this method tries again for up to
+        @c timeout_us microseconds. An interrupt service routine must leave
+        @c timeout_us at 0, as the writer can't finish while it waits.
+        @param into A list or array to copy the items into, which keeps this
+               method from allocating memory; if @c None, a new list is made
+        @param timeout_us How long to keep trying, in microseconds
+        @return @c into holding the items, or @c None if they couldn't be
+                read whole in time
+        """
+        if into is None:
+            into = [0] * self._count
+        buffer = self._buffer
+        start = None
+        while True:
+            seq = self._seq
+            if not seq & 1:
+                for idx in range (self._count):
+                    into[idx] = buffer[idx]
+                if self._seq == seq:
+                    return into
+
+            # The writer got in the way; try again if there's time
+            self.retries += 1
+            if timeout_us <= 0:
+                return None
+            if start is None:
+                start = utime.ticks_us ()
+            elif utime.ticks_diff (utime.ticks_us (), start) >= timeout_us:
+                return None
+
+
+    def get (self, into = None, in_ISR = False):
+        """!
+        Read the group of items from the share, trying until they're read
+        whole.
+
+        A task always succeeds at once, or after one retry if an interrupt
+        service routine writing the share interrupted it. From an interrupt
+        service routine this doesn't retry; @c None is returned if the writer
+        was interrupted in the middle of writing.
+        @param into A list or array to copy the items into, or @c None for a
+               new list
+        @param in_ISR Set this to @c True if calling from within an ISR
+        @return @c into holding the items
+        """
+        if in_ISR:
+            return self.try_get (into)
+        while True:
+            to_return = self.try_get (into)
+            if to_return is not None:
+                return to_return
+
+
+    def __repr__ (self):
+        """!
+        Puts diagnostic information about the share into a string.
+        """
+        return ("{:<12s} SeqShare<{:s}[{:d}]> Retries {:d}".format (
+                self._name, type_code_strings[self._type_code], self._count,
+                self.retries))
+
+
+# ============================================================================
+
+class StructShare (BaseShare):
+    """!
+    A record of named fields shared between tasks, read and written as a
+    whole without disabling interrupts or allocating memory.
+
+    The fields are kept in two arrays, one holding the version of the record
+    which readers see and the other being filled in by the writer, and a
+    version number says which is which. The writer fills in the spare array
+    and then publishes it by bumping the version number, so a reader never
+    sees a record half written. A reader copies the published array into a
+    buffer of its own and then checks that the version hasn't moved on while
+    it did; if it has, the writer may have started on the array being copied,
+    so the reader copies again. A reader in an interrupt service routine can
+    never be overtaken by a writing task, so it always succeeds at once.
+
+    Writers must not interrupt one another. Any number of tasks may write the
+    record, since a cooperative task can't be interrupted by another, as may
+    a single interrupt service routine when no task writes it. Fields are
+    found by their positions in the list of names, which are best kept as
+    constants by the code using the share:
+
+    @code
+    import task_share
+
+    POS, VEL = range (2)
+    my_share = task_share.StructShare (('pos', 'vel'), name="Axis")
+
+    # In one task, change fields together
+    mine = array.array ('f', [0, 0])
+    my_share.get_all (mine)
+    mine[POS] = position
+    mine[VEL] = velocity
+    my_share.put_all (mine)
+
+    # In another task, read a consistent snapshot
+    view = array.array ('f', [0, 0])
+    my_share.get_all (view)
+    @endcode
+    """
+    ## A counter used to give serial numbers to shares for diagnostic use.
+    ser_num = 0
+
+    def __init__ (self, fields, type_code = 'f', name = None):
+        """!
+        Create a shared record.
+
+        @param fields A sequence of the names of the fields
+        @param type_code The type of all the fields, as for @c Share
+        @param name A short name for the share, default @c StructShareN where
+               @c N is a serial number for the share
+        """
+        # First call the parent class initializer
+        super ().__init__ (type_code, False, name)
+
+        ## The names of the fields, in order
+        self.fields = tuple (fields)
+        self._count = len (self.fields)
+        self._buffers = (array.array (type_code, [0] * self._count),
+                         array.array (type_code, [0] * self._count))
+
+        # Bumped each time a record is published; the published record is in
+        # the buffer given by its lowest bit. It's kept below MicroPython's
+        # small integer limit so that writing doesn't allocate memory
+        self._version = 0
+
+        ## How many times a reader has had to copy the record again, for
+        #  diagnostic use
+        self.retries = 0
+
+        self._name = str (name) if name != None \
+            else 'StructShare' + str (StructShare.ser_num)
+        StructShare.ser_num += 1
+
+
+    def index (self, field):
+        """!
+        Find the position of a field in the record.
+        @param field The name of the field
+        @return The field's index, for use with @c get() and @c put()
+        """
+        return self.fields.index (field)
+
+
+    @micropython.native
+    def put_all (self, data):
+        """!
+        Write every field of the record at once.
+        @param data A sequence holding a value for each field, in order
+        """
+        version = self._version
+        spare = self._buffers[(version + 1) & 1]
+        for idx in range (self._count):
+            spare[idx] = data[idx]
+        self._version = (version + 1) & 0x3FFFFFFF
+
+
+    @micropython.native
+    def put (self, field, value):
+        """!
+        Write one field of the record, leaving the others as they are.
+        @param field The index of the field
+        @param value The field's new value
+        """
+        version = self._version
+        current = self._buffers[version & 1]
+        spare = self._buffers[(version + 1) & 1]
+        for idx in range (self._count):
+            spare[idx] = current[idx]
+        spare[field] = value
+        self._version = (version + 1) & 0x3FFFFFFF
+
+
+    @micropython.native
+    def get_all (self, into):
+        """!
+        Read a consistent snapshot of every field of the record.
+        @param into An array or list with room for every field, which this
+               method fills in
+        @return @c into
+        """
+        while True:
+            version = self._version
+            current = self._buffers[version & 1]
+            for idx in range (self._count):
+                into[idx] = current[idx]
+            if self._version == version:
+                return into
+            self.retries += 1
+
+
+    @micropython.native
+    def get (self, field):
+        """!
+        Read one field of the record.
+        @param field The index of the field
+        @return The field's value
+        """
+        return self._buffers[self._version & 1][field]
+
+
+    def __repr__ (self):
+        """!
+        Puts diagnostic information about the share into a string.
+        """
+        return ("{:<12s} StructShare<{:s}[{:d}]> Retries {:d}".format (
+                self._name, type_code_strings[self._type_code], self._count,
+                self.retries))
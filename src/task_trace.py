@@ -0,0 +1,132 @@
+"""!
+    @file                       task_trace.py
+    @brief                      An always-on record of the scheduler's recent task runs, and a way to save it
+    @details                    A @c TraceRing keeps the last few hundred runs of the scheduled tasks: when each run
+                                started, which task it was, the state the task yielded and how long it took. Its
+                                arrays are allocated once and each run only overwrites the oldest entry, so the ring
+                                can be left on while the turret is in use. Together with the run time and lateness
+                                histograms which every @c cotask.Task keeps, the ring can be dumped in a compact binary
+                                form to a file on the board's flash or over the USB serial port, and read on a PC with
+                                @c sim/trace.py.
+
+                                The dump is little-endian. It starts with a header, @c '<4sHHHHI': the magic bytes
+                                @c CTRC, the format version, the number of tasks, histogram buckets and records, and
+                                the time of the dump from @c utime.ticks_us(). Each task follows, as @c '<HBlHHH' (id,
+                                priority, period in microseconds or -1, misses, overruns and the length of its name),
+                                its name in UTF-8 and its run time and lateness histograms, each as that many
+                                @c '<I' bucket counts. Bucket @c n of a histogram counts values from 2 to the @c n up
+                                to twice that, in microseconds, with bucket 0 taking everything below 2 and the last
+                                bucket everything above. Then come the records, oldest first, each as @c '<IHhI':
+                                start time, task id, state and run time.
+
+    @date                       October 18, 2026
+"""
+
+import struct
+import micropython
+from array import array
+import utime
+
+## The format version written in each dump's header
+VERSION = micropython.const(2)
+
+## The layout of a dump's header
+HEADER = '<4sHHHHI'
+## The layout of each task's entry in a dump, before its name and histograms
+TASK = '<HBlHHH'
+## The layout of each run record in a dump
+RECORD = '<IHhI'
+
+
+class TraceRing:
+    """!
+        @brief                  A fixed-size ring of task run records
+        @details                Records are kept in four parallel arrays, one entry per run, and the oldest is
+                                overwritten when the ring is full. The tasks are told apart by the ids the task list
+                                gives them as they are appended.
+    """
+
+    def __init__(self, size=256):
+        """!
+            @brief              Allocates the ring
+            @param  size        The number of runs kept
+        """
+        self.size = size
+        ## When each run started, from utime.ticks_us()
+        self.times = array('l', [0] * size)
+        ## The id of the task which ran
+        self.ids = array('H', [0] * size)
+        ## The state the task yielded, or -1 if it wasn't a small integer
+        self.states = array('h', [0] * size)
+        ## How long each run took, in microseconds
+        self.durations = array('l', [0] * size)
+        ## Where the next record goes
+        self.head = 0
+        ## How many records have been made, up to @c size
+        self.count = 0
+
+    @micropython.native
+    def record(self, start, task_id, state, duration):
+        """!
+            @brief              Records one run of a task, overwriting the oldest record if the ring is full
+            @param  start       When the run started, from utime.ticks_us()
+            @param  task_id     The task's id
+            @param  state       The state the task yielded
+            @param  duration    How long the run took, in microseconds
+        """
+        head = self.head
+        self.times[head] = start
+        self.ids[head] = task_id
+        self.states[head] = state if type(state) is int and -32768 <= state < 32768 else -1
+        self.durations[head] = duration
+        head += 1
+        self.head = head if head < self.size else 0
+        if self.count < self.size:
+            self.count += 1
+
+    def clear(self):
+        """!
+            @brief              Forgets all the records
+        """
+        self.head = 0
+        self.count = 0
+
+    def dump(self, stream, task_list):
+        """!
+            @brief              Writes the records and the tasks' histograms to a stream
+            @details            The stream may be a file opened for writing in binary, such as
+                                @c open('trace.bin', 'wb'), or the USB serial port, @c pyb.USB_VCP(). Nothing is
+                                recorded while the dump is being written, as long as the scheduler isn't run from an
+                                interrupt.
+            @param  stream      Anything with a @c write() method which takes bytes
+            @param  task_list   The @c cotask.TaskList whose tasks are to be described
+        """
+        tasks = [task for pri in task_list.pri_list for task in pri[2:]]
+        buckets = len(tasks[0].run_hist) if tasks else 0
+        stream.write(struct.pack(HEADER, b'CTRC', VERSION, len(tasks), buckets, self.count,
+                                 utime.ticks_us()))
+        for task in tasks:
+            name = task.name.encode()
+            stream.write(struct.pack(TASK, task.id, task.priority & 0xFF,
+                                     -1 if task.period is None else task.period,
+                                     min(task.misses, 0xFFFF), min(task.overruns, 0xFFFF), len(name)))
+            stream.write(name)
+            for hist in (task.run_hist, task.late_hist):
+                for bucket in hist:
+                    stream.write(struct.pack('<I', bucket))
+        pos = (self.head - self.count) % self.size
+        for _ in range(self.count):
+            stream.write(struct.pack(RECORD, self.times[pos], self.ids[pos], self.states[pos],
+                                     self.durations[pos]))
+            pos += 1
+            if pos == self.size:
+                pos = 0
+
+    def save(self, task_list, path='trace.bin'):
+        """!
+            @brief              Writes a dump to a file, usually on the board's flash
+            @param  task_list   The @c cotask.TaskList whose tasks are to be described
+            @param  path        The name of the file
+        """
+        with open(path, 'wb') as stream:
+            self.dump(stream, task_list)
@@ -0,0 +1,350 @@
+"""!
+    @file                       tracker.py
+    @brief                      Finds warm objects in thermal images and follows them from frame to frame
+    @details                    A @c BlobDetector groups the pixels of an image which are warmer than a threshold
+                                into connected blobs, using union-find over label arrays which are allocated once.
+                                A @c Tracker then matches the blobs in each new image with the objects it has been
+                                following, smoothing their bearings and estimating how fast they move. Both keep
+                                their working data in fixed-size tables, so the time and memory used per image are
+                                bounded no matter what the camera sees.
+
+    @date                       October 18, 2026
+"""
+
+import micropython
+import utime
+from array import array
+
+
+class Blob:
+    """!
+        @brief                  One group of connected warm pixels
+        @details                @c row and @c col are the heat-weighted centre of the blob in pixels, @c area is the
+                                number of pixels in it and @c heat the sum of how far they are above the threshold.
+                                @c az and @c el are the blob's bearing in degrees, filled in by whoever converts
+                                pixels to angles before the blob is given to a @c Tracker.
+    """
+    __slots__ = ('row', 'col', 'area', 'heat', 'peak_idx', 'az', 'el')
+
+    def __init__(self):
+        self.row = 0.0
+        self.col = 0.0
+        self.area = 0
+        self.heat = 0.0
+        self.peak_idx = 0
+        self.az = 0.0
+        self.el = 0.0
+
+
+class BlobDetector:
+    """!
+        @brief                  Connected-component labelling of the warm parts of an image
+    """
+
+    def __init__(self, width=32, height=24, max_labels=64, max_blobs=8, min_area=2):
+        """!
+            @brief              Allocates the label buffers
+            @param  width       The width of the images in pixels
+            @param  height      The height of the images in pixels
+            @param  max_labels  The most provisional labels used for one image; warm pixels which would need more
+                                are left out, which bounds the memory and time used on a noisy image
+            @param  max_blobs   The most blobs reported for one image; the ones with the most heat are kept
+            @param  min_area    The fewest pixels a blob may have, so that single noisy pixels are ignored
+        """
+        self.width = width
+        self.height = height
+        self.min_area = min_area
+        ## The label of each pixel, 0 for pixels below the threshold
+        self.labels = array('H', bytes(2 * width * height))
+        # union-find parents and per-label sums, indexed by label
+        self._parent = array('H', bytes(2 * (max_labels + 1)))
+        self._area = array('H', bytes(2 * (max_labels + 1)))
+        self._heat = array('f', bytes(4 * (max_labels + 1)))
+        self._row_sum = array('f', bytes(4 * (max_labels + 1)))
+        self._col_sum = array('f', bytes(4 * (max_labels + 1)))
+        self._peak = array('H', bytes(2 * (max_labels + 1)))
+        ## The blobs found in the last image, hottest first; only the first @c count are valid
+        self.blobs = [Blob() for _ in range(max_blobs)]
+        ## How many of @c blobs were found in the last image
+        self.count = 0
+
+    def _find(self, label):
+        # root of a label's set, halving the path on the way up
+        parent = self._parent
+        while parent[label] != label:
+            parent[label] = parent[parent[label]]
+            label = parent[label]
+        return label
+
+    @micropython.native
+    def detect(self, data, level):
+        """!
+            @brief              Finds the blobs in one image
+            @details            Pixels are joined to their neighbours to the left and above when both are warmer than
+                                @c level. The first pass gives each pixel a provisional label and records which labels
+                                touch; the second adds each pixel to the sums of its label's root.
+            @param  data        The flat array of pixel values, row by row
+            @param  level       The threshold a pixel must be above to be part of a blob
+            @return             The number of blobs found, which are in @c blobs
+        """
+        width = self.width
+        labels = self.labels
+        parent = self._parent
+        n_labels = len(parent)
+        next_label = 1
+
+        # first pass: provisional labels
+        col = 0
+        for idx in range(len(data)):
+            label = 0
+            if data[idx] > level:
+                left = labels[idx - 1] if col else 0
+                up = labels[idx - width] if idx >= width else 0
+                if left and up:
+                    left = self._find(left)
+                    up = self._find(up)
+                    if left < up:
+                        parent[up] = left
+                        label = left
+                    else:
+                        parent[left] = up
+                        label = up
+                elif left or up:
+                    label = left or up
+                elif next_label < n_labels:
+                    label = next_label
+                    parent[label] = label
+                    next_label += 1
+            labels[idx] = label
+            col += 1
+            if col == width:
+                col = 0
+
+        # second pass: sums for each root label
+        area = self._area
+        heat = self._heat
+        row_sum = self._row_sum
+        col_sum = self._col_sum
+        peak = self._peak
+        for label in range(1, next_label):
+            area[label] = 0
+            heat[label] = 0.0
+            row_sum[label] = 0.0
+            col_sum[label] = 0.0
+        row = col = 0
+        for idx in range(len(data)):
+            label = labels[idx]
+            if label:
+                label = self._find(label)
+                labels[idx] = label
+                weight = data[idx] - level
+                if area[label] == 0 or data[idx] > data[peak[label]]:
+                    peak[label] = idx
+                area[label] += 1
+                heat[label] += weight
+                row_sum[label] += weight * row
+                col_sum[label] += weight * col
+            col += 1
+            if col == width:
+                col = 0
+                row += 1
+
+        # keep the hottest blobs, in order
+        blobs = self.blobs
+        count = 0
+        for label in range(1, next_label):
+            if parent[label] != label or area[label] < self.min_area:
+                continue
+            total = heat[label]
+            if count == len(blobs) and blobs[-1].heat >= total:
+                continue
+            # insertion sort, reusing the object of the coolest blob
+            pos = count if count < len(blobs) else len(blobs) - 1
+            spare = blobs[pos]
+            while pos > 0 and blobs[pos - 1].heat < total:
+                blobs[pos] = blobs[pos - 1]
+                pos -= 1
+            blobs[pos] = spare
+            spare.row = row_sum[label] / total
+            spare.col = col_sum[label] / total
+            spare.area = area[label]
+            spare.heat = total
+            spare.peak_idx = peak[label]
+            if count < len(blobs):
+                count += 1
+        self.count = count
+        return count
+
+
+class Track:
+    """!
+        @brief                  One object being followed by a @c Tracker
+        @details                @c az and @c el are the smoothed bearing in degrees and @c az_rate and @c el_rate its
+                                rate of change in degrees per second. @c hits counts the images the object was found
+                                in and @c misses the images since it was last found. @c seen_az and @c seen_el are
+                                the bearing of the blob it was last matched with, before smoothing.
+    """
+    __slots__ = ('id', 'active', 'az', 'el', 'az_rate', 'el_rate', 'seen_az', 'seen_el',
+                 'area', 'heat', 'hits', 'misses', 'last_ms')
+
+    def __init__(self):
+        self.id = 0
+        self.active = False
+        self.az = 0.0
+        self.el = 0.0
+        self.az_rate = 0.0
+        self.el_rate = 0.0
+        self.seen_az = 0.0
+        self.seen_el = 0.0
+        self.area = 0
+        self.heat = 0.0
+        self.hits = 0
+        self.misses = 0
+        self.last_ms = 0
+
+    def score(self):
+        """!
+            @brief              Rates how likely the track is to be a person worth aiming at
+            @details            Bigger blobs which have been seen for several images in a row win, so a small hot
+                                lamp or mug loses to a person-sized warm area, and a new track takes a few images to
+                                take over from an established one.
+        """
+        if not self.active or self.misses:
+            return 0
+        return self.area * min(self.hits, 4)
+
+
+class Tracker:
+    """!
+        @brief                  Follows blobs from one image to the next
+        @details                Each track predicts where its object should be from its last bearing and rate. The
+                                blobs in a new image are matched to the nearest prediction within a gate, hottest blob
+                                first; matched tracks are corrected with an alpha-beta filter, unmatched blobs start new
+                                tracks and tracks which go unmatched for too long are dropped.
+    """
+
+    def __init__(self, max_tracks=6, gate=5.0, alpha=0.6, beta=0.3, max_misses=3):
+        """!
+            @brief              Allocates the track table
+            @param  max_tracks  The most objects followed at once
+            @param  gate        The furthest, in degrees, a blob may be from a track's prediction to be matched with it
+            @param  alpha       The weight given to a new bearing over the prediction
+            @param  beta        The weight given to a new bearing in correcting the rate
+            @param  max_misses  The number of images in a row a track may go unmatched before it is dropped
+        """
+        self.gate = gate
+        self.alpha = alpha
+        self.beta = beta
+        self.max_misses = max_misses
+        ## The table of tracks, active or free
+        self.tracks = [Track() for _ in range(max_tracks)]
+        self._matched = bytearray(max_tracks)
+        self._next_id = 1
+
+    def update(self, blobs, count, now_ms=None):
+        """!
+            @brief              Matches the blobs from a new image with the tracks
+            @param  blobs       A sequence of @c Blob objects whose @c az and @c el have been filled in, hottest first
+            @param  count       How many of the blobs to use
+            @param  now_ms      The time the image was taken, from @c utime.ticks_ms(); now if not given
+            @return             The best track, or @c None if nothing is being tracked
+        """
+        if now_ms is None:
+            now_ms = utime.ticks_ms()
+        tracks = self.tracks
+        matched = self._matched
+        gate_2 = self.gate * self.gate
+        for pos in range(len(tracks)):
+            matched[pos] = 0
+
+        for b_idx in range(count):
+            blob = blobs[b_idx]
+            best_pos = -1
+            best_d2 = gate_2
+            for pos in range(len(tracks)):
+                track = tracks[pos]
+                if not track.active or matched[pos]:
+                    continue
+                dt = utime.ticks_diff(now_ms, track.last_ms) / 1000
+                d_az = blob.az - (track.az + track.az_rate * dt)
+                d_el = blob.el - (track.el + track.el_rate * dt)
+                d2 = d_az * d_az + d_el * d_el
+                if d2 <= best_d2:
+                    best_pos = pos
+                    best_d2 = d2
+            if best_pos >= 0:
+                self._correct(tracks[best_pos], blob, now_ms)
+                matched[best_pos] = 1
+            else:
+                best_pos = self._start(blob, now_ms)
+                if best_pos >= 0:
+                    matched[best_pos] = 1
+
+        for pos in range(len(tracks)):
+            track = tracks[pos]
+            if track.active and not matched[pos]:
+                track.misses += 1
+                if track.misses > self.max_misses:
+                    track.active = False
+        return self.best()
+
+    def best(self):
+        """!
+            @brief              Picks the track most worth aiming at
+            @return             The track with the highest score, or @c None if no track was matched in the last image
+        """
+        best = None
+        best_score = 0
+        for track in self.tracks:
+            score = track.score()
+            if score > best_score:
+                best = track
+                best_score = score
+        return best
+
+    def _correct(self, track, blob, now_ms):
+        # alpha-beta update of a track from a matched blob
+        dt = utime.ticks_diff(now_ms, track.last_ms) / 1000
+        pred_az = track.az + track.az_rate * dt
+        pred_el = track.el + track.el_rate * dt
+        res_az = blob.az - pred_az
+        res_el = blob.el - pred_el
+        track.az = pred_az + self.alpha * res_az
+        track.el = pred_el + self.alpha * res_el
+        if dt > 0:
+            track.az_rate += self.beta * res_az / dt
+            track.el_rate += self.beta * res_el / dt
+        track.seen_az = blob.az
+        track.seen_el = blob.el
+        track.area = blob.area
+        track.heat = blob.heat
+        track.hits += 1
+        track.misses = 0
+        track.last_ms = now_ms
+
+    def _start(self, blob, now_ms):
+        # put a new track in a free slot, if there is one
+        tracks = self.tracks
+        slot = -1
+        for pos in range(len(tracks)):
+            if not tracks[pos].active:
+                slot = pos
+                break
+        if slot < 0:
+            return -1
+        track = tracks[slot]
+        track.id = self._next_id
+        self._next_id += 1
+        track.active = True
+        track.az = blob.az
+        track.el = blob.el
+        track.az_rate = 0.0
+        track.el_rate = 0.0
+        track.seen_az = blob.az
+        track.seen_el = blob.el
+        track.area = blob.area
+        track.heat = blob.heat
+        track.hits = 1
+        track.misses = 0
+        track.last_ms = now_ms
+        return slot